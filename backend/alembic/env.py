@@ -1,26 +1,26 @@
 from logging.config import fileConfig
 
-from sqlalchemy import engine_from_config
-from sqlalchemy import pool
+from sqlalchemy import inspect, pool
+from sqlalchemy.engine import make_url
 
 from alembic import context
 
-# Load environment variables
-from dotenv import load_dotenv
-import os
-
-load_dotenv()
+from app.database import DATABASE_URL, make_engine
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 config = context.config
 
-# Override sqlalchemy.url with DATABASE_URL from .env
-config.set_main_option("sqlalchemy.url", os.getenv("DATABASE_URL"))
+# Override sqlalchemy.url with the app's DATABASE_URL (read from .env)
+config.set_main_option("sqlalchemy.url", DATABASE_URL)
+
+# A connection handed over by app.database.migrate(); the app has already
+# configured logging in that case
+connection = config.attributes.get("connection")
 
 # Interpret the config file for Python logging.
 # This line sets up loggers basically.
-if config.config_file_name is not None:
+if config.config_file_name is not None and connection is None:
     fileConfig(config.config_file_name)
 
 # add your model's MetaData object here
@@ -58,6 +58,7 @@ def run_migrations_offline() -> None:
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
+        render_as_batch=make_url(url).get_backend_name() == "sqlite",
     )
 
     with context.begin_transaction():
@@ -71,19 +72,62 @@ def run_migrations_online() -> None:
     and associate a connection with the context.
 
     """
-    connectable = engine_from_config(
-        config.get_section(config.config_ini_section, {}),
-        prefix="sqlalchemy.",
+    if connection is not None:
+        run_migrations_on(connection)
+        return
+
+    connectable = make_engine(
+        config.get_main_option("sqlalchemy.url"),
         poolclass=pool.NullPool,
     )
 
-    with connectable.connect() as connection:
-        context.configure(
-            connection=connection, target_metadata=target_metadata
-        )
+    with connectable.connect() as new_connection:
+        run_migrations_on(new_connection)
+
+
+def _builds_new_database(connection) -> bool:
+    """Whether this upgrades an empty database to the latest revision."""
+    try:
+        destination = context.get_revision_argument()
+    except KeyError:
+        # Commands such as `alembic current` and `alembic check` have none
+        return False
+    heads = set(context.script.get_heads())
+    if isinstance(destination, str):
+        destination = (destination,)
+    return set(destination or ()) == heads and not inspect(connection).get_table_names()
+
+
+def run_migrations_on(connection) -> None:
+    """Run migrations on a connection, in batch mode on SQLite."""
+    sqlite = connection.dialect.name == "sqlite"
+    if sqlite:
+        # Batch mode recreates tables to alter them; dropping the old copy
+        # with foreign keys enforced would cascade into the referencing rows.
+        # The PRAGMA has no effect inside a transaction, hence the commits.
+        connection.exec_driver_sql("PRAGMA foreign_keys=OFF")
+        connection.commit()
 
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        render_as_batch=sqlite,
+    )
+    try:
         with context.begin_transaction():
-            context.run_migrations()
+            if sqlite and _builds_new_database(connection):
+                # The early migrations ALTER columns and constraints in ways
+                # SQLite cannot, so a new SQLite database is created from the
+                # models and stamped as up to date instead of replaying them
+                target_metadata.create_all(connection)
+                context.get_context().stamp(context.script, "heads")
+            else:
+                context.run_migrations()
+        connection.commit()
+    finally:
+        if sqlite:
+            connection.exec_driver_sql("PRAGMA foreign_keys=ON")
+            connection.commit()
 
 
 if context.is_offline_mode():
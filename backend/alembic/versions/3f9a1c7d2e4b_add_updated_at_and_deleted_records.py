@@ -0,0 +1,49 @@
+"""add updated_at columns and deleted_records tombstones
+
+Revision ID: 3f9a1c7d2e4b
+Revises: 7838992d0700
+Create Date: 2026-10-18 10:12:41.503118
+
+"""
+from datetime import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9a1c7d2e4b'
+down_revision: Union[str, Sequence[str], None] = '7838992d0700'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SYNCED_TABLES = ('villages', 'budgets', 'budget_categories', 'expenses')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    now = datetime.utcnow()
+    for table in SYNCED_TABLES:
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), nullable=True))
+        op.execute(sa.text(f'UPDATE {table} SET updated_at = :now').bindparams(now=now))
+        op.create_index(op.f(f'ix_{table}_updated_at'), table, ['updated_at'], unique=False)
+
+    op.create_table('deleted_records',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('entity', sa.String(length=30), nullable=False),
+    sa.Column('entity_id', sa.Integer(), nullable=False),
+    sa.Column('village_id', sa.Integer(), nullable=False),
+    sa.Column('deleted_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_deleted_records_village_deleted_at', 'deleted_records', ['village_id', 'deleted_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_deleted_records_village_deleted_at', table_name='deleted_records')
+    op.drop_table('deleted_records')
+    for table in reversed(SYNCED_TABLES):
+        op.drop_index(op.f(f'ix_{table}_updated_at'), table_name=table)
+        op.drop_column(table, 'updated_at')
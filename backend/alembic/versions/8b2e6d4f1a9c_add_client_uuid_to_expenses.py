@@ -0,0 +1,30 @@
+"""add client_uuid to expenses
+
+Revision ID: 8b2e6d4f1a9c
+Revises: 3f9a1c7d2e4b
+Create Date: 2026-10-18 11:03:27.918264
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b2e6d4f1a9c'
+down_revision: Union[str, Sequence[str], None] = '3f9a1c7d2e4b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('expenses', sa.Column('client_uuid', sa.String(length=36), nullable=True))
+    op.create_index(op.f('ix_expenses_client_uuid'), 'expenses', ['client_uuid'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_expenses_client_uuid'), table_name='expenses')
+    op.drop_column('expenses', 'client_uuid')
@@ -0,0 +1,42 @@
+"""add audit_log
+
+Revision ID: b4d6f8a1c3e5
+Revises: a1c3e5f7b9d2
+Create Date: 2026-10-18 19:35:20.774193
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b4d6f8a1c3e5'
+down_revision: Union[str, Sequence[str], None] = 'a1c3e5f7b9d2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('audit_log',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('ts', sa.DateTime(), nullable=False),
+    sa.Column('actor_id', sa.Integer(), nullable=True),
+    sa.Column('action', sa.String(length=10), nullable=False),
+    sa.Column('entity', sa.String(length=30), nullable=False),
+    sa.Column('entity_id', sa.Integer(), nullable=False),
+    sa.Column('before', sa.Text(), nullable=True),
+    sa.Column('after', sa.Text(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_audit_log_entity_entity_id_ts', 'audit_log', ['entity', 'entity_id', 'ts'], unique=False)
+    op.create_index(op.f('ix_audit_log_ts'), 'audit_log', ['ts'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_audit_log_ts'), table_name='audit_log')
+    op.drop_index('ix_audit_log_entity_entity_id_ts', table_name='audit_log')
+    op.drop_table('audit_log')
@@ -0,0 +1,37 @@
+"""add job lock key
+
+Revision ID: b6d8f0a2c4e7
+Revises: a3c5e7f9b2d4
+Create Date: 2026-10-19 09:48:06.772310
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b6d8f0a2c4e7'
+down_revision: Union[str, Sequence[str], None] = 'a3c5e7f9b2d4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+ACTIVE = sa.text("status IN ('queued', 'running')")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('jobs', sa.Column('lock_key', sa.String(length=50), nullable=True))
+    # Snapshot exports already pending keep running; only new ones take the lock
+    op.create_index(
+        'ix_jobs_active_lock_key', 'jobs', ['lock_key'], unique=True,
+        postgresql_where=ACTIVE, sqlite_where=ACTIVE
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_jobs_active_lock_key', table_name='jobs')
+    with op.batch_alter_table('jobs') as batch_op:
+        batch_op.drop_column('lock_key')
@@ -0,0 +1,40 @@
+"""add paise columns
+
+Revision ID: c7e9b1d3f5a8
+Revises: b4d6f8a1c3e5
+Create Date: 2026-10-18 23:40:12.518406
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7e9b1d3f5a8'
+down_revision: Union[str, Sequence[str], None] = 'b4d6f8a1c3e5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+MONEY_COLUMNS = (
+    ('budgets', 'total_allocated'),
+    ('budget_categories', 'allocated_amount'),
+    ('expenses', 'amount'),
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table, column in MONEY_COLUMNS:
+        op.add_column(table, sa.Column(f'{column}_paise', sa.BigInteger(), nullable=True))
+        op.execute(sa.text(f'UPDATE {table} SET {column}_paise = CAST(ROUND({column} * 100) AS BIGINT)'))
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column(f'{column}_paise', existing_type=sa.BigInteger(), nullable=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table, column in MONEY_COLUMNS:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column(f'{column}_paise')
@@ -0,0 +1,33 @@
+"""add idempotency claimed at
+
+Revision ID: c8e0a2b4d6f9
+Revises: b6d8f0a2c4e7
+Create Date: 2026-10-19 11:02:37.418265
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c8e0a2b4d6f9'
+down_revision: Union[str, Sequence[str], None] = 'b6d8f0a2c4e7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('idempotency_keys', sa.Column('claimed_at', sa.DateTime(), nullable=True))
+    # Existing claims start their lease when the key was created
+    op.execute("UPDATE idempotency_keys SET claimed_at = COALESCE(created_at, CURRENT_TIMESTAMP)")
+    with op.batch_alter_table('idempotency_keys') as batch_op:
+        batch_op.alter_column('claimed_at', existing_type=sa.DateTime(), nullable=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('idempotency_keys') as batch_op:
+        batch_op.drop_column('claimed_at')
@@ -0,0 +1,74 @@
+"""add change versions
+
+Revision ID: d0f2b4c6e8a1
+Revises: c8e0a2b4d6f9
+Create Date: 2026-10-19 11:47:53.206184
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd0f2b4c6e8a1'
+down_revision: Union[str, Sequence[str], None] = 'c8e0a2b4d6f9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+VERSIONED_TABLES = ('villages', 'budgets', 'budget_categories', 'expenses')
+SYNCED_TABLES = VERSIONED_TABLES + ('deleted_records',)
+
+
+def _create_sqlite_triggers(table: str) -> None:
+    # Advance the clock to every version written, so the next writer goes past it
+    for event in ('INSERT', 'UPDATE'):
+        op.execute(
+            f"CREATE TRIGGER {table}_sync_clock_{event.lower()} AFTER {event} ON {table} "
+            f"WHEN NEW.change_version > (SELECT version FROM sync_clock) "
+            f"BEGIN UPDATE sync_clock SET version = NEW.change_version; END"
+        )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'sync_clock',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('version', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.execute("INSERT INTO sync_clock (id, version) VALUES (1, 0)")
+
+    # Rows written so far predate every token that will be handed out; clients
+    # holding an old timestamp token are still served from updated_at
+    for table in SYNCED_TABLES:
+        op.add_column(table, sa.Column('change_version', sa.BigInteger(), nullable=True))
+        op.execute(f"UPDATE {table} SET change_version = 0")
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column('change_version', existing_type=sa.BigInteger(), nullable=False)
+    for table in VERSIONED_TABLES:
+        op.create_index(op.f(f'ix_{table}_change_version'), table, ['change_version'], unique=False)
+    op.create_index(
+        'ix_deleted_records_village_change_version', 'deleted_records', ['village_id', 'change_version'], unique=False
+    )
+
+    if op.get_context().dialect.name == 'sqlite':
+        for table in SYNCED_TABLES:
+            _create_sqlite_triggers(table)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_context().dialect.name == 'sqlite':
+        for table in SYNCED_TABLES:
+            for event in ('insert', 'update'):
+                op.execute(f"DROP TRIGGER IF EXISTS {table}_sync_clock_{event}")
+    op.drop_index('ix_deleted_records_village_change_version', table_name='deleted_records')
+    for table in VERSIONED_TABLES:
+        op.drop_index(op.f(f'ix_{table}_change_version'), table_name=table)
+    for table in SYNCED_TABLES:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('change_version')
+    op.drop_table('sync_clock')
@@ -0,0 +1,28 @@
+"""add token_version to users
+
+Revision ID: d2a8f4c6e1b3
+Revises: c4d7e9a2b5f1
+Create Date: 2026-10-18 14:22:41.305117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2a8f4c6e1b3'
+down_revision: Union[str, Sequence[str], None] = 'c4d7e9a2b5f1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('users', sa.Column('token_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('users', 'token_version')
@@ -0,0 +1,30 @@
+"""index budget year and category budget
+
+Revision ID: d9a2c4e6f8b1
+Revises: c7e9b1d3f5a8
+Create Date: 2026-10-18 23:58:41.207735
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd9a2c4e6f8b1'
+down_revision: Union[str, Sequence[str], None] = 'c7e9b1d3f5a8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(op.f('ix_budgets_year'), 'budgets', ['year'], unique=False)
+    op.create_index(op.f('ix_budget_categories_budget_id'), 'budget_categories', ['budget_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_budget_categories_budget_id'), table_name='budget_categories')
+    op.drop_index(op.f('ix_budgets_year'), table_name='budgets')
@@ -0,0 +1,28 @@
+"""index expense category
+
+Revision ID: e1b3d5f7a9c2
+Revises: d9a2c4e6f8b1
+Create Date: 2026-10-19 00:21:53.640918
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e1b3d5f7a9c2'
+down_revision: Union[str, Sequence[str], None] = 'd9a2c4e6f8b1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(op.f('ix_expenses_category_id'), 'expenses', ['category_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_expenses_category_id'), table_name='expenses')
@@ -0,0 +1,38 @@
+"""add rate limit buckets
+
+Revision ID: e3a5c7e9f1b2
+Revises: d0f2b4c6e8a1
+Create Date: 2026-10-19 12:31:08.664017
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3a5c7e9f1b2'
+down_revision: Union[str, Sequence[str], None] = 'd0f2b4c6e8a1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'rate_limit_buckets',
+        sa.Column('key', sa.Text(), nullable=False),
+        sa.Column('tokens', sa.Float(), nullable=False),
+        sa.Column('taken', sa.Boolean(), nullable=False),
+        sa.Column('updated_at', sa.Float(), nullable=False),
+        sa.Column('full_at', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('key')
+    )
+    op.create_index(op.f('ix_rate_limit_buckets_full_at'), 'rate_limit_buckets', ['full_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_rate_limit_buckets_full_at'), table_name='rate_limit_buckets')
+    op.drop_table('rate_limit_buckets')
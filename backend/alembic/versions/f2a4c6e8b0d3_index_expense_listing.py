@@ -0,0 +1,36 @@
+"""index expense listing
+
+Revision ID: f2a4c6e8b0d3
+Revises: e1b3d5f7a9c2
+Create Date: 2026-10-19 01:05:27.904113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2a4c6e8b0d3'
+down_revision: Union[str, Sequence[str], None] = 'e1b3d5f7a9c2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # The composite index leads with category_id, so it replaces the single
+    # column one; created first so cascades are never without an index
+    op.create_index('ix_expenses_category_id_expense_date', 'expenses', ['category_id', 'expense_date'], unique=False)
+    op.drop_index(op.f('ix_expenses_category_id'), table_name='expenses')
+    op.create_index(op.f('ix_expenses_expense_date'), 'expenses', ['expense_date'], unique=False)
+    op.create_index(op.f('ix_expenses_vendor_name'), 'expenses', ['vendor_name'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_expenses_vendor_name'), table_name='expenses')
+    op.drop_index(op.f('ix_expenses_expense_date'), table_name='expenses')
+    op.create_index(op.f('ix_expenses_category_id'), 'expenses', ['category_id'], unique=False)
+    op.drop_index('ix_expenses_category_id_expense_date', table_name='expenses')
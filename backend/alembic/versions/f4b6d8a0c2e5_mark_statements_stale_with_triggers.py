@@ -0,0 +1,81 @@
+"""mark statements stale with triggers
+
+Revision ID: f4b6d8a0c2e5
+Revises: e3a5c7e9f1b2
+Create Date: 2026-10-19 14:05:41.930217
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f4b6d8a0c2e5'
+down_revision: Union[str, Sequence[str], None] = 'e3a5c7e9f1b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ('expenses', 'budget_categories')
+
+SQLITE_TRIGGERS = [
+    'CREATE TRIGGER expenses_statements_stale_insert AFTER INSERT ON expenses BEGIN UPDATE annual_statements SET stale = 1, version = version + 1 WHERE budget_id IN (SELECT budget_id FROM budget_categories WHERE id IN (NEW.category_id)); END',
+    'CREATE TRIGGER expenses_statements_stale_update AFTER UPDATE ON expenses BEGIN UPDATE annual_statements SET stale = 1, version = version + 1 WHERE budget_id IN (SELECT budget_id FROM budget_categories WHERE id IN (OLD.category_id, NEW.category_id)); END',
+    'CREATE TRIGGER expenses_statements_stale_delete AFTER DELETE ON expenses BEGIN UPDATE annual_statements SET stale = 1, version = version + 1 WHERE budget_id IN (SELECT budget_id FROM budget_categories WHERE id IN (OLD.category_id)); END',
+    'CREATE TRIGGER budget_categories_statements_stale_insert AFTER INSERT ON budget_categories BEGIN UPDATE annual_statements SET stale = 1, version = version + 1 WHERE budget_id IN (NEW.budget_id); END',
+    'CREATE TRIGGER budget_categories_statements_stale_update AFTER UPDATE ON budget_categories BEGIN UPDATE annual_statements SET stale = 1, version = version + 1 WHERE budget_id IN (OLD.budget_id, NEW.budget_id); END',
+    'CREATE TRIGGER budget_categories_statements_stale_delete AFTER DELETE ON budget_categories BEGIN UPDATE annual_statements SET stale = 1, version = version + 1 WHERE budget_id IN (OLD.budget_id); END',
+]
+
+POSTGRESQL_TRIGGERS = [
+    """
+CREATE FUNCTION expenses_mark_statements_stale() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE annual_statements SET stale = true, version = version + 1 WHERE budget_id IN (SELECT budget_id FROM budget_categories WHERE id IN (SELECT category_id FROM new_rows));
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE annual_statements SET stale = true, version = version + 1 WHERE budget_id IN (SELECT budget_id FROM budget_categories WHERE id IN (SELECT category_id FROM old_rows));
+    ELSE
+        UPDATE annual_statements SET stale = true, version = version + 1 WHERE budget_id IN (SELECT budget_id FROM budget_categories WHERE id IN (SELECT category_id FROM new_rows UNION SELECT category_id FROM old_rows));
+    END IF;
+    RETURN NULL;
+END
+$$""",
+    """
+CREATE FUNCTION budget_categories_mark_statements_stale() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE annual_statements SET stale = true, version = version + 1 WHERE budget_id IN (SELECT budget_id FROM new_rows);
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE annual_statements SET stale = true, version = version + 1 WHERE budget_id IN (SELECT budget_id FROM old_rows);
+    ELSE
+        UPDATE annual_statements SET stale = true, version = version + 1 WHERE budget_id IN (SELECT budget_id FROM new_rows UNION SELECT budget_id FROM old_rows);
+    END IF;
+    RETURN NULL;
+END
+$$""",
+    'CREATE TRIGGER expenses_statements_stale_insert AFTER INSERT ON expenses REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION expenses_mark_statements_stale()',
+    'CREATE TRIGGER expenses_statements_stale_update AFTER UPDATE ON expenses REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION expenses_mark_statements_stale()',
+    'CREATE TRIGGER expenses_statements_stale_delete AFTER DELETE ON expenses REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION expenses_mark_statements_stale()',
+    'CREATE TRIGGER budget_categories_statements_stale_insert AFTER INSERT ON budget_categories REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION budget_categories_mark_statements_stale()',
+    'CREATE TRIGGER budget_categories_statements_stale_update AFTER UPDATE ON budget_categories REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION budget_categories_mark_statements_stale()',
+    'CREATE TRIGGER budget_categories_statements_stale_delete AFTER DELETE ON budget_categories REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION budget_categories_mark_statements_stale()',
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    dialect = op.get_context().dialect.name
+    for statement in SQLITE_TRIGGERS if dialect == 'sqlite' else POSTGRESQL_TRIGGERS:
+        op.execute(statement)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in TABLES:
+        if op.get_context().dialect.name == 'sqlite':
+            for event in ('insert', 'update', 'delete'):
+                op.execute(f"DROP TRIGGER IF EXISTS {table}_statements_stale_{event}")
+        else:
+            op.execute(f"DROP FUNCTION IF EXISTS {table}_mark_statements_stale() CASCADE")
@@ -0,0 +1,181 @@
+# audit.py
+"""
+Append-only audit log of who created, changed or deleted what.
+
+crud records an entry after each committed write; entries are buffered in
+memory and written to `audit_log` in one multi-row INSERT when the buffer
+reaches AUDIT_FLUSH_SIZE or every AUDIT_FLUSH_SECONDS, whichever comes
+first, so writes do not pay for a second INSERT each. The buffer is flushed
+at shutdown and at interpreter exit. Entries of a failed flush go back into
+the buffer for the next one, but it holds at most AUDIT_BUFFER_MAX entries:
+while the database stays down, the oldest are dropped, logged and counted
+in the audit.dropped metric.
+
+An in-memory database has one connection shared by every thread, and a
+commit on it commits whatever transaction another thread has open there,
+so no flusher thread runs against one: the writer that fills the buffer or
+finds it due flushes it itself, after its own write has committed.
+"""
+
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from functools import lru_cache
+from typing import List, Optional
+
+from sqlalchemy import insert
+
+from . import metrics, models
+from .database import SessionLocal, is_in_memory
+
+logger = logging.getLogger(__name__)
+
+AUDIT_FLUSH_SIZE = int(os.getenv("AUDIT_FLUSH_SIZE", "200"))
+AUDIT_FLUSH_SECONDS = float(os.getenv("AUDIT_FLUSH_SECONDS", "2"))
+AUDIT_BUFFER_MAX = int(os.getenv("AUDIT_BUFFER_MAX", "100000"))
+
+_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_buffer: List[dict] = []
+_wake = threading.Event()
+_stopping = threading.Event()
+_flusher: Optional[threading.Thread] = None
+_flushed_at = time.monotonic()
+
+
+def snapshot(row) -> dict:
+    """Column values of an ORM object or a result row"""
+    if hasattr(row, "__table__"):
+        return {column.key: getattr(row, column.key) for column in row.__table__.columns}
+    return dict(row._mapping)
+
+
+def diff(before: dict, after: dict) -> tuple:
+    """The (before, after) values of only the fields that changed"""
+    changed = [key for key in after if before.get(key) != after[key]]
+    return {key: before.get(key) for key in changed}, {key: after[key] for key in changed}
+
+
+def _trim() -> int:
+    """Drop the oldest entries beyond AUDIT_BUFFER_MAX; call holding _lock"""
+    excess = len(_buffer) - AUDIT_BUFFER_MAX
+    if excess <= 0:
+        return 0
+    del _buffer[:excess]
+    return excess
+
+
+def _dropped(count: int) -> None:
+    if count:
+        logger.error("Audit buffer full; dropped the %d oldest entries", count)
+        metrics.increment("audit.dropped", count)
+
+
+@lru_cache(maxsize=None)
+def _flush_inline() -> bool:
+    """Whether writers flush the buffer themselves instead of the flusher thread"""
+    return is_in_memory()
+
+
+def _dump(values: Optional[dict]) -> Optional[str]:
+    return None if values is None else json.dumps(values, default=str, sort_keys=True)
+
+
+def record(
+    action: str,
+    entity: str,
+    entity_id: int,
+    actor_id: Optional[int],
+    before: Optional[dict] = None,
+    after: Optional[dict] = None
+) -> None:
+    """Buffer one entry; call after the write has committed"""
+    entry = {
+        "ts": datetime.utcnow(),
+        "actor_id": actor_id,
+        "action": action,
+        "entity": entity,
+        "entity_id": entity_id,
+        "before": _dump(before),
+        "after": _dump(after),
+    }
+    with _lock:
+        _buffer.append(entry)
+        dropped = _trim()
+        full = len(_buffer) >= AUDIT_FLUSH_SIZE
+    _dropped(dropped)
+    if _flush_inline():
+        if full or time.monotonic() - _flushed_at >= AUDIT_FLUSH_SECONDS:
+            flush()
+        return
+    if _flusher is None:
+        start()
+    if full:
+        _wake.set()
+
+
+def flush() -> int:
+    """Write out everything buffered so far. Returns the number of entries written"""
+    global _flushed_at
+    with _flush_lock:
+        _flushed_at = time.monotonic()
+        with _lock:
+            entries = _buffer[:]
+            del _buffer[:]
+        if not entries:
+            return 0
+        db = SessionLocal()
+        try:
+            # Entries without an actor or before values would otherwise omit
+            # those columns and split the batch into one INSERT per shape
+            db.execute(insert(models.AuditLog).execution_options(render_nulls=True), entries)
+            db.commit()
+        except Exception:
+            db.rollback()
+            logger.exception("Failed to write %d audit entries; keeping them for the next flush", len(entries))
+            with _lock:
+                _buffer[:0] = entries
+                dropped = _trim()
+            _dropped(dropped)
+            return 0
+        finally:
+            db.close()
+        return len(entries)
+
+
+def _run() -> None:
+    while not _stopping.is_set():
+        _wake.wait(AUDIT_FLUSH_SECONDS)
+        _wake.clear()
+        flush()
+
+
+def start() -> None:
+    """Start the background flusher, unless writers flush themselves"""
+    global _flusher
+    if _flush_inline():
+        return
+    with _lock:
+        if _flusher is not None:
+            return
+        _stopping.clear()
+        _flusher = threading.Thread(target=_run, name="audit-flusher", daemon=True)
+        _flusher.start()
+
+
+def shutdown() -> None:
+    """Stop the flusher and write out what is left"""
+    global _flusher
+    if _flusher is not None:
+        _stopping.set()
+        _wake.set()
+        _flusher.join()
+        _flusher = None
+    flush()
+
+
+atexit.register(shutdown)
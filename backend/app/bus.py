@@ -0,0 +1,183 @@
+# bus.py
+"""
+Cache invalidation bus shared by all workers.
+
+crud publishes events on the session of a write before committing it. On
+Postgres, the events of a transaction are sent as one NOTIFY on CHANNEL
+inside that transaction, so they are delivered exactly when it commits,
+cost no extra transaction, and a write whose NOTIFY fails rolls back rather
+than leaving other workers stale. Once the commit succeeds, the events are
+applied to this process's caches. Every worker LISTENs on a dedicated
+background connection and applies the events of the others. With SQLite,
+or a single process, events are only applied locally. A listener that loses
+its connection clears its caches after reconnecting, since it may have
+missed events meanwhile.
+"""
+
+import json
+import logging
+import os
+import select
+import threading
+import uuid
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import event as orm_event
+from sqlalchemy import func
+from sqlalchemy import select as sql_select
+from sqlalchemy.orm import Session
+
+from . import cache, metrics
+from .database import backend_name, get_engine
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "cache_invalidation"
+POLL_SECONDS = 1.0
+MAX_RECONNECT_SECONDS = 30.0
+# NOTIFY payloads must stay below 8000 bytes
+MAX_PAYLOAD_BYTES = 7000
+
+# session.info key of the events waiting for the session's commit
+PENDING = "bus_events"
+
+# Identifies this process, so it can skip its own notifications
+ORIGIN = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+_stopping = threading.Event()
+_listener: Optional[threading.Thread] = None
+
+
+def _bump(event: dict) -> None:
+    cache.bump(*[tuple(scope) for scope in event["scopes"]])
+
+
+_handlers: Dict[str, Callable[[dict], None]] = {
+    "bump": _bump,
+    "forget_village": lambda event: cache.forget_village(event["village_id"]),
+    "forget_budget": lambda event: cache.forget_budget(event["budget_id"]),
+    "forget_user": lambda event: cache.token_states.pop(event["user_id"], None),
+}
+
+
+def is_shared() -> bool:
+    """Whether events reach other workers (Postgres) or stay in this process"""
+    return backend_name() == "postgresql"
+
+
+def publish(db: Session, event_type: str, **data) -> None:
+    """Send an event to every worker when db's transaction commits; call before commit"""
+    db.info.setdefault(PENDING, []).append({"type": event_type, **data})
+
+
+def _merged(events: List[dict]) -> List[dict]:
+    """The events of one transaction, with all scope bumps in a single event"""
+    scopes = list(dict.fromkeys(tuple(scope) for event in events if event["type"] == "bump" for scope in event["scopes"]))
+    merged = [event for event in events if event["type"] != "bump"]
+    if scopes:
+        merged.append({"type": "bump", "scopes": scopes})
+    return merged
+
+
+def _payloads(events: List[dict]) -> List[str]:
+    """Events packed into as few NOTIFY payloads as fit"""
+    payloads, batch = [], []
+    for event in events:
+        candidate = json.dumps({"origin": ORIGIN, "events": batch + [event]})
+        if batch and len(candidate.encode()) > MAX_PAYLOAD_BYTES:
+            payloads.append(json.dumps({"origin": ORIGIN, "events": batch}))
+            batch = []
+        batch.append(event)
+    if batch:
+        payloads.append(json.dumps({"origin": ORIGIN, "events": batch}))
+    return payloads
+
+
+@orm_event.listens_for(Session, "before_commit")
+def _notify(session: Session) -> None:
+    events = session.info.get(PENDING)
+    if not events or not is_shared():
+        return
+    events = session.info[PENDING] = _merged(events)
+    for payload in _payloads(events):
+        session.execute(sql_select(func.pg_notify(CHANNEL, payload)))
+    metrics.increment("bus.published", len(events))
+
+
+@orm_event.listens_for(Session, "after_commit")
+def _apply(session: Session) -> None:
+    for event in session.info.pop(PENDING, []):
+        _handlers[event["type"]](event)
+
+
+@orm_event.listens_for(Session, "after_rollback")
+def _discard(session: Session) -> None:
+    session.info.pop(PENDING, None)
+
+
+def _receive(payload: str) -> None:
+    message = json.loads(payload)
+    if message.get("origin") == ORIGIN:
+        return
+    for event in message["events"]:
+        handle = _handlers.get(event["type"])
+        if handle is None:
+            logger.warning("Ignoring unknown invalidation event %s", event["type"])
+            continue
+        handle(event)
+        metrics.increment("bus.received")
+
+
+def _listen() -> None:
+    delay = 1.0
+    connected_before = False
+    while not _stopping.is_set():
+        connection = None
+        try:
+            # A dedicated connection, taken out of the pool for good
+            connection = get_engine().raw_connection()
+            connection.detach()
+            driver = connection.driver_connection
+            driver.autocommit = True
+            driver.cursor().execute(f"LISTEN {CHANNEL}")
+            if connected_before:
+                metrics.increment("bus.reconnects")
+                cache.clear()
+            connected_before = True
+            delay = 1.0
+
+            while not _stopping.is_set():
+                if select.select([driver], [], [], POLL_SECONDS) == ([], [], []):
+                    continue
+                driver.poll()
+                while driver.notifies:
+                    _receive(driver.notifies.pop(0).payload)
+        except Exception:
+            logger.exception("Invalidation listener failed; reconnecting in %.0fs", delay)
+            _stopping.wait(delay)
+            delay = min(delay * 2, MAX_RECONNECT_SECONDS)
+        finally:
+            if connection is not None:
+                try:
+                    connection.close()
+                except Exception:
+                    pass
+
+
+def start() -> None:
+    """Start listening for other workers' events (Postgres only)"""
+    global _listener
+    if _listener is not None or not is_shared():
+        return
+    _stopping.clear()
+    _listener = threading.Thread(target=_listen, name="invalidation-listener", daemon=True)
+    _listener.start()
+
+
+def shutdown() -> None:
+    """Stop the listener"""
+    global _listener
+    if _listener is not None:
+        _stopping.set()
+        _listener.join()
+        _listener = None
@@ -0,0 +1,136 @@
+# cache.py
+"""
+In-process cache for derived figures (rollups, totals, ...).
+
+Entries are tagged with the version of the scope they were computed from.
+Writes bump the version of every scope above the changed row
+(budget -> village -> district -> state -> all), so a stale entry is simply
+never matched again instead of having to be found and deleted. Writes reach
+this module through bus.py, which relays them to the other workers.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, NamedTuple, Optional, Tuple
+
+MAX_ENTRIES = 1024
+
+Scope = Tuple[Hashable, ...]
+
+ALL: Scope = ("all",)
+
+
+class Lineage(NamedTuple):
+    """Position of a budget (or village) in the state/district/village tree"""
+    village_id: int
+    state: Optional[str]
+    district: Optional[str]
+    budget_id: Optional[int] = None
+
+
+_lock = threading.Lock()
+_versions: Dict[Scope, int] = {}
+_bumped_at: Dict[Scope, float] = {}
+_entries: "OrderedDict[Hashable, Tuple[int, Any]]" = OrderedDict()
+
+# Memoized parent lookups. Villages never move between districts and budgets
+# and categories never change parent, so these only need forgetting on delete.
+village_parents: Dict[int, Tuple[Optional[str], Optional[str]]] = {}  # village -> (state, district)
+budget_parents: Dict[int, int] = {}  # budget -> village
+category_parents: Dict[int, int] = {}  # category -> budget
+
+# user -> (fetched at, (token_version, is_active) or None if the user is gone).
+# Read by auth on every request and refreshed after crud.TOKEN_STATE_TTL_SECONDS.
+token_states: Dict[int, Tuple[float, Optional[Tuple[int, bool]]]] = {}
+
+
+def scopes_for(lineage: Lineage) -> List[Scope]:
+    """All scopes whose cached figures depend on rows under this lineage"""
+    scopes = [
+        ALL,
+        ("state", lineage.state),
+        ("district", lineage.state, lineage.district),
+        ("village", lineage.village_id),
+    ]
+    if lineage.budget_id is not None:
+        scopes.append(("budget", lineage.budget_id))
+    return scopes
+
+
+def get_version(scope: Scope) -> int:
+    """Current version of a scope"""
+    return _versions.get(scope, 0)
+
+
+def bump(*scopes: Scope) -> None:
+    """Invalidate every cached entry computed from the given scopes"""
+    now = time.monotonic()
+    with _lock:
+        for scope in scopes:
+            _versions[scope] = _versions.get(scope, 0) + 1
+            _bumped_at[scope] = now
+
+
+def get_or_compute(
+    key: Hashable,
+    scope: Scope,
+    compute: Callable[[], Any],
+    settle_seconds: float = 0
+) -> Any:
+    """
+    Return the cached value for key, recomputing it if scope has changed.
+
+    settle_seconds is used when computing from a read replica: a result
+    computed within that long of the last write to the scope may predate
+    the write, so it is returned but not cached.
+    """
+    version = get_version(scope)
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None and entry[0] == version:
+            _entries.move_to_end(key)
+            return entry[1]
+
+    value = compute()
+    bumped_at = _bumped_at.get(scope)
+    if settle_seconds and bumped_at is not None and time.monotonic() - bumped_at < settle_seconds:
+        return value
+
+    with _lock:
+        # A write that landed while we were computing leaves the result
+        # tagged with the old version, so it is recomputed on next access.
+        _entries[key] = (version, value)
+        _entries.move_to_end(key)
+        while len(_entries) > MAX_ENTRIES:
+            _entries.popitem(last=False)
+    return value
+
+
+def forget_village(village_id: int) -> None:
+    """Drop memoized lookups for a deleted village and everything under it"""
+    with _lock:
+        village_parents.pop(village_id, None)
+        budget_ids = {b for b, v in budget_parents.items() if v == village_id}
+        for budget_id in budget_ids:
+            del budget_parents[budget_id]
+        for category_id in [c for c, b in category_parents.items() if b in budget_ids]:
+            del category_parents[category_id]
+
+
+def forget_budget(budget_id: int) -> None:
+    """Drop memoized lookups for a deleted budget and its categories"""
+    with _lock:
+        budget_parents.pop(budget_id, None)
+        for category_id in [c for c, b in category_parents.items() if b == budget_id]:
+            del category_parents[category_id]
+
+
+def clear() -> None:
+    """Drop all cached entries and memoized lookups"""
+    with _lock:
+        _entries.clear()
+        village_parents.clear()
+        budget_parents.clear()
+        category_parents.clear()
+        token_states.clear()
@@ -0,0 +1,71 @@
+# change_versions.py
+"""
+Commit-ordered change versions for delta sync.
+
+Every synced row carries a `change_version` the database sets whenever the
+row is inserted or updated, and a sync token is a version: the next sync
+returns the rows whose version is at least the token. Unlike a timestamp
+from the app's clock, a version cannot be skewed between servers, and the
+rows of a transaction still running when the token is taken always get a
+version at or above it, however long that transaction runs:
+
+- On Postgres the version is the writing transaction's ID (txid_current())
+  and a token is the oldest transaction still running in the reader's
+  snapshot (txid_snapshot_xmin). Rows of older transactions had committed
+  and were visible to the read; rows of that one or newer are sent again on
+  the next sync, which clients apply idempotently. A replica's snapshot only
+  covers what it has replayed, so replica lag needs no allowance either.
+- On SQLite, where writers run one at a time, the version is the counter in
+  the one-row `sync_clock` table plus one, and a trigger on every synced
+  table advances the counter to the versions its rows take. A token is the
+  committed counter plus one.
+
+The triggers and the counter's row are created by the migration that added
+change versions, and by models.py for SQLite databases built from the
+models. Batch migrations rebuild tables on SQLite, which drops their
+triggers; a migration that batch-alters a synced table has to recreate them.
+"""
+
+from sqlalchemy import BigInteger, text
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.functions import FunctionElement
+
+SYNCED_TABLES = ("villages", "budgets", "budget_categories", "expenses", "deleted_records")
+
+
+class next_version(FunctionElement):
+    """Change version of a row written by the current transaction"""
+    type = BigInteger()
+    inherit_cache = True
+
+
+@compiles(next_version)
+def _next_version(element, compiler, **kw):
+    return "txid_current()"
+
+
+@compiles(next_version, "sqlite")
+def _next_version_sqlite(element, compiler, **kw):
+    return "((SELECT version FROM sync_clock) + 1)"
+
+
+def sqlite_triggers(table: str) -> list:
+    """CREATE TRIGGER statements advancing sync_clock past every version written to table"""
+    return [
+        f"CREATE TRIGGER {table}_sync_clock_{event.lower()} AFTER {event} ON {table} "
+        f"WHEN NEW.change_version > (SELECT version FROM sync_clock) "
+        f"BEGIN UPDATE sync_clock SET version = NEW.change_version; END"
+        for event in ("INSERT", "UPDATE")
+    ]
+
+
+def current_token(db: Session) -> int:
+    """
+    The version from which the next sync must read. Take it before reading
+    the changes, so that rows committed in between are sent twice rather
+    than never.
+    """
+    if db.bind.dialect.name == "postgresql":
+        return db.execute(text("SELECT txid_snapshot_xmin(txid_current_snapshot())")).scalar_one()
+    return db.execute(text("SELECT version FROM sync_clock")).scalar_one() + 1
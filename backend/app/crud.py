@@ -1,32 +1,48 @@
 ﻿from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List, Optional
-from decimal import Decimal
+from sqlalchemy import delete, func, insert, select, tuple_, update
+from typing import List, Optional, Tuple, Union
+import hashlib
+import logging
+import os
+import secrets
+import time
+import uuid
 from datetime import datetime, timedelta
-from passlib.context import CryptContext
-from jose import JWTError, jwt
+from functools import lru_cache
 
-from . import models, schemas
+from . import audit, bus, cache, models, money, schemas
+from .fields import select_fields
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def _pwd_context():
+    """Password hashing context; passlib and bcrypt load on first use, not at import"""
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 # JWT settings
 SECRET_KEY = "your-secret-key-change-in-production"  # TODO: Move to environment variable
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# How long a user's token version and active flag are trusted before re-reading
+# them, i.e. the worst-case delay before a revocation takes effect on a worker
+TOKEN_STATE_TTL_SECONDS = float(os.getenv("TOKEN_STATE_TTL_SECONDS", "30"))
+REFRESH_TOKEN_EXPIRE_DAYS = float(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "14"))
 
 
 # ============ User CRUD ============
 
 def get_password_hash(password: str) -> str:
     """Hash a password"""
-    return pwd_context.hash(password)
+    return _pwd_context().hash(password)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
-    return pwd_context.verify(plain_password, hashed_password)
+    return _pwd_context().verify(plain_password, hashed_password)
 
 
 def get_user_by_email(db: Session, email: str) -> Optional[models.User]:
@@ -48,16 +64,16 @@ def create_user(db: Session, user: schemas.UserCreate) -> models.User:
         village_id = None
     else:
         village_id = user.village_id
-    db_user = models.User(
-        name=user.name,
-        email=user.email,
-        hashed_password=hashed_password,
-        role=user.role,
-        village_id=village_id
-    )
-    db.add(db_user)
+    db_user = db.scalars(
+        insert(models.User).values(
+            name=user.name,
+            email=user.email,
+            hashed_password=hashed_password,
+            role=user.role,
+            village_id=village_id
+        ).returning(models.User)
+    ).one()
     db.commit()
-    db.refresh(db_user)
     return db_user
 
 
@@ -69,12 +85,14 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
     to_encode.update({"exp": expire})
+    from jose import jwt  # deferred: jose and its crypto backends are slow to import
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 
 def verify_access_token(token: str) -> Optional[dict]:
     """Verify and decode a JWT access token"""
+    from jose import JWTError, jwt
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         return payload
@@ -82,18 +100,139 @@ def verify_access_token(token: str) -> Optional[dict]:
         return None
 
 
+def token_claims(user: models.User) -> dict:
+    """Claims signed into a user's access token so requests need no user lookup"""
+    return {
+        "sub": str(user.id),
+        "role": user.role,
+        "village_id": user.village_id,
+        "ver": user.token_version
+    }
+
+
+def get_token_state(db: Session, user_id: int) -> Optional[Tuple[int, bool]]:
+    """A user's (token_version, is_active), cached for TOKEN_STATE_TTL_SECONDS"""
+    now = time.monotonic()
+    cached = cache.token_states.get(user_id)
+    if cached is not None and now - cached[0] < TOKEN_STATE_TTL_SECONDS:
+        return cached[1]
+    row = db.execute(
+        select(models.User.token_version, models.User.is_active).where(models.User.id == user_id)
+    ).first()
+    state = None if row is None else (row.token_version, bool(row.is_active))
+    cache.token_states[user_id] = (now, state)
+    return state
+
+
+def _hash_refresh_token(token: str) -> str:
+    # Refresh tokens are 256 random bits, so a fast hash is enough; bcrypt
+    # would bring back the per-request cost refreshing is meant to avoid.
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def create_refresh_token(db: Session, user_id: int, family_id: Optional[str] = None) -> str:
+    """Issue a refresh token, starting a new family unless one is given"""
+    token = secrets.token_urlsafe(32)
+    now = datetime.utcnow()
+    # Expired tokens are no longer needed for reuse detection
+    db.execute(
+        delete(models.RefreshToken).where(
+            models.RefreshToken.user_id == user_id,
+            models.RefreshToken.expires_at < now
+        )
+    )
+    db.execute(
+        insert(models.RefreshToken).values(
+            user_id=user_id,
+            token_hash=_hash_refresh_token(token),
+            family_id=family_id or str(uuid.uuid4()),
+            created_at=now,
+            expires_at=now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+        )
+    )
+    db.commit()
+    return token
+
+
+def revoke_refresh_family(db: Session, family_id: str) -> None:
+    """Revoke every token descended from the same login"""
+    db.execute(
+        update(models.RefreshToken)
+        .where(models.RefreshToken.family_id == family_id, models.RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=datetime.utcnow())
+    )
+    db.commit()
+
+
+def rotate_refresh_token(db: Session, token: str) -> Optional[Tuple[models.User, str]]:
+    """
+    Exchange a refresh token for its user and a new refresh token.
+    Returns None if the token is unknown, expired, revoked or already used;
+    reuse of an already rotated token revokes its whole family.
+    """
+    now = datetime.utcnow()
+    stored = db.query(models.RefreshToken).filter(
+        models.RefreshToken.token_hash == _hash_refresh_token(token)
+    ).first()
+    if stored is None or stored.revoked_at is not None or stored.expires_at < now:
+        return None
+
+    # Claim the token; of two concurrent refreshes only one can win
+    claimed = db.execute(
+        update(models.RefreshToken)
+        .where(models.RefreshToken.id == stored.id, models.RefreshToken.rotated_at.is_(None))
+        .values(rotated_at=now)
+    ).rowcount
+    db.commit()
+    if not claimed:
+        logger.warning("Refresh token reuse for user %s; revoking family %s", stored.user_id, stored.family_id)
+        revoke_refresh_family(db, stored.family_id)
+        return None
+
+    user = get_user_by_id(db, stored.user_id)
+    if user is None or not user.is_active:
+        return None
+    return user, create_refresh_token(db, user.id, family_id=stored.family_id)
+
+
+def revoke_refresh_token(db: Session, token: str) -> None:
+    """Log out: revoke the token's family"""
+    stored = db.query(models.RefreshToken).filter(
+        models.RefreshToken.token_hash == _hash_refresh_token(token)
+    ).first()
+    if stored is not None:
+        revoke_refresh_family(db, stored.family_id)
+
+
+def revoke_user_tokens(db: Session, user_id: int) -> None:
+    """Invalidate every access and refresh token issued to a user so far"""
+    db.execute(
+        update(models.User)
+        .where(models.User.id == user_id)
+        .values(token_version=models.User.token_version + 1)
+    )
+    db.execute(
+        update(models.RefreshToken)
+        .where(models.RefreshToken.user_id == user_id, models.RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=datetime.utcnow())
+    )
+    bus.publish(db, "forget_user", user_id=user_id)
+    db.commit()
+
+
 # ============ Village CRUD ============
 
 def create_village(db: Session, village: schemas.VillageCreate) -> models.Village:
     """Create a new village"""
-    db_village = models.Village(
-        name=village.name,
-        district=village.district,
-        state=village.state
-    )
-    db.add(db_village)
+    db_village = db.scalars(
+        insert(models.Village).values(
+            name=village.name,
+            district=village.district,
+            state=village.state
+        ).returning(models.Village)
+    ).one()
     db.commit()
-    db.refresh(db_village)
+    _audit(db, "create", "village", db_village.id, after=audit.snapshot(db_village))
     return db_village
 
 
@@ -107,24 +246,94 @@ def get_village_by_id(db: Session, village_id: int) -> Optional[models.Village]:
     return db.query(models.Village).filter(models.Village.id == village_id).first()
 
 
+def delete_village(db: Session, village_id: int) -> bool:
+    """
+    Delete a village along with its budgets, categories and expenses. One
+    DELETE statement: the database removes the rest through ON DELETE
+    CASCADE, so none of it is loaded. See purge_village for villages too
+    large to delete in one transaction.
+    """
+    db_village = get_village_by_id(db, village_id)
+    if not db_village:
+        return False
+
+    lineage = get_village_lineage(db, village_id)
+    before = audit.snapshot(db_village)
+    db.execute(delete(models.Village).where(models.Village.id == village_id))
+    record_deletion(db, "village", village_id, village_id)
+    invalidate_lineage(db, lineage)
+    bus.publish(db, "forget_village", village_id=village_id)
+    db.commit()
+    _audit(db, "delete", "village", village_id, before=before)
+    return True
+
+
+# Expenses deleted per transaction when purging a village
+PURGE_BATCH_ROWS = int(os.getenv("PURGE_BATCH_ROWS", "5000"))
+
+
+def purge_village(db: Session, village_id: int, report_progress=None) -> bool:
+    """
+    Delete a village too large for one transaction. Its expenses are deleted
+    PURGE_BATCH_ROWS at a time, each batch committed on its own so locks and
+    undo stay bounded, then delete_village removes the rest. Readers see the
+    expenses disappear batch by batch until the village itself goes. The
+    stale-statement triggers mark the village's statements stale in every
+    batch's transaction, so a statement rebuilt between batches never stays
+    fresh with partial figures.
+    """
+    lineage = get_village_lineage(db, village_id)
+    if lineage is None:
+        return False
+
+    budget_ids = [
+        budget_id for (budget_id,) in
+        db.query(models.Budget.id).filter(models.Budget.village_id == village_id)
+    ]
+    scopes = cache.scopes_for(lineage) + [("budget", budget_id) for budget_id in budget_ids]
+
+    in_village = models.Expense.category_id.in_(
+        select(models.BudgetCategory.id).where(models.BudgetCategory.budget_id.in_(budget_ids))
+    )
+    total = db.query(func.count(models.Expense.id)).filter(in_village).scalar()
+    purged = 0
+    while True:
+        batch = select(models.Expense.id).where(in_village).limit(PURGE_BATCH_ROWS)
+        deleted = db.execute(
+            delete(models.Expense).where(models.Expense.id.in_(batch)), execution_options={"synchronize_session": False}
+        ).rowcount
+        if deleted:
+            bus.publish(db, "bump", scopes=scopes)
+        db.commit()
+        if not deleted:
+            break
+        purged += deleted
+        if report_progress is not None and total:
+            report_progress(purged / total)
+    return delete_village(db, village_id)
+
+
 # ============ Budget CRUD ============
 
 def create_budget(db: Session, budget: schemas.BudgetCreate, village_id: int) -> models.Budget:
     """Create a new budget for a village"""
-    db_budget = models.Budget(
-        village_id=village_id,
-        year=budget.year,
-        total_allocated=budget.total_allocated
-    )
-    db.add(db_budget)
+    db_budget = db.scalars(
+        insert(models.Budget).values(
+            village_id=village_id,
+            year=budget.year,
+            total_allocated=budget.total_allocated
+        ).returning(models.Budget)
+    ).one()
+    invalidate_lineage(db, get_budget_lineage(db, db_budget.id))
     db.commit()
-    db.refresh(db_budget)
+    _audit(db, "create", "budget", db_budget.id, after=audit.snapshot(db_budget))
     return db_budget
 
 
-def get_budgets_by_village(db: Session, village_id: int) -> List[models.Budget]:
-    """Get all budgets for a specific village"""
-    return db.query(models.Budget).filter(models.Budget.village_id == village_id).all()
+def get_budgets_by_village(db: Session, village_id: int, fields: Optional[Tuple[str, ...]] = None) -> List[models.Budget]:
+    """Get all budgets for a specific village, optionally only some columns"""
+    query = db.query(models.Budget).filter(models.Budget.village_id == village_id)
+    return select_fields(query, models.Budget, fields).all()
 
 
 def get_budget_by_id(db: Session, budget_id: int) -> Optional[models.Budget]:
@@ -133,28 +342,37 @@ def get_budget_by_id(db: Session, budget_id: int) -> Optional[models.Budget]:
 
 
 def update_budget(db: Session, budget_id: int, budget_update: schemas.BudgetUpdate) -> Optional[models.Budget]:
-    """Update a budget"""
-    db_budget = get_budget_by_id(db, budget_id)
+    """Update a budget with a single UPDATE ... RETURNING; None if it does not exist"""
+    update_data = budget_update.model_dump(exclude_unset=True)
+    if not update_data:
+        return get_budget_by_id(db, budget_id)
+
+    db_budget, before = _update_returning_before(db, models.Budget, budget_id, update_data)
     if not db_budget:
         return None
-    
-    update_data = budget_update.model_dump(exclude_unset=True)
-    for field, value in update_data.items():
-        setattr(db_budget, field, value)
-    
+
+    # The year may have changed, so rebuild the statement from scratch
+    db.execute(delete(models.AnnualStatement).where(models.AnnualStatement.budget_id == budget_id))
+    invalidate_lineage(db, get_budget_lineage(db, budget_id))
     db.commit()
-    db.refresh(db_budget)
+    _audit_update(db, "budget", db_budget, before)
     return db_budget
 
 
 def delete_budget(db: Session, budget_id: int) -> bool:
-    """Delete a budget"""
+    """Delete a budget; its categories and expenses go by ON DELETE CASCADE"""
     db_budget = get_budget_by_id(db, budget_id)
     if not db_budget:
         return False
     
-    db.delete(db_budget)
+    lineage = get_budget_lineage(db, budget_id)
+    before = audit.snapshot(db_budget)
+    db.execute(delete(models.Budget).where(models.Budget.id == budget_id))
+    record_deletion(db, "budget", budget_id, db_budget.village_id)
+    invalidate_lineage(db, lineage)
+    bus.publish(db, "forget_budget", budget_id=budget_id)
     db.commit()
+    _audit(db, "delete", "budget", budget_id, before=before)
     return True
 
 
@@ -166,23 +384,33 @@ def get_all_budgets(db: Session, skip: int = 0, limit: int = 100) -> List[models
 # ============ Budget Category CRUD ============
 
 def create_category(db: Session, category: schemas.CategoryCreate) -> models.BudgetCategory:
-    """Create a new budget category"""
-    db_category = models.BudgetCategory(
-        budget_id=category.budget_id,
-        category_name=category.category_name,
-        allocated_amount=category.allocated_amount
-    )
-    db.add(db_category)
+    """
+    Create a new budget category. A missing budget surfaces as an
+    IntegrityError from the foreign key rather than a separate lookup.
+    """
+    db_category = db.scalars(
+        insert(models.BudgetCategory).values(
+            budget_id=category.budget_id,
+            category_name=category.category_name,
+            allocated_amount=category.allocated_amount
+        ).returning(models.BudgetCategory)
+    ).one()
+    invalidate_lineage(db, get_budget_lineage(db, db_category.budget_id))
     db.commit()
-    db.refresh(db_category)
+    _audit(db, "create", "category", db_category.id, after=audit.snapshot(db_category))
     return db_category
 
 
-def get_categories_by_budget(db: Session, budget_id: int) -> List[models.BudgetCategory]:
-    """Get all categories for a specific budget"""
-    return db.query(models.BudgetCategory).filter(
+def get_categories_by_budget(
+    db: Session,
+    budget_id: int,
+    fields: Optional[Tuple[str, ...]] = None
+) -> List[models.BudgetCategory]:
+    """Get all categories for a specific budget, optionally only some columns"""
+    query = db.query(models.BudgetCategory).filter(
         models.BudgetCategory.budget_id == budget_id
-    ).all()
+    )
+    return select_fields(query, models.BudgetCategory, fields).all()
 
 
 def get_category_by_id(db: Session, category_id: int) -> Optional[models.BudgetCategory]:
@@ -200,35 +428,182 @@ def get_all_categories(db: Session, skip: int = 0, limit: int = 100) -> List[mod
 # ============ Expense CRUD ============
 
 def create_expense(db: Session, expense: schemas.ExpenseCreate) -> models.Expense:
-    """Create a new expense"""
-    db_expense = models.Expense(
-        category_id=expense.category_id,
-        description=expense.description,
-        amount=expense.amount,
-        vendor_name=expense.vendor_name,
-        expense_date=expense.expense_date
-    )
-    db.add(db_expense)
+    """
+    Create a new expense. A missing category surfaces as an IntegrityError
+    from the foreign key rather than a separate lookup.
+    """
+    db_expense = db.scalars(
+        insert(models.Expense).values(
+            category_id=expense.category_id,
+            description=expense.description,
+            amount=expense.amount,
+            vendor_name=expense.vendor_name,
+            expense_date=expense.expense_date
+        ).returning(models.Expense)
+    ).one()
+    lineage = get_category_lineage(db, db_expense.category_id)
+    invalidate_lineage(db, lineage)
     db.commit()
-    db.refresh(db_expense)
+    _audit(db, "create", "expense", db_expense.id, after=audit.snapshot(db_expense))
     return db_expense
 
 
+def _dialect_insert(db: Session, model):
+    """INSERT supporting ON CONFLICT for the session's backend"""
+    if db.bind.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    return dialect_insert(model)
+
+
+def create_expenses_batch(db: Session, items: List[schemas.ExpenseBatchItem]) -> List[dict]:
+    """
+    Insert a batch of client-generated expenses in one transaction.
+
+    Rows go in as multi-row INSERTs that skip any client_uuid already stored
+    (ON CONFLICT DO NOTHING on its unique index), so replaying an upload
+    after a lost response creates nothing twice. Returns one status per
+    item, in request order.
+    """
+    results = [{"client_uuid": item.client_uuid, "status": None, "id": None, "detail": None} for item in items]
+
+    category_ids = {item.category_id for item in items}
+    existing_categories = {
+        row.id for row in
+        db.query(models.BudgetCategory.id).filter(models.BudgetCategory.id.in_(category_ids))
+    } if category_ids else set()
+
+    rows = []
+    first_index = {}
+    for index, item in enumerate(items):
+        client_uuid = str(item.client_uuid)
+        if item.category_id not in existing_categories:
+            results[index].update(status="rejected", detail=f"Category with id {item.category_id} not found")
+        elif client_uuid in first_index:
+            results[index].update(status="duplicate")
+        else:
+            first_index[client_uuid] = index
+            rows.append({
+                "category_id": item.category_id,
+                "description": item.description,
+                "amount": item.amount,
+                "vendor_name": item.vendor_name,
+                "expense_date": item.expense_date,
+                "client_uuid": client_uuid
+            })
+
+    inserted = {}
+    if rows:
+        statement = _dialect_insert(db, models.Expense).on_conflict_do_nothing(
+            index_elements=[models.Expense.client_uuid]
+        ).returning(*models.Expense.__table__.columns)
+        inserted = {row.client_uuid: row for row in db.execute(statement, rows)}
+
+    lineages = [
+        get_category_lineage(db, category_id)
+        for category_id in {row["category_id"] for row in rows if row["client_uuid"] in inserted}
+    ]
+    for lineage in lineages:
+        invalidate_lineage(db, lineage)
+
+    # Rows skipped by the conflict clause were uploaded before
+    already_stored = [uuid for uuid in first_index if uuid not in inserted]
+    stored_ids = dict(
+        db.query(models.Expense.client_uuid, models.Expense.id).filter(
+            models.Expense.client_uuid.in_(already_stored)
+        ).all()
+    ) if already_stored else {}
+    db.commit()
+
+    for row in rows:
+        created = inserted.get(row["client_uuid"])
+        if created is not None:
+            _audit(db, "create", "expense", created.id, after=audit.snapshot(created))
+
+    ids_by_uuid = {**stored_ids, **{client_uuid: row.id for client_uuid, row in inserted.items()}}
+    for index, result in enumerate(results):
+        client_uuid = str(result["client_uuid"])
+        if result["status"] == "rejected":
+            continue
+        if result["status"] is None and client_uuid in inserted:
+            result["status"] = "created"
+        elif result["status"] is None:
+            result["status"] = "duplicate"
+        result["id"] = ids_by_uuid.get(client_uuid)
+    return results
+
+
 def get_expenses_by_category(
     db: Session,
     category_id: int,
     skip: int = 0,
-    limit: int = 100
+    limit: int = 100,
+    fields: Optional[Tuple[str, ...]] = None
 ) -> List[models.Expense]:
-    """Get all expenses for a specific category with pagination"""
-    return db.query(models.Expense).filter(
+    """Get all expenses for a specific category with pagination, optionally only some columns"""
+    query = db.query(models.Expense).filter(
         models.Expense.category_id == category_id
-    ).offset(skip).limit(limit).all()
+    )
+    return select_fields(query, models.Expense, fields).offset(skip).limit(limit).all()
+
+
+# Keys expense listings can be sorted on, ties broken by id
+EXPENSE_SORT_KEYS = ("id", "expense_date", "amount")
+
 
+def expense_sort_column(key: str):
+    """The column behind a sort key; amounts in storage units"""
+    if key == "amount":
+        return money.column(models.Expense.amount)
+    return getattr(models.Expense, key)
 
-def get_all_expenses(db: Session, skip: int = 0, limit: int = 100) -> List[models.Expense]:
-    """Get all expenses with pagination"""
-    return db.query(models.Expense).offset(skip).limit(limit).all()
+
+def list_expenses(
+    db: Session,
+    expense_query: schemas.ExpenseQuery,
+    sort: str = "id",
+    after: Optional[tuple] = None,
+    fields: Optional[Tuple[str, ...]] = None
+):
+    """
+    Query of the expenses matching expense_query, ordered by a key of
+    EXPENSE_SORT_KEYS (prefixed with "-" for descending) and id. `after`, the
+    (sort value, id) of the last row of the previous page, continues from
+    that row (keyset pagination), so deep pages cost the same as the first.
+    With fields, rows also carry the sort value as sort_key.
+    """
+    descending = sort.startswith("-")
+    key = sort.lstrip("-")
+    column = expense_sort_column(key)
+
+    query = select_fields(db.query(models.Expense), models.Expense, fields)
+    if fields:
+        query = query.add_columns(column.label("sort_key"))
+
+    conditions = _expense_filter_conditions(expense_query)
+    amount = money.column(models.Expense.amount)
+    if expense_query.amount_min is not None:
+        conditions.append(amount >= money.to_storage(expense_query.amount_min))
+    if expense_query.amount_max is not None:
+        conditions.append(amount <= money.to_storage(expense_query.amount_max))
+    if expense_query.village_id is not None or expense_query.year is not None:
+        query = query.join(
+            models.BudgetCategory, models.Expense.category_id == models.BudgetCategory.id
+        ).join(models.Budget, models.BudgetCategory.budget_id == models.Budget.id)
+        if expense_query.village_id is not None:
+            conditions.append(models.Budget.village_id == expense_query.village_id)
+        if expense_query.year is not None:
+            conditions.append(models.Budget.year == expense_query.year)
+
+    order = [column] if key == "id" else [column, models.Expense.id]
+    if after is not None:
+        position = tuple_(*order) if len(order) > 1 else column
+        last = tuple_(*after) if len(order) > 1 else after[-1]
+        conditions.append(position < last if descending else position > last)
+    if descending:
+        order = [part.desc() for part in order]
+    return query.filter(*conditions).order_by(*order)
 
 
 def get_expenses_by_village(db: Session, village_id: int, skip: int = 0, limit: int = 100) -> List[models.Expense]:
@@ -246,17 +621,26 @@ def get_expense_by_id(db: Session, expense_id: int) -> Optional[models.Expense]:
 
 
 def update_expense(db: Session, expense_id: int, expense_update: schemas.ExpenseUpdate) -> Optional[models.Expense]:
-    """Update an expense"""
-    db_expense = get_expense_by_id(db, expense_id)
+    """Update an expense with a single UPDATE ... RETURNING; None if it does not exist"""
+    update_data = expense_update.model_dump(exclude_unset=True)
+    if not update_data:
+        return get_expense_by_id(db, expense_id)
+
+    # The old category_id, when the expense moves, also tells which
+    # category's totals to invalidate
+    db_expense, before = _update_returning_before(db, models.Expense, expense_id, update_data)
     if not db_expense:
         return None
-    
-    update_data = expense_update.model_dump(exclude_unset=True)
-    for field, value in update_data.items():
-        setattr(db_expense, field, value)
-    
+    previous_category_id = before.get("category_id")
+
+    lineages = [get_category_lineage(db, db_expense.category_id)]
+    if previous_category_id is not None and previous_category_id != db_expense.category_id:
+        lineages.append(get_category_lineage(db, previous_category_id))
+        record_moves(db, "expense", [(expense_id, lineages[1].village_id)], lineages[0].village_id)
+    for lineage in lineages:
+        invalidate_lineage(db, lineage)
     db.commit()
-    db.refresh(db_expense)
+    _audit_update(db, "expense", db_expense, before)
     return db_expense
 
 
@@ -266,11 +650,194 @@ def delete_expense(db: Session, expense_id: int) -> bool:
     if not db_expense:
         return False
     
+    lineage = get_category_lineage(db, db_expense.category_id)
+    before = audit.snapshot(db_expense)
     db.delete(db_expense)
+    if lineage is not None:
+        record_deletion(db, "expense", expense_id, lineage.village_id)
+    invalidate_lineage(db, lineage)
     db.commit()
+    _audit(db, "delete", "expense", expense_id, before=before)
     return True
 
 
+def _bulk_expense_conditions(
+    ids: Optional[List[int]],
+    expense_filter: Optional[schemas.ExpenseFilter]
+) -> list:
+    """WHERE clauses selecting the expenses targeted by a bulk operation"""
+    conditions = []
+    if ids is not None:
+        conditions.append(models.Expense.id.in_(ids))
+    if expense_filter is not None:
+        conditions.extend(_expense_filter_conditions(expense_filter))
+    return conditions
+
+
+def _expense_filter_conditions(expense_filter: schemas.ExpenseFilter) -> list:
+    """WHERE clauses of the fields an ExpenseFilter sets"""
+    conditions = []
+    if expense_filter.category_id is not None:
+        conditions.append(models.Expense.category_id == expense_filter.category_id)
+    if expense_filter.budget_id is not None:
+        conditions.append(models.Expense.category_id.in_(
+            select(models.BudgetCategory.id).where(
+                models.BudgetCategory.budget_id == expense_filter.budget_id
+            )
+        ))
+    if expense_filter.vendor_name is not None:
+        conditions.append(models.Expense.vendor_name == expense_filter.vendor_name)
+    if expense_filter.date_from is not None:
+        conditions.append(models.Expense.expense_date >= expense_filter.date_from)
+    if expense_filter.date_to is not None:
+        conditions.append(models.Expense.expense_date <= expense_filter.date_to)
+    return conditions
+
+
+def bulk_update_expenses(
+    db: Session,
+    ids: Optional[List[int]],
+    expense_filter: Optional[schemas.ExpenseFilter],
+    expense_update: schemas.ExpenseUpdate
+) -> int:
+    """
+    Apply the same change to many expenses with a single UPDATE statement.
+    Returns the number of rows updated.
+    """
+    conditions = _bulk_expense_conditions(ids, expense_filter)
+    update_data = expense_update.model_dump(exclude_unset=True)
+    if not update_data:
+        return 0
+
+    # Old values of the changed columns, for the audit log, and the
+    # categories whose totals change, read before the UPDATE moves rows away
+    columns = dict.fromkeys(["id", "category_id", *update_data])
+    before = {
+        row.id: dict(row._mapping) for row in
+        db.query(*[getattr(models.Expense, column) for column in columns]).filter(*conditions).with_for_update()
+    }
+    category_ids = {values["category_id"] for values in before.values()}
+    if "category_id" in update_data:
+        category_ids.add(update_data["category_id"])
+
+    updated_ids = db.scalars(
+        update(models.Expense).where(*conditions).values(**money.with_paise(update_data)).returning(models.Expense.id),
+        execution_options={"synchronize_session": False}
+    ).all()
+    lineages = {category_id: get_category_lineage(db, category_id) for category_id in category_ids}
+    if "category_id" in update_data and updated_ids:
+        record_moves(db, "expense", [
+            (expense_id, lineages[before[expense_id]["category_id"]].village_id)
+            for expense_id in updated_ids if expense_id in before
+        ], lineages[update_data["category_id"]].village_id)
+    for lineage in lineages.values():
+        invalidate_lineage(db, lineage)
+    db.commit()
+
+    for expense_id in updated_ids:
+        old, new = audit.diff(before.get(expense_id, {}), update_data)
+        if new:
+            _audit(db, "update", "expense", expense_id, before=old, after=new)
+    return len(updated_ids)
+
+
+def bulk_delete_expenses(
+    db: Session,
+    ids: Optional[List[int]],
+    expense_filter: Optional[schemas.ExpenseFilter]
+) -> int:
+    """
+    Delete many expenses with a single DELETE statement.
+    Returns the number of rows deleted.
+    """
+    conditions = _bulk_expense_conditions(ids, expense_filter)
+    result = db.execute(
+        delete(models.Expense).where(*conditions).returning(*models.Expense.__table__.columns),
+        execution_options={"synchronize_session": False}
+    )
+    deleted = result.all()
+
+    lineages = {row.category_id: get_category_lineage(db, row.category_id) for row in deleted}
+    tombstones = [
+        {"entity": "expense", "entity_id": row.id, "village_id": lineages[row.category_id].village_id}
+        for row in deleted if lineages[row.category_id] is not None
+    ]
+    if tombstones:
+        db.execute(insert(models.DeletedRecord), tombstones)
+    for lineage in lineages.values():
+        invalidate_lineage(db, lineage)
+    db.commit()
+
+    for row in deleted:
+        _audit(db, "delete", "expense", row.id, before=audit.snapshot(row))
+    return len(deleted)
+
+
+def get_budget_tree(db: Session, budget: models.Budget, recent_limit: int = 5) -> dict:
+    """
+    A budget with its categories, per-category totals and the most recent
+    expenses of each category. Always two statements regardless of the
+    number of categories: one grouped query for the totals and one
+    windowed query for the recent expenses.
+    """
+    category_rows = db.query(
+        models.BudgetCategory,
+        func.coalesce(func.sum(money.column(models.Expense.amount)), 0).label("spent"),
+        func.count(models.Expense.id).label("expense_count")
+    ).outerjoin(
+        models.Expense, models.Expense.category_id == models.BudgetCategory.id
+    ).filter(
+        models.BudgetCategory.budget_id == budget.id
+    ).group_by(models.BudgetCategory.id).order_by(models.BudgetCategory.id).all()
+
+    recent_by_category = {category.id: [] for category, _, _ in category_rows}
+    if recent_limit > 0 and recent_by_category:
+        position = func.row_number().over(
+            partition_by=models.Expense.category_id,
+            order_by=(models.Expense.expense_date.desc(), models.Expense.id.desc())
+        ).label("position")
+        ranked = select(models.Expense.id, position).where(
+            models.Expense.category_id.in_(
+                select(models.BudgetCategory.id).where(models.BudgetCategory.budget_id == budget.id)
+            )
+        ).subquery()
+        recent = db.query(models.Expense).join(
+            ranked, ranked.c.id == models.Expense.id
+        ).filter(ranked.c.position <= recent_limit).order_by(
+            models.Expense.category_id, ranked.c.position
+        ).all()
+        for expense in recent:
+            recent_by_category[expense.category_id].append(expense)
+
+    # Amounts stay in storage units; BudgetTreeOut turns them into rupees
+    categories = []
+    total_spent = money.zero()
+    for category, spent, expense_count in category_rows:
+        allocated = money.stored(category, "allocated_amount")
+        total_spent += spent
+        categories.append({
+            "id": category.id,
+            "budget_id": category.budget_id,
+            "category_name": category.category_name,
+            "allocated_amount": allocated,
+            "spent_amount": spent,
+            "remaining_amount": allocated - spent,
+            "expense_count": expense_count,
+            "recent_expenses": recent_by_category[category.id]
+        })
+
+    total_allocated = money.stored(budget, "total_allocated")
+    return {
+        "id": budget.id,
+        "village_id": budget.village_id,
+        "year": budget.year,
+        "total_allocated": total_allocated,
+        "spent_amount": total_spent,
+        "remaining_amount": total_allocated - total_spent,
+        "categories": categories
+    }
+
+
 def get_remaining_budget_by_category(db: Session, category_id: int) -> dict:
     """
     Calculate remaining budget for a category using SQL aggregation.
@@ -286,14 +853,14 @@ def get_remaining_budget_by_category(db: Session, category_id: int) -> dict:
     
     # Calculate total spent using SQL aggregation
     total_spent = db.query(
-        func.coalesce(func.sum(models.Expense.amount), 0)
+        func.coalesce(func.sum(money.column(models.Expense.amount)), 0)
     ).filter(
         models.Expense.category_id == category_id
     ).scalar()
     
-    # Convert to Decimal for consistent currency handling
-    allocated = Decimal(str(category.allocated_amount))
-    spent = Decimal(str(total_spent))
+    # In storage units; RemainingBudgetOut turns them into rupees
+    allocated = money.stored(category, "allocated_amount")
+    spent = total_spent
     remaining = allocated - spent
     
     return {
@@ -303,3 +870,491 @@ def get_remaining_budget_by_category(db: Session, category_id: int) -> dict:
         "spent_amount": spent,
         "remaining_amount": remaining
     }
+
+
+# ============ Audit ============
+
+def _audit(db: Session, action: str, entity: str, entity_id: int, before=None, after=None) -> None:
+    """Record a committed write, attributed to the user the session acts for"""
+    audit.record(action, entity, entity_id, db.info.get("user_id"), before=before, after=after)
+
+
+def _update_returning_before(db: Session, model, row_id: int, update_data: dict) -> tuple:
+    """
+    UPDATE one row and return it with the old values of the updated fields
+    (for the audit log), or (None, None) if it does not exist. On Postgres
+    this is one statement: a FOR UPDATE subquery reads the old values and
+    locks the row, the UPDATE joins it and RETURNING gives back both. SQLite
+    cannot return columns of a joined table, so the row is read first; its
+    single writer fails the UPDATE rather than let a write slip in between.
+    """
+    fields = list(update_data)
+    values = money.with_paise(update_data)
+    if db.bind.dialect.name == "postgresql":
+        old = select(model.id, *[getattr(model, field) for field in fields]).where(
+            model.id == row_id
+        ).with_for_update().subquery("old")
+        row = db.execute(
+            update(model).where(model.id == old.c.id).values(**values)
+            .returning(model, *[old.c[field].label(f"old_{field}") for field in fields]),
+            execution_options={"synchronize_session": False}
+        ).one_or_none()
+        if row is None:
+            return None, None
+        return row[0], {field: row._mapping[f"old_{field}"] for field in fields}
+
+    before = db.query(*[getattr(model, field) for field in fields]).filter(
+        model.id == row_id
+    ).with_for_update().first()
+    if before is None:
+        return None, None
+    updated = db.scalars(
+        update(model).where(model.id == row_id).values(**values).returning(model)
+    ).one_or_none()
+    return updated, dict(before._mapping)
+
+
+def _audit_update(db: Session, entity: str, row, before: dict) -> None:
+    """Record the fields an UPDATE ... RETURNING actually changed"""
+    old, new = audit.diff(before, {field: getattr(row, field) for field in before})
+    if new:
+        _audit(db, "update", entity, row.id, before=old, after=new)
+
+
+def get_audit_log(
+    db: Session,
+    entity: Optional[str] = None,
+    entity_id: Optional[int] = None,
+    skip: int = 0,
+    limit: int = 100
+) -> List[models.AuditLog]:
+    """Audit entries, newest first, optionally for one entity type or row"""
+    query = db.query(models.AuditLog)
+    if entity is not None:
+        query = query.filter(models.AuditLog.entity == entity)
+    if entity_id is not None:
+        query = query.filter(models.AuditLog.entity_id == entity_id)
+    return query.order_by(models.AuditLog.ts.desc(), models.AuditLog.id.desc()).offset(skip).limit(limit).all()
+
+
+# ============ Annual Statements ============
+
+def compute_statement(db: Session, budget: models.Budget) -> schemas.StatementOut:
+    """A budget's statement computed live with one grouped query"""
+    rows = db.query(
+        models.BudgetCategory.id,
+        models.BudgetCategory.category_name,
+        money.column(models.BudgetCategory.allocated_amount).label("allocated_amount"),
+        func.coalesce(func.sum(money.column(models.Expense.amount)), 0).label("spent")
+    ).outerjoin(
+        models.Expense, models.Expense.category_id == models.BudgetCategory.id
+    ).filter(
+        models.BudgetCategory.budget_id == budget.id
+    ).group_by(
+        models.BudgetCategory.id,
+        models.BudgetCategory.category_name,
+        money.column(models.BudgetCategory.allocated_amount)
+    ).order_by(models.BudgetCategory.category_name).all()
+
+    # Totals are summed in storage units before the schemas turn them into rupees
+    categories = [
+        schemas.StatementCategory(
+            id=row.id,
+            category_name=row.category_name,
+            allocated_amount=row.allocated_amount,
+            spent=row.spent,
+            remaining=row.allocated_amount - row.spent
+        )
+        for row in rows
+    ]
+    spent = sum((row.spent for row in rows), money.zero())
+    total_allocated = money.stored(budget, "total_allocated")
+    return schemas.StatementOut(
+        village_id=budget.village_id,
+        year=budget.year,
+        budget_id=budget.id,
+        total_allocated=total_allocated,
+        categories_allocated=sum((row.allocated_amount for row in rows), money.zero()),
+        spent=spent,
+        remaining=total_allocated - spent,
+        categories=categories,
+        computed_at=datetime.utcnow()
+    )
+
+
+def rebuild_statement(db: Session, village_id: int, year: int) -> Optional[str]:
+    """Recompute and store a statement; returns its JSON, or None if there is no such budget"""
+    budget = db.query(models.Budget).filter(
+        models.Budget.village_id == village_id,
+        models.Budget.year == year
+    ).first()
+    if budget is None:
+        return None
+
+    # The row has to exist before computing so writes made meanwhile bump its version
+    db.execute(
+        _dialect_insert(db, models.AnnualStatement).values(
+            budget_id=budget.id, village_id=village_id, year=year, stale=True, version=0
+        ).on_conflict_do_nothing()
+    )
+    db.commit()
+    version = db.query(models.AnnualStatement.version).filter(
+        models.AnnualStatement.budget_id == budget.id
+    ).scalar()
+
+    statement = compute_statement(db, budget)
+    payload = statement.model_dump_json()
+    db.execute(
+        update(models.AnnualStatement)
+        .where(models.AnnualStatement.budget_id == budget.id, models.AnnualStatement.version == version)
+        .values(payload=payload, stale=False, computed_at=statement.computed_at),
+        execution_options={"synchronize_session": False}
+    )
+    db.commit()
+    return payload
+
+
+def get_annual_statement(db: Session, village_id: int, year: int) -> Optional[str]:
+    """A village's statement for a year as JSON: one row read when fresh, rebuilt when stale"""
+    row = db.query(models.AnnualStatement.payload, models.AnnualStatement.stale).filter(
+        models.AnnualStatement.village_id == village_id,
+        models.AnnualStatement.year == year
+    ).first()
+    if row is not None and not row.stale:
+        return row.payload
+    return rebuild_statement(db, village_id, year)
+
+
+def get_stale_statement_villages(db: Session, year: int) -> List[int]:
+    """Villages whose statement for the year is stale or was never built"""
+    return [
+        village_id for (village_id,) in db.query(models.Budget.village_id).outerjoin(
+            models.AnnualStatement, models.AnnualStatement.budget_id == models.Budget.id
+        ).filter(
+            models.Budget.year == year,
+            (models.AnnualStatement.id.is_(None)) | (models.AnnualStatement.stale.is_(True))
+        ).order_by(models.Budget.village_id)
+    ]
+
+
+# ============ Sync ============
+
+def record_deletion(db: Session, entity: str, entity_id: int, village_id: int) -> None:
+    """
+    Leave a tombstone for a deleted row in the current transaction.
+    Rows removed by ON DELETE CASCADE get no tombstone of their own; clients
+    drop everything under a deleted village, budget or category.
+    """
+    db.add(models.DeletedRecord(entity=entity, entity_id=entity_id, village_id=village_id))
+
+
+def record_moves(db: Session, entity: str, moves: List[tuple], village_id: int) -> None:
+    """
+    Tombstones for rows that moved into village_id, given as (entity_id,
+    previous village_id) pairs: to clients of the village a row left, it is
+    deleted. Tombstones a row left in village_id when it moved out earlier
+    are removed, since it is live there again.
+    """
+    moves = [(entity_id, previous) for entity_id, previous in moves if previous != village_id]
+    if not moves:
+        return
+    db.execute(insert(models.DeletedRecord), [
+        {"entity": entity, "entity_id": entity_id, "village_id": previous} for entity_id, previous in moves
+    ])
+    db.execute(
+        delete(models.DeletedRecord).where(
+            models.DeletedRecord.entity == entity,
+            models.DeletedRecord.entity_id.in_([entity_id for entity_id, _ in moves]),
+            models.DeletedRecord.village_id == village_id
+        ),
+        execution_options={"synchronize_session": False}
+    )
+
+
+def get_changes_since(db: Session, village_id: int, since: Union[int, datetime, None]) -> dict:
+    """
+    Rows of a village changed since `since` (everything when None) plus
+    tombstones. `since` is a change version from change_versions.current_token,
+    or the timestamp of a token issued before change versions existed.
+    """
+    villages = db.query(models.Village).filter(models.Village.id == village_id)
+    budgets = db.query(models.Budget).filter(models.Budget.village_id == village_id)
+    categories = db.query(models.BudgetCategory).join(
+        models.Budget, models.BudgetCategory.budget_id == models.Budget.id
+    ).filter(models.Budget.village_id == village_id)
+    expenses = db.query(models.Expense).join(
+        models.BudgetCategory, models.Expense.category_id == models.BudgetCategory.id
+    ).join(
+        models.Budget, models.BudgetCategory.budget_id == models.Budget.id
+    ).filter(models.Budget.village_id == village_id)
+    deleted = db.query(models.DeletedRecord).filter(models.DeletedRecord.village_id == village_id)
+
+    if isinstance(since, datetime):
+        villages = villages.filter(models.Village.updated_at > since)
+        budgets = budgets.filter(models.Budget.updated_at > since)
+        categories = categories.filter(models.BudgetCategory.updated_at > since)
+        expenses = expenses.filter(models.Expense.updated_at > since)
+        deleted = deleted.filter(models.DeletedRecord.deleted_at > since)
+    elif since is not None:
+        villages = villages.filter(models.Village.change_version >= since)
+        budgets = budgets.filter(models.Budget.change_version >= since)
+        categories = categories.filter(models.BudgetCategory.change_version >= since)
+        expenses = expenses.filter(models.Expense.change_version >= since)
+        deleted = deleted.filter(models.DeletedRecord.change_version >= since)
+
+    return {
+        "villages": villages.all(),
+        "budgets": budgets.all(),
+        "categories": categories.all(),
+        "expenses": expenses.all(),
+        # A full sync replaces the client's copy, so old tombstones are irrelevant
+        "deleted": deleted.all() if since is not None else []
+    }
+
+
+# ============ Rollups ============
+
+ROLLUP_LEVELS = ("state", "district", "village")
+
+
+def get_spend_rollup(
+    db: Session,
+    level: str,
+    year: Optional[int] = None,
+    state: Optional[str] = None,
+    district: Optional[str] = None
+) -> List[dict]:
+    """
+    Allocated and spent totals per state, district or village using one
+    grouped SQL statement. Expenses are summed per budget in a subquery
+    first so joining them does not multiply the budget allocations; the
+    filters apply to the subquery too, so it only sums the budgets reported.
+    """
+    conditions = []
+    if year is not None:
+        conditions.append(models.Budget.year == year)
+    if state is not None:
+        conditions.append(models.Village.state == state)
+    if district is not None:
+        conditions.append(models.Village.district == district)
+
+    spent_by_budget = db.query(
+        models.BudgetCategory.budget_id.label("budget_id"),
+        func.sum(money.column(models.Expense.amount)).label("spent")
+    ).join(
+        models.Expense, models.Expense.category_id == models.BudgetCategory.id
+    ).join(
+        models.Budget, models.Budget.id == models.BudgetCategory.budget_id
+    ).join(
+        models.Village, models.Village.id == models.Budget.village_id
+    ).filter(*conditions).group_by(models.BudgetCategory.budget_id).subquery()
+
+    if level == "state":
+        group_columns = [models.Village.state]
+    elif level == "district":
+        group_columns = [models.Village.state, models.Village.district]
+    else:
+        group_columns = [
+            models.Village.state,
+            models.Village.district,
+            models.Village.id,
+            models.Village.name,
+        ]
+
+    query = db.query(
+        *group_columns,
+        func.count(func.distinct(models.Village.id)).label("village_count"),
+        func.count(models.Budget.id).label("budget_count"),
+        func.coalesce(func.sum(money.column(models.Budget.total_allocated)), 0).label("allocated"),
+        func.coalesce(func.sum(spent_by_budget.c.spent), 0).label("spent")
+    ).select_from(models.Village).join(
+        models.Budget, models.Budget.village_id == models.Village.id
+    ).outerjoin(
+        spent_by_budget, spent_by_budget.c.budget_id == models.Budget.id
+    ).filter(*conditions)
+
+    rows = query.group_by(*group_columns).order_by(*group_columns).all()
+
+    nodes = []
+    for row in rows:
+        # In storage units; RollupNode turns them into rupees
+        allocated, spent = row.allocated, row.spent
+        nodes.append({
+            "state": row.state,
+            "district": row.district if level != "state" else None,
+            "village_id": row.id if level == "village" else None,
+            "village_name": row.name if level == "village" else None,
+            "village_count": row.village_count,
+            "budget_count": row.budget_count,
+            "allocated": allocated,
+            "spent": spent,
+            "utilization": float(spent / allocated) if allocated else 0.0
+        })
+    return nodes
+
+
+YOY_MAX_YEARS = 10
+
+
+def get_year_over_year(db: Session, years: List[int], village_id: Optional[int] = None) -> dict:
+    """
+    Allocated and spent per category name and year, for one village or all
+    villages, with the change from each requested year to the next. Uses
+    one grouped SQL statement; expenses are summed per category first (for
+    the requested budgets only) so joining them does not multiply the
+    allocations. A category missing from a year counts as zero there.
+    """
+    years = sorted(set(years))
+    conditions = [models.Budget.year.in_(years)]
+    if village_id is not None:
+        conditions.append(models.Budget.village_id == village_id)
+
+    spent_by_category = db.query(
+        models.Expense.category_id.label("category_id"),
+        func.sum(money.column(models.Expense.amount)).label("spent")
+    ).join(
+        models.BudgetCategory, models.BudgetCategory.id == models.Expense.category_id
+    ).join(
+        models.Budget, models.Budget.id == models.BudgetCategory.budget_id
+    ).filter(*conditions).group_by(models.Expense.category_id).subquery()
+
+    rows = db.query(
+        models.Budget.year,
+        models.BudgetCategory.category_name,
+        func.sum(money.column(models.BudgetCategory.allocated_amount)).label("allocated"),
+        func.coalesce(func.sum(spent_by_category.c.spent), 0).label("spent")
+    ).select_from(models.Budget).join(
+        models.BudgetCategory, models.BudgetCategory.budget_id == models.Budget.id
+    ).outerjoin(
+        spent_by_category, spent_by_category.c.category_id == models.BudgetCategory.id
+    ).filter(*conditions).group_by(
+        models.Budget.year, models.BudgetCategory.category_name
+    ).order_by(models.BudgetCategory.category_name).all()
+
+    # Amounts stay in storage units; YearOverYearOut turns them into rupees
+    amounts = {}
+    for row in rows:
+        amounts.setdefault(row.category_name, {})[row.year] = (row.allocated, row.spent)
+
+    def compare(by_year: dict) -> List[dict]:
+        result, previous = [], None
+        for year in years:
+            allocated, spent = by_year.get(year, (money.zero(), money.zero()))
+            result.append({
+                "year": year,
+                "allocated": allocated,
+                "spent": spent,
+                "allocated_change": allocated - previous[0] if previous else None,
+                "spent_change": spent - previous[1] if previous else None,
+            })
+            previous = (allocated, spent)
+        return result
+
+    totals = {
+        year: (
+            sum((by_year[year][0] for by_year in amounts.values() if year in by_year), money.zero()),
+            sum((by_year[year][1] for by_year in amounts.values() if year in by_year), money.zero()),
+        )
+        for year in years
+    }
+    return {
+        "years": years,
+        "categories": [
+            {"category_name": name, "years": compare(by_year)} for name, by_year in amounts.items()
+        ],
+        "totals": compare(totals)
+    }
+
+
+def get_annual_report_rows(db: Session, year: int, village_ids: List[int]) -> list:
+    """Allocated and spent per category for the given villages' budgets of one year"""
+    # Summed for this batch's budgets only, not every expense in the database
+    spent_by_category = db.query(
+        models.Expense.category_id.label("category_id"),
+        func.sum(money.column(models.Expense.amount)).label("spent")
+    ).join(
+        models.BudgetCategory, models.BudgetCategory.id == models.Expense.category_id
+    ).join(
+        models.Budget, models.Budget.id == models.BudgetCategory.budget_id
+    ).filter(
+        models.Budget.year == year,
+        models.Budget.village_id.in_(village_ids)
+    ).group_by(models.Expense.category_id).subquery()
+
+    return db.query(
+        models.Village.state,
+        models.Village.district,
+        models.Village.id.label("village_id"),
+        models.Village.name.label("village_name"),
+        money.column(models.Budget.total_allocated).label("budget_allocated"),
+        models.BudgetCategory.category_name,
+        money.column(models.BudgetCategory.allocated_amount).label("allocated_amount"),
+        func.coalesce(spent_by_category.c.spent, 0).label("spent")
+    ).select_from(models.Village).join(
+        models.Budget, models.Budget.village_id == models.Village.id
+    ).join(
+        models.BudgetCategory, models.BudgetCategory.budget_id == models.Budget.id
+    ).outerjoin(
+        spent_by_category, spent_by_category.c.category_id == models.BudgetCategory.id
+    ).filter(
+        models.Budget.year == year,
+        models.Village.id.in_(village_ids)
+    ).order_by(
+        models.Village.state, models.Village.district, models.Village.id, models.BudgetCategory.category_name
+    ).all()
+
+
+# ============ Cache Invalidation ============
+
+def get_village_lineage(db: Session, village_id: int, budget_id: Optional[int] = None) -> Optional[cache.Lineage]:
+    """Resolve a village's state and district, memoized in the cache module"""
+    parents = cache.village_parents.get(village_id)
+    if parents is None:
+        row = db.query(models.Village.state, models.Village.district).filter(
+            models.Village.id == village_id
+        ).first()
+        if row is None:
+            return None
+        parents = cache.village_parents[village_id] = (row.state, row.district)
+    return cache.Lineage(village_id, parents[0], parents[1], budget_id)
+
+
+def get_budget_lineage(db: Session, budget_id: int) -> Optional[cache.Lineage]:
+    """Resolve the village, district and state a budget belongs to"""
+    village_id = cache.budget_parents.get(budget_id)
+    if village_id is None:
+        village_id = db.query(models.Budget.village_id).filter(
+            models.Budget.id == budget_id
+        ).scalar()
+        if village_id is None:
+            return None
+        cache.budget_parents[budget_id] = village_id
+    return get_village_lineage(db, village_id, budget_id)
+
+
+def get_category_lineage(db: Session, category_id: int) -> Optional[cache.Lineage]:
+    """Resolve the budget, village, district and state a category belongs to"""
+    budget_id = cache.category_parents.get(category_id)
+    if budget_id is None:
+        row = db.query(
+            models.BudgetCategory.budget_id,
+            models.Budget.village_id,
+            models.Village.state,
+            models.Village.district
+        ).join(
+            models.Budget, models.BudgetCategory.budget_id == models.Budget.id
+        ).join(
+            models.Village, models.Budget.village_id == models.Village.id
+        ).filter(models.BudgetCategory.id == category_id).first()
+        if row is None:
+            return None
+        budget_id = cache.category_parents[category_id] = row.budget_id
+        cache.budget_parents[row.budget_id] = row.village_id
+        cache.village_parents[row.village_id] = (row.state, row.district)
+    return get_budget_lineage(db, budget_id)
+
+
+def invalidate_lineage(db: Session, lineage: Optional[cache.Lineage]) -> None:
+    """Bump the cache version of every scope above a changed row, in every worker, once db commits"""
+    if lineage is not None:
+        bus.publish(db, "bump", scopes=cache.scopes_for(lineage))
@@ -1,21 +1,213 @@
-﻿from sqlalchemy import create_engine
+﻿from sqlalchemy import create_engine, text
+from sqlalchemy.engine import URL, Engine, make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
 from dotenv import load_dotenv
+from functools import cached_property, lru_cache
+import itertools
+import logging
 import os
+import threading
+import time
+from typing import List, Optional, Union
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Postgres in production; SQLite works too, either a file
+# (sqlite:///./village.db) or in memory (sqlite://) for tests and benchmarks
 DATABASE_URL = os.getenv("DATABASE_URL")
+# Log every SQL statement; useful when debugging, slow otherwise
+SQL_ECHO = os.getenv("SQL_ECHO", "false").lower() == "true"
 
-engine = create_engine(
-    DATABASE_URL,
-    echo=True  # set False later
-)
+# Optional read replicas, comma separated. Any SQLAlchemy URL works, so two
+# local SQLite files or two local Postgres instances are enough for testing.
+REPLICA_DATABASE_URLS = [
+    url.strip() for url in os.getenv("REPLICA_DATABASE_URLS", "").split(",") if url.strip()
+]
+# A replica lagging further behind the primary than this is taken out of rotation
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+# How often each replica's lag is re-measured
+REPLICA_CHECK_INTERVAL_SECONDS = float(os.getenv("REPLICA_CHECK_INTERVAL_SECONDS", "10"))
+# After a write, the same client reads from the primary for this long
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "10"))
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "alembic.ini")
+
+_engine: Optional[Engine] = None
+_engine_lock = threading.Lock()
+
+
+def is_in_memory(url: Union[str, URL, None] = None) -> bool:
+    """Whether a URL (DATABASE_URL by default) is an in-memory SQLite database"""
+    url = make_url(url or DATABASE_URL)
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+class LazySessionmaker(sessionmaker):
+    """A sessionmaker that creates its engine when the first session is made"""
+
+    def __init__(self, create_bind, **kw):
+        super().__init__(**kw)
+        self._create_bind = create_bind
+
+    def __call__(self, **local_kw):
+        if self.kw.get("bind") is None:
+            self._create_bind()
+        return super().__call__(**local_kw)
+
+
+def make_engine(url: Union[str, URL], **kw) -> Engine:
+    """Create an engine for URL, with the adjustments SQLite needs (see sqlite_compat)"""
+    url = make_url(url)
+    if url.get_backend_name() != "sqlite":
+        return create_engine(url, **kw)
+
+    from . import sqlite_compat
+    return sqlite_compat.configure(create_engine(url, **sqlite_compat.engine_options(is_in_memory(url), kw)))
+
+
+def get_engine() -> Engine:
+    """
+    The primary engine, created on first use. Importing the app therefore
+    loads no DB driver, and scripts and cold starts that never touch the
+    database do not pay for one.
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = make_engine(DATABASE_URL, echo=SQL_ECHO)
+                SessionLocal.configure(bind=_engine)
+    return _engine
+
+
+@lru_cache(maxsize=None)
+def backend_name() -> str:
+    """Database backend of DATABASE_URL (e.g. "postgresql"), without creating the engine"""
+    return make_url(DATABASE_URL).get_backend_name()
+
+
+def migrate(revision: str = "head") -> None:
+    """
+    Run the Alembic migrations through the app's engine. Equivalent to
+    `alembic upgrade head`, but also reaches an in-memory database, which no
+    other process can open.
+    """
+    from alembic import command
+    from alembic.config import Config
 
-SessionLocal = sessionmaker(
+    config = Config(ALEMBIC_INI)
+    with get_engine().connect() as connection:
+        config.attributes["connection"] = connection
+        command.upgrade(config, revision)
+
+
+def __getattr__(name: str):
+    # `from app.database import engine` keeps working and creates it on demand
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Writes use INSERT/UPDATE ... RETURNING, so objects are already current after
+# commit and expiring them would only cost a refresh SELECT on next access.
+SessionLocal = LazySessionmaker(
+    get_engine,
     autocommit=False,
     autoflush=False,
-    bind=engine
+    expire_on_commit=False
 )
 
 Base = declarative_base()
+
+
+# Replication lag in seconds on a Postgres standby. A standby that has replayed
+# everything it received counts as caught up even if the primary is idle.
+POSTGRES_LAG_QUERY = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+
+class Replica:
+    """A read replica engine with its last measured replication lag"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.lag: Optional[float] = None
+        self.healthy = True
+        self.checked_at = float("-inf")
+        self._check_lock = threading.Lock()
+
+    @cached_property
+    def engine(self) -> Engine:
+        return make_engine(self.url, pool_pre_ping=True, echo=SQL_ECHO)
+
+    @cached_property
+    def SessionLocal(self) -> sessionmaker:
+        return sessionmaker(
+            autocommit=False,
+            autoflush=False,
+            bind=self.engine,
+            info={"replica": True}
+        )
+
+    def measure_lag(self) -> float:
+        """Seconds this replica is behind the primary"""
+        with self.engine.connect() as connection:
+            if self.engine.dialect.name == "postgresql":
+                return float(connection.execute(POSTGRES_LAG_QUERY).scalar() or 0)
+            # Other backends have no replication to measure; just check it answers
+            connection.execute(text("SELECT 1"))
+            return 0.0
+
+    def refresh(self) -> None:
+        """Re-measure lag if the last check is older than the check interval"""
+        if time.monotonic() - self.checked_at < REPLICA_CHECK_INTERVAL_SECONDS:
+            return
+        # Only one request re-measures; the others use the previous result
+        if not self._check_lock.acquire(blocking=False):
+            return
+        try:
+            try:
+                self.lag = self.measure_lag()
+                healthy = self.lag <= REPLICA_MAX_LAG_SECONDS
+            except Exception:
+                logger.exception("Replica health check failed for %s", self.engine.url)
+                self.lag = None
+                healthy = False
+            if healthy != self.healthy:
+                logger.warning(
+                    "Replica %s %s rotation (lag=%s)",
+                    self.engine.url, "back in" if healthy else "taken out of", self.lag
+                )
+            self.healthy = healthy
+            self.checked_at = time.monotonic()
+        finally:
+            self._check_lock.release()
+
+
+class ReplicaPool:
+    """Round-robins read sessions across the replicas that are keeping up"""
+
+    def __init__(self, urls: List[str]):
+        self.replicas = [Replica(url) for url in urls]
+        self._cycle = itertools.cycle(self.replicas)
+        self._lock = threading.Lock()
+
+    def choose(self) -> Optional[Replica]:
+        """Next healthy replica, or None when reads should go to the primary"""
+        for _ in range(len(self.replicas)):
+            with self._lock:
+                replica = next(self._cycle)
+            replica.refresh()
+            if replica.healthy:
+                return replica
+        return None
+
+
+replicas = ReplicaPool(REPLICA_DATABASE_URLS)
@@ -1,10 +1,17 @@
-﻿from typing import Generator, Optional
+﻿import time
+from typing import Generator, Optional
 from sqlalchemy.orm import Session
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
-from .database import SessionLocal
-from . import crud, models
+from .database import READ_YOUR_WRITES_SECONDS, SessionLocal, replicas
+from . import crud, schemas
+
+# Set on responses to writes and sent back by the client on its requests;
+# while it is in the future the client's reads are pinned to the primary so
+# it sees its own changes. A header rather than a cookie, so it also works
+# for a frontend on another origin.
+PRIMARY_PIN_HEADER = "X-Read-Primary-Until"
 
 
 def get_db() -> Generator[Session, None, None]:
@@ -19,6 +26,34 @@ def get_db() -> Generator[Session, None, None]:
         db.close()
 
 
+def is_pinned_to_primary(request: Request) -> bool:
+    """Whether this client wrote recently enough to need read-your-writes"""
+    pinned_until = request.headers.get(PRIMARY_PIN_HEADER)
+    if pinned_until is None:
+        return False
+    try:
+        pinned_until = float(pinned_until)
+    except ValueError:
+        return False
+    now = time.time()
+    # The client controls the value, so it cannot pin itself for longer than a write would
+    return now < pinned_until <= now + READ_YOUR_WRITES_SECONDS + 1
+
+
+def get_read_db(request: Request) -> Generator[Session, None, None]:
+    """
+    Dependency for read-only handlers. Sessions are round-robined across
+    healthy read replicas, falling back to the primary when none are
+    configured or keeping up, or when the client has just written.
+    """
+    replica = None if is_pinned_to_primary(request) else replicas.choose()
+    db = replica.SessionLocal() if replica is not None else SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
 # Security
 security = HTTPBearer()
 
@@ -26,8 +61,12 @@ security = HTTPBearer()
 def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: Session = Depends(get_db)
-) -> models.User:
-    """Get the current authenticated user from JWT token"""
+) -> schemas.CurrentUser:
+    """
+    Get the current authenticated user from the JWT claims. Role and village
+    come from the signed token; only the token version and active flag are
+    checked against the database, through a short-lived cache.
+    """
     token = credentials.credentials
     
     # Verify token
@@ -39,36 +78,51 @@ def get_current_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    # Get user ID from token
-    user_id: Optional[int] = payload.get("sub")
-    if user_id is None:
+    # Tokens issued before claims were added carry only "sub"
+    user_id: Optional[str] = payload.get("sub")
+    if user_id is None or "role" not in payload or "ver" not in payload:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid authentication credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    # Get user from database
-    user = crud.get_user_by_id(db, user_id=int(user_id))
-    if user is None:
+    state = crud.get_token_state(db, user_id=int(user_id))
+    if state is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    if not user.is_active:
+    token_version, is_active = state
+    if not is_active:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Inactive user"
         )
     
-    return user
+    # Role or village changes bump the version, so the claims below are current
+    if payload["ver"] != token_version:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token has been revoked",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    # crud attributes audited writes made through this session to the user
+    db.info["user_id"] = int(user_id)
+    
+    return schemas.CurrentUser(
+        id=int(user_id),
+        role=payload["role"],
+        village_id=payload.get("village_id")
+    )
 
 
 def get_current_user_with_village(
-    current_user: models.User = Depends(get_current_user)
-) -> models.User:
+    current_user: schemas.CurrentUser = Depends(get_current_user)
+) -> schemas.CurrentUser:
     """Ensure the current user has a village assigned"""
     if current_user.village_id is None:
         raise HTTPException(
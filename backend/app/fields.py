@@ -0,0 +1,54 @@
+# fields.py
+"""
+Sparse fieldsets for list endpoints (`?fields=id,amount,expense_date`).
+
+The requested fields narrow both the SQL SELECT, by querying only those
+columns instead of whole ORM objects, and the JSON, by serializing the rows
+through a model containing only those fields.
+"""
+
+from functools import lru_cache
+from typing import List, Optional, Tuple, Type
+
+from fastapi import HTTPException, Response, status
+from pydantic import BaseModel, ConfigDict, TypeAdapter, create_model
+
+
+def parse_fields(fields: Optional[str], schema: Type[BaseModel]) -> Optional[Tuple[str, ...]]:
+    """Validate a comma separated field list against a schema; id is always included"""
+    if not fields:
+        return None
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in schema.model_fields]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(unknown)}. Available: {', '.join(schema.model_fields)}"
+        )
+    return tuple(dict.fromkeys(["id", *requested]))
+
+
+def select_fields(query, model, fields: Optional[Tuple[str, ...]]):
+    """Restrict a query to the requested columns"""
+    if not fields:
+        return query
+    return query.with_entities(*[getattr(model, field) for field in fields])
+
+
+@lru_cache(maxsize=128)
+def _partial_adapter(schema: Type[BaseModel], fields: Tuple[str, ...]) -> TypeAdapter:
+    partial = create_model(
+        f"{schema.__name__}Fields",
+        __config__=ConfigDict(from_attributes=True),
+        **{field: (schema.model_fields[field].annotation, ...) for field in fields}
+    )
+    return TypeAdapter(List[partial])
+
+
+def fields_response(schema: Type[BaseModel], fields: Tuple[str, ...], rows) -> Response:
+    """Serialize rows holding only the requested fields straight to JSON"""
+    adapter = _partial_adapter(schema, fields)
+    return Response(
+        content=adapter.dump_json(adapter.validate_python(rows, from_attributes=True)),
+        media_type="application/json"
+    )
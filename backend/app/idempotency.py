@@ -0,0 +1,293 @@
+# idempotency.py
+"""
+Idempotency-Key support for mutating endpoints.
+
+The first request with a given key claims it by inserting an `in_progress`
+row; the unique (user_id, key) constraint makes that insert the lock, so a
+concurrent duplicate on any worker fails to claim and waits for the first
+one to finish. A successful (2xx) response is then stored and replayed for
+every retry until the key expires, without running the handler again. Any
+other response releases the key: a 404 or 403 may not hold by the time the
+client retries, and replaying it for a day would hide that. Retries look the
+key up before inserting, so a replay reads one row and writes nothing.
+
+A claim is a lease: a request that dies without completing or releasing its
+key leaves an `in_progress` row behind, and once it is older than
+IDEMPOTENCY_LEASE_SECONDS a retry takes it over. The lease must therefore
+outlast the slowest request, or a live one may be run twice. Only the
+request holding the current claim may store a response or release the key.
+Expired keys are deleted by a background purger, off the request path.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response
+from sqlalchemy import delete, update
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from . import crud, models
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+IDEMPOTENCY_TTL_HOURS = float(os.getenv("IDEMPOTENCY_TTL_HOURS", "24"))
+# How long a duplicate waits for the original request before giving up with 409
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "10"))
+# An in_progress claim older than this is presumed abandoned and can be taken over
+IDEMPOTENCY_LEASE_SECONDS = float(os.getenv("IDEMPOTENCY_LEASE_SECONDS", "60"))
+PURGE_INTERVAL_SECONDS = 300
+
+MUTATING_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+# Login and registration responses contain tokens, which must not be stored
+EXCLUDED_PREFIXES = ("/auth",)
+
+_lock = threading.Lock()
+_stopping = threading.Event()
+_purger: Optional[threading.Thread] = None
+
+
+def _user_id_from_request(request: Request) -> Optional[int]:
+    """User ID of a valid bearer token, used to scope keys per user"""
+    authorization = request.headers.get("Authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    payload = crud.verify_access_token(token)
+    if payload is None or payload.get("sub") is None:
+        return None
+    return int(payload["sub"])
+
+
+def purge_expired() -> int:
+    """Delete expired keys. Returns the number deleted"""
+    db = SessionLocal()
+    try:
+        result = db.execute(
+            delete(models.IdempotencyKey).where(models.IdempotencyKey.expires_at < datetime.utcnow())
+        )
+        db.commit()
+        return result.rowcount
+    finally:
+        db.close()
+
+
+def _run() -> None:
+    while not _stopping.wait(PURGE_INTERVAL_SECONDS):
+        try:
+            purge_expired()
+        except Exception:
+            logger.exception("Failed to purge expired idempotency keys")
+
+
+def start() -> None:
+    """Start the background purger"""
+    global _purger
+    with _lock:
+        if _purger is not None:
+            return
+        _stopping.clear()
+        _purger = threading.Thread(target=_run, name="idempotency-purger", daemon=True)
+        _purger.start()
+
+
+def shutdown() -> None:
+    """Stop the purger"""
+    global _purger
+    if _purger is not None:
+        _stopping.set()
+        _purger.join()
+        _purger = None
+
+
+def _fresh_claim(request_hash: str, now: datetime) -> dict:
+    return {
+        "request_hash": request_hash,
+        "status": "in_progress",
+        "response_status": None,
+        "response_body": None,
+        "content_type": None,
+        "created_at": now,
+        "claimed_at": now,
+        "expires_at": now + timedelta(hours=IDEMPOTENCY_TTL_HOURS),
+    }
+
+
+def _matches(user_id: int, key: str, claimed_at: datetime) -> tuple:
+    """Conditions selecting a key only while this claim still holds it"""
+    return (
+        models.IdempotencyKey.user_id == user_id,
+        models.IdempotencyKey.key == key,
+        models.IdempotencyKey.claimed_at == claimed_at,
+    )
+
+
+def claim(
+    user_id: int, key: str, request_hash: str
+) -> Tuple[Optional[datetime], Optional[models.IdempotencyKey]]:
+    """
+    Claim a key for this request. Returns (claimed_at, None) when claimed,
+    where claimed_at identifies the claim to complete() and release();
+    otherwise (None, row) with the row an earlier request holds, in progress
+    or completed.
+    """
+    db = SessionLocal()
+    try:
+        for _ in range(3):
+            now = datetime.utcnow()
+            existing = db.query(models.IdempotencyKey).filter(
+                models.IdempotencyKey.user_id == user_id,
+                models.IdempotencyKey.key == key
+            ).first()
+
+            if existing is None:
+                inserted = db.execute(
+                    crud._dialect_insert(db, models.IdempotencyKey)
+                    .values(user_id=user_id, key=key, **_fresh_claim(request_hash, now))
+                    .on_conflict_do_nothing(index_elements=["user_id", "key"])
+                    .returning(models.IdempotencyKey.id)
+                ).first()
+                db.commit()
+                if inserted is not None:
+                    return now, None
+                # A concurrent request inserted it first; look at its row
+                continue
+
+            expired = existing.expires_at < now
+            abandoned = (
+                existing.status == "in_progress"
+                and existing.request_hash == request_hash
+                and existing.claimed_at < now - timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS)
+            )
+            if not expired and not abandoned:
+                return None, existing
+
+            # Take the row over, unless another retry got to it first
+            taken = db.execute(
+                update(models.IdempotencyKey)
+                .where(
+                    models.IdempotencyKey.id == existing.id,
+                    models.IdempotencyKey.claimed_at == existing.claimed_at
+                )
+                .values(**_fresh_claim(request_hash, now))
+            ).rowcount
+            db.commit()
+            if taken:
+                if abandoned and not expired:
+                    logger.warning("Took over abandoned idempotency key %r of user %d", key, user_id)
+                return now, None
+            db.expire_all()
+        raise RuntimeError(f"Could not claim idempotency key {key!r}")
+    finally:
+        db.close()
+
+
+def complete(
+    user_id: int, key: str, claimed_at: datetime, response_status: int, body: bytes, content_type: Optional[str]
+) -> None:
+    """Store the response of a claimed key"""
+    db = SessionLocal()
+    try:
+        stored = db.query(models.IdempotencyKey).filter(*_matches(user_id, key, claimed_at)).update({
+            "status": "completed",
+            "response_status": response_status,
+            "response_body": body.decode("utf-8"),
+            "content_type": content_type
+        })
+        db.commit()
+        if not stored:
+            logger.warning("Idempotency key %r of user %d was taken over before its response was stored", key, user_id)
+    finally:
+        db.close()
+
+
+def release(user_id: int, key: str, claimed_at: datetime) -> None:
+    """Give a claimed key up after a failure so the client can retry it"""
+    db = SessionLocal()
+    try:
+        db.query(models.IdempotencyKey).filter(*_matches(user_id, key, claimed_at)).delete()
+        db.commit()
+    finally:
+        db.close()
+
+
+def _replay(row: models.IdempotencyKey) -> Response:
+    return Response(
+        content=row.response_body,
+        status_code=row.response_status,
+        media_type=row.content_type,
+        headers={"Idempotent-Replayed": "true"}
+    )
+
+
+class IdempotencyMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if (
+            key is None
+            or request.method not in MUTATING_METHODS
+            or request.url.path.startswith(EXCLUDED_PREFIXES)
+        ):
+            return await call_next(request)
+
+        user_id = _user_id_from_request(request)
+        if user_id is None:
+            # Let the handler reject the request as unauthenticated
+            return await call_next(request)
+        if len(key) > 255:
+            return JSONResponse(status_code=400, content={"detail": f"{IDEMPOTENCY_HEADER} is too long"})
+
+        body = await request.body()
+        request_hash = hashlib.sha256(
+            b"\n".join([request.method.encode(), str(request.url.path).encode(), request.url.query.encode(), body])
+        ).hexdigest()
+
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+        while True:
+            claimed_at, existing = await run_in_threadpool(claim, user_id, key, request_hash)
+            if existing is None:
+                break
+            if existing.request_hash != request_hash:
+                return JSONResponse(
+                    status_code=422,
+                    content={"detail": f"{IDEMPOTENCY_HEADER} was already used for a different request"}
+                )
+            if existing.status == "completed":
+                return _replay(existing)
+            if time.monotonic() >= deadline:
+                return JSONResponse(
+                    status_code=409,
+                    content={"detail": "A request with this Idempotency-Key is still in progress"},
+                    headers={"Retry-After": "1"}
+                )
+            await asyncio.sleep(0.2)
+
+        try:
+            response = await call_next(request)
+        except Exception:
+            await run_in_threadpool(release, user_id, key, claimed_at)
+            raise
+
+        if not 200 <= response.status_code < 300:
+            await run_in_threadpool(release, user_id, key, claimed_at)
+            return response
+
+        response_body = b"".join([chunk async for chunk in response.body_iterator])
+        await run_in_threadpool(
+            complete, user_id, key, claimed_at, response.status_code, response_body, response.headers.get("content-type")
+        )
+
+        async def stored_body():
+            yield response_body
+
+        response.body_iterator = stored_body()
+        return response
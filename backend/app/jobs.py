@@ -0,0 +1,229 @@
+# jobs.py
+"""
+In-process background jobs for work too slow for the request thread.
+
+Jobs are rows in the `jobs` table, so their status survives restarts and any
+worker can answer a poll. Each process runs them on a thread pool of
+JOB_CONCURRENCY threads; a job is claimed with a conditional UPDATE before it
+runs, so it never runs twice even if it is submitted twice. Handlers are
+registered per kind with @handler and write their artifact under
+ARTIFACTS_DIR.
+
+A running job holds a lease: a heartbeat thread refreshes heartbeat_at of
+this process's jobs every third of JOB_LEASE_SECONDS. Any worker requeues a
+running job whose heartbeat is older than the lease, since the process that
+ran it has died, or fails it once it has been tried JOB_MAX_ATTEMPTS times.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional, Set
+
+from sqlalchemy import func, insert, update
+
+from . import metrics, models
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "2"))
+ARTIFACTS_DIR = os.path.abspath(os.getenv("ARTIFACTS_DIR", "artifacts"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+# A handler receives a session, the job row, its params and a progress
+# callback taking a fraction in [0, 1]; it returns the artifact path or None.
+Handler = Callable[..., Optional[str]]
+
+_handlers: Dict[str, Handler] = {}
+_executor: Optional[ThreadPoolExecutor] = None
+
+# Ids of the jobs this process is running, whose leases the heartbeat renews
+_running: Set[int] = set()
+_running_lock = threading.Lock()
+_stopping = threading.Event()
+
+
+def handler(kind: str) -> Callable[[Handler], Handler]:
+    """Register the function that runs jobs of this kind"""
+    def register(function: Handler) -> Handler:
+        _handlers[kind] = function
+        return function
+    return register
+
+
+def start() -> None:
+    """Start the worker pool and pick up jobs left queued or abandoned by a previous run"""
+    global _executor
+    if _executor is not None:
+        return
+    os.makedirs(ARTIFACTS_DIR, exist_ok=True)
+    _stopping.clear()
+    _executor = ThreadPoolExecutor(max_workers=JOB_CONCURRENCY, thread_name_prefix="job")
+    # Looked up on the pool so startup does not wait for the database
+    _executor.submit(_resume_queued)
+    threading.Thread(target=_keep_leases, name="job-heartbeat", daemon=True).start()
+
+
+def _resume_queued() -> None:
+    db = SessionLocal()
+    try:
+        reclaim_expired(db)
+        queued = db.query(models.Job.id).filter(models.Job.status == "queued").order_by(models.Job.id).all()
+    finally:
+        db.close()
+    for (job_id,) in queued:
+        _executor.submit(_run, job_id)
+
+
+def _keep_leases() -> None:
+    """Renew the leases of this process's jobs and reclaim expired ones, until shutdown"""
+    while not _stopping.wait(JOB_LEASE_SECONDS / 3):
+        db = SessionLocal()
+        try:
+            with _running_lock:
+                running = list(_running)
+            if running:
+                db.execute(
+                    update(models.Job)
+                    .where(models.Job.id.in_(running), models.Job.status == "running")
+                    .values(heartbeat_at=datetime.utcnow())
+                )
+                db.commit()
+            for job_id in reclaim_expired(db):
+                _executor.submit(_run, job_id)
+        except Exception:
+            db.rollback()
+            logger.exception("Renewing job leases failed")
+        finally:
+            db.close()
+
+
+def reclaim_expired(db) -> list:
+    """
+    Requeue running jobs whose lease expired, failing those already tried
+    JOB_MAX_ATTEMPTS times, and return the ids of the requeued ones
+    """
+    now = datetime.utcnow()
+    expired = (
+        models.Job.status == "running",
+        func.coalesce(models.Job.heartbeat_at, models.Job.started_at) < now - timedelta(seconds=JOB_LEASE_SECONDS),
+    )
+    failed = db.execute(
+        update(models.Job)
+        .where(*expired, models.Job.attempts >= JOB_MAX_ATTEMPTS)
+        .values(status="failed", finished_at=now, error="The worker running the job stopped")
+        .returning(models.Job.id, models.Job.kind)
+    ).all()
+    requeued = db.execute(
+        update(models.Job).where(*expired).values(status="queued").returning(models.Job.id, models.Job.kind)
+    ).all()
+    db.commit()
+    for job_id, kind in failed:
+        logger.warning("Job %s (%s) failed: its worker stopped %d times", job_id, kind, JOB_MAX_ATTEMPTS)
+        metrics.increment(f"jobs.{kind}.failed")
+    for job_id, kind in requeued:
+        logger.warning("Job %s (%s) requeued: its worker stopped", job_id, kind)
+        metrics.increment(f"jobs.{kind}.reclaimed")
+    return [job_id for job_id, _ in requeued]
+
+
+def shutdown() -> None:
+    """Stop taking jobs and wait for running ones to finish"""
+    global _executor
+    _stopping.set()
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+
+
+def enqueue(
+    db, kind: str, params: dict, user_id: Optional[int] = None, exclusive: bool = False
+) -> models.Job:
+    """
+    Record a job and hand it to the worker pool. An exclusive job takes its
+    kind as lock key, so the insert raises IntegrityError while another
+    exclusive job of the kind is queued or running.
+    """
+    if kind not in _handlers:
+        raise ValueError(f"Unknown job kind: {kind}")
+    job = db.scalars(
+        insert(models.Job).values(
+            kind=kind,
+            params=json.dumps(params),
+            status="queued",
+            lock_key=kind if exclusive else None,
+            progress=0,
+            created_by=user_id,
+            created_at=datetime.utcnow()
+        ).returning(models.Job)
+    ).one()
+    db.commit()
+    metrics.increment(f"jobs.{kind}.queued")
+    if _executor is None:
+        start()
+    _executor.submit(_run, job.id)
+    return job
+
+
+def artifact_path(job_id: int, extension: str) -> str:
+    """Where a job writes its artifact"""
+    return os.path.join(ARTIFACTS_DIR, f"job-{job_id}.{extension}")
+
+
+def _run(job_id: int) -> None:
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        job = db.scalars(
+            update(models.Job)
+            .where(models.Job.id == job_id, models.Job.status == "queued")
+            .values(status="running", started_at=now, heartbeat_at=now, attempts=models.Job.attempts + 1)
+            .returning(models.Job)
+        ).one_or_none()
+        db.commit()
+        if job is None:
+            return  # already claimed
+        # Later updates only apply while this attempt still holds the job
+        held = (models.Job.id == job_id, models.Job.status == "running", models.Job.attempts == job.attempts)
+        with _running_lock:
+            _running.add(job_id)
+
+        metrics.observe(f"jobs.{job.kind}.wait", (job.started_at - job.created_at).total_seconds())
+        started = time.perf_counter()
+
+        def report_progress(fraction: float) -> None:
+            db.execute(
+                update(models.Job).where(*held).values(
+                    progress=round(min(fraction, 1), 4), heartbeat_at=datetime.utcnow()
+                )
+            )
+            db.commit()
+
+        try:
+            path = _handlers[job.kind](db, job, json.loads(job.params), report_progress)
+        except Exception as exc:
+            db.rollback()
+            logger.exception("Job %s (%s) failed", job_id, job.kind)
+            values = {"status": "failed", "error": str(exc) or exc.__class__.__name__}
+            metrics.increment(f"jobs.{job.kind}.failed")
+        else:
+            values = {"status": "succeeded", "progress": 1, "artifact_path": path}
+            metrics.increment(f"jobs.{job.kind}.succeeded")
+        metrics.observe(f"jobs.{job.kind}.run", time.perf_counter() - started)
+
+        db.execute(
+            update(models.Job)
+            .where(*held)
+            .values(finished_at=datetime.utcnow(), **values)
+        )
+        db.commit()
+    finally:
+        with _running_lock:
+            _running.discard(job_id)
+        db.close()
@@ -1,15 +1,57 @@
-from fastapi import FastAPI
+import os
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+
+from . import audit, bus, idempotency, jobs
+from .database import READ_YOUR_WRITES_SECONDS, is_in_memory, migrate, replicas
+from .dependencies import PRIMARY_PIN_HEADER
+from .routers import villages, budgets, categories, expenses, auth, analytics, sync, metrics, reports, statements, audit_log
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run the job pool, audit flusher, idempotency key purger and invalidation listener for the lifetime of the app"""
+    if is_in_memory():
+        # Nothing else can reach an in-memory database to migrate it
+        migrate()
+    bus.start()
+    jobs.start()
+    audit.start()
+    idempotency.start()
+    yield
+    idempotency.shutdown()
+    jobs.shutdown()
+    audit.shutdown()
+    bus.shutdown()
 
-from .routers import villages, budgets, categories, expenses, auth
 
 # Initialize FastAPI application
 app = FastAPI(
     title="Smart Village Budget and Expense Tracker API",
     description="API for managing village budgets, categories, and expenses",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# Replay stored responses for retried requests carrying an Idempotency-Key
+app.add_middleware(idempotency.IdempotencyMiddleware)
+
+# Compress responses larger than this many bytes. Brotli is used for clients
+# that accept it when the optional brotli-asgi package is installed. Added
+# after the idempotency middleware so stored responses stay uncompressed.
+COMPRESSION_MINIMUM_SIZE = int(os.getenv("COMPRESSION_MINIMUM_SIZE", "500"))
+
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:
+    app.add_middleware(GZipMiddleware, minimum_size=COMPRESSION_MINIMUM_SIZE)
+else:
+    app.add_middleware(BrotliMiddleware, minimum_size=COMPRESSION_MINIMUM_SIZE, gzip_fallback=True)
+
 # Configure CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -21,14 +63,36 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Cursor of the next page of GET /expenses/, and the read-your-writes pin
+    expose_headers=["X-Next-Cursor", PRIMARY_PIN_HEADER],
 )
 
+
+@app.middleware("http")
+async def pin_writers_to_primary(request: Request, call_next):
+    """After a successful write, route the client's reads to the primary for a while"""
+    response = await call_next(request)
+    if (
+        replicas.replicas
+        and request.method not in ("GET", "HEAD", "OPTIONS")
+        and response.status_code < 400
+    ):
+        response.headers[PRIMARY_PIN_HEADER] = str(time.time() + READ_YOUR_WRITES_SECONDS)
+    return response
+
+
 # Include routers
 app.include_router(auth.router)
 app.include_router(villages.router)
 app.include_router(budgets.router)
 app.include_router(categories.router)
 app.include_router(expenses.router)
+app.include_router(analytics.router)
+app.include_router(sync.router)
+app.include_router(metrics.router)
+app.include_router(reports.router)
+app.include_router(statements.router)
+app.include_router(audit_log.router)
 
 
 @app.get("/")
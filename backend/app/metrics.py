@@ -0,0 +1,41 @@
+# metrics.py
+"""
+Process-local counters and timings, exposed to admins at GET /metrics.
+
+Each worker keeps its own figures; they reset on restart.
+"""
+
+import threading
+from collections import defaultdict
+from typing import Dict
+
+_lock = threading.Lock()
+_counters: Dict[str, int] = defaultdict(int)
+_timings: Dict[str, Dict[str, float]] = {}
+
+
+def increment(name: str, amount: int = 1) -> None:
+    """Add to a counter"""
+    with _lock:
+        _counters[name] += amount
+
+
+def observe(name: str, seconds: float) -> None:
+    """Record one duration under a timing"""
+    with _lock:
+        timing = _timings.get(name)
+        if timing is None:
+            _timings[name] = {"count": 1, "total_seconds": seconds, "max_seconds": seconds}
+        else:
+            timing["count"] += 1
+            timing["total_seconds"] += seconds
+            timing["max_seconds"] = max(timing["max_seconds"], seconds)
+
+
+def snapshot() -> dict:
+    """Copy of every counter and timing"""
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "timings": {name: dict(timing) for name, timing in _timings.items()}
+        }
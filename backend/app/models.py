@@ -1,9 +1,12 @@
 ﻿# models.py
 
-from sqlalchemy import Column, Integer, String, ForeignKey, Date, Numeric, Text, DateTime, UniqueConstraint, Boolean
+from sqlalchemy import DDL, Column, Integer, BigInteger, Float, String, ForeignKey, Date, Numeric, Text, DateTime, UniqueConstraint, Boolean, Index, event, text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .database import Base
+from .money import paise_default
+from .change_versions import SYNCED_TABLES, next_version, sqlite_triggers
+from .stale_statements import POSTGRESQL_TRIGGERS, SQLITE_TRIGGERS
 
 
 class User(Base):
@@ -16,6 +19,8 @@ class User(Base):
     village_id = Column(Integer, ForeignKey("villages.id", ondelete="SET NULL"), nullable=True)
     role = Column(String(20), nullable=False, default="villager")  # 'admin' or 'villager'
     is_active = Column(Boolean, default=True)
+    # Signed into access tokens; bumping it revokes every token issued before
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
     created_at = Column(DateTime, default=datetime.utcnow)
 
     # Relationships
@@ -30,10 +35,15 @@ class Village(Base):
     district = Column(String(150))
     state = Column(String(150))
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    # Commit-ordered version of the last write, for delta sync (see change_versions)
+    change_version = Column(BigInteger, nullable=False, default=next_version(), onupdate=next_version(), index=True)
 
     # Relationships
-    budgets = relationship("Budget", back_populates="village", cascade="all, delete-orphan")
-    users = relationship("User", back_populates="village")
+    # passive_deletes: deleting a parent leaves its children to the foreign
+    # keys' ON DELETE CASCADE / SET NULL instead of loading them first
+    budgets = relationship("Budget", back_populates="village", cascade="all, delete-orphan", passive_deletes=True)
+    users = relationship("User", back_populates="village", passive_deletes=True)
 
 
 class Budget(Base):
@@ -44,37 +54,217 @@ class Budget(Base):
 
     id = Column(Integer, primary_key=True)
     village_id = Column(Integer, ForeignKey("villages.id", ondelete="CASCADE"), nullable=False)
-    year = Column(Integer, nullable=False)
+    # Indexed for comparisons of a year across all villages
+    year = Column(Integer, nullable=False, index=True)
     total_allocated = Column(Numeric(12, 2), nullable=False)
+    # The same amount in paise (see money.py)
+    total_allocated_paise = Column(BigInteger, nullable=False, default=paise_default("total_allocated"))
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    # Commit-ordered version of the last write, for delta sync (see change_versions)
+    change_version = Column(BigInteger, nullable=False, default=next_version(), onupdate=next_version(), index=True)
 
     # Relationships
     village = relationship("Village", back_populates="budgets")
-    categories = relationship("BudgetCategory", back_populates="budget", cascade="all, delete-orphan")
+    categories = relationship("BudgetCategory", back_populates="budget", cascade="all, delete-orphan", passive_deletes=True)
 
 
 class BudgetCategory(Base):
     __tablename__ = "budget_categories"
 
     id = Column(Integer, primary_key=True)
-    budget_id = Column(Integer, ForeignKey("budgets.id", ondelete="CASCADE"), nullable=False)
+    budget_id = Column(Integer, ForeignKey("budgets.id", ondelete="CASCADE"), nullable=False, index=True)
     category_name = Column(String(150), nullable=False)
     allocated_amount = Column(Numeric(12, 2), nullable=False)
+    allocated_amount_paise = Column(BigInteger, nullable=False, default=paise_default("allocated_amount"))
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    # Commit-ordered version of the last write, for delta sync (see change_versions)
+    change_version = Column(BigInteger, nullable=False, default=next_version(), onupdate=next_version(), index=True)
 
     # Relationships
     budget = relationship("Budget", back_populates="categories")
-    expenses = relationship("Expense", back_populates="category", cascade="all, delete-orphan")
+    expenses = relationship("Expense", back_populates="category", cascade="all, delete-orphan", passive_deletes=True)
 
 
 class Expense(Base):
     __tablename__ = "expenses"
+    __table_args__ = (
+        # Expense listings of a category (or village) by date; also lets
+        # cascading deletes of categories find their expenses
+        Index("ix_expenses_category_id_expense_date", "category_id", "expense_date"),
+    )
 
     id = Column(Integer, primary_key=True)
     category_id = Column(Integer, ForeignKey("budget_categories.id", ondelete="CASCADE"), nullable=False)
     description = Column(Text)
     amount = Column(Numeric(12, 2), nullable=False)
-    vendor_name = Column(String(150))
-    expense_date = Column(Date, nullable=False)
+    amount_paise = Column(BigInteger, nullable=False, default=paise_default("amount"))
+    vendor_name = Column(String(150), index=True)
+    expense_date = Column(Date, nullable=False, index=True)
+    # Generated by offline clients so replayed uploads can be recognised
+    client_uuid = Column(String(36), unique=True, index=True, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    # Commit-ordered version of the last write, for delta sync (see change_versions)
+    change_version = Column(BigInteger, nullable=False, default=next_version(), onupdate=next_version(), index=True)
 
     # Relationships
     category = relationship("BudgetCategory", back_populates="expenses")
+
+
+class IdempotencyKey(Base):
+    """Stored outcome of a mutating request sent with an Idempotency-Key header"""
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (
+        UniqueConstraint('user_id', 'key', name='unique_user_idempotency_key'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    key = Column(String(255), nullable=False)
+    request_hash = Column(String(64), nullable=False)
+    status = Column(String(20), nullable=False, default="in_progress")  # 'in_progress' or 'completed'
+    response_status = Column(Integer)
+    response_body = Column(Text)
+    content_type = Column(String(100))
+    created_at = Column(DateTime, default=datetime.utcnow)
+    claimed_at = Column(DateTime, nullable=False, default=datetime.utcnow)  # start of the current claim's lease
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+class RefreshToken(Base):
+    """
+    A refresh token, stored as its SHA-256 hash. Each refresh replaces the
+    token with a new one in the same family; presenting a replaced token
+    again means it leaked, so the whole family is revoked.
+    """
+    __tablename__ = "refresh_tokens"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    token_hash = Column(String(64), nullable=False, unique=True, index=True)
+    family_id = Column(String(36), nullable=False, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)
+    rotated_at = Column(DateTime, nullable=True)  # set once exchanged for a new token
+    revoked_at = Column(DateTime, nullable=True)  # set on logout or reuse detection
+
+
+class AnnualStatement(Base):
+    """
+    Precomputed statement (budget, categories, spent, remaining) of one
+    village's year. Writes to its categories and expenses mark it stale and
+    bump version through triggers (see stale_statements); it is rebuilt on
+    the next read or by a background job.
+    """
+    __tablename__ = "annual_statements"
+    __table_args__ = (
+        UniqueConstraint('village_id', 'year', name='unique_village_statement_year'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    budget_id = Column(Integer, ForeignKey("budgets.id", ondelete="CASCADE"), nullable=False, unique=True)
+    village_id = Column(Integer, ForeignKey("villages.id", ondelete="CASCADE"), nullable=False)
+    year = Column(Integer, nullable=False)
+    payload = Column(Text, nullable=True)  # StatementOut as JSON
+    stale = Column(Boolean, nullable=False, default=True)
+    version = Column(Integer, nullable=False, default=0)
+    computed_at = Column(DateTime, nullable=True)
+
+
+class Job(Base):
+    """A unit of background work (e.g. a report), run by the in-process job pool"""
+    __tablename__ = "jobs"
+    __table_args__ = (
+        # At most one queued or running job per lock key (see jobs.enqueue).
+        # Partial; its WHERE is attached when the table is created, below
+        Index("ix_jobs_active_lock_key", "lock_key", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(50), nullable=False)
+    params = Column(Text, nullable=False, default="{}")  # JSON
+    status = Column(String(20), nullable=False, default="queued", index=True)  # queued, running, succeeded, failed
+    lock_key = Column(String(50), nullable=True)
+    progress = Column(Numeric(5, 4), nullable=False, default=0)  # 0..1
+    created_by = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    # Times the job was claimed, and the lease its worker renews (see jobs.py)
+    attempts = Column(Integer, nullable=False, default=0)
+    heartbeat_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    error = Column(Text, nullable=True)
+    artifact_path = Column(String(500), nullable=True)
+
+
+@event.listens_for(Job.__table__, "before_create")
+def _lock_key_index_where(table, connection, **kw):
+    # Set here rather than as postgresql_where/sqlite_where on the Index,
+    # which would import the Postgres dialect along with the models
+    index = next(index for index in table.indexes if index.name == "ix_jobs_active_lock_key")
+    index.dialect_kwargs[f"{connection.dialect.name}_where"] = text("status IN ('queued', 'running')")
+
+
+class AuditLog(Base):
+    """Who created, changed or deleted which row, with the changed values"""
+    __tablename__ = "audit_log"
+    __table_args__ = (
+        Index("ix_audit_log_entity_entity_id_ts", "entity", "entity_id", "ts"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    ts = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+    actor_id = Column(Integer, nullable=True)  # no FK: entries outlive their users
+    action = Column(String(10), nullable=False)  # 'create', 'update' or 'delete'
+    entity = Column(String(30), nullable=False)
+    entity_id = Column(Integer, nullable=False)
+    before = Column(Text, nullable=True)  # JSON of the old values of changed fields
+    after = Column(Text, nullable=True)  # JSON of the new values of changed fields
+
+
+class DeletedRecord(Base):
+    """Tombstone left behind by a delete so offline clients can sync it"""
+    __tablename__ = "deleted_records"
+    __table_args__ = (
+        Index("ix_deleted_records_village_deleted_at", "village_id", "deleted_at"),
+        Index("ix_deleted_records_village_change_version", "village_id", "change_version"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    entity = Column(String(30), nullable=False)  # 'village', 'budget', 'category' or 'expense'
+    entity_id = Column(Integer, nullable=False)
+    village_id = Column(Integer, nullable=False)
+    deleted_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    change_version = Column(BigInteger, nullable=False, default=next_version())
+
+
+class SyncClock(Base):
+    """Counter behind the change versions on SQLite; unused on Postgres (see change_versions)"""
+    __tablename__ = "sync_clock"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
+
+
+# Databases built from the models rather than the migrations (new SQLite
+# databases, see alembic/env.py) get the counter's row and its triggers here
+event.listen(SyncClock.__table__, "after_create", DDL("INSERT INTO sync_clock (id, version) VALUES (1, 0)"))
+for _table in SYNCED_TABLES:
+    for _statement in sqlite_triggers(_table):
+        event.listen(Base.metadata.tables[_table], "after_create", DDL(_statement).execute_if(dialect="sqlite"))
+# Writes to expenses and categories mark their statements stale (see
+# stale_statements); created once every table exists
+for _dialect, _statements in (("sqlite", SQLITE_TRIGGERS), ("postgresql", POSTGRESQL_TRIGGERS)):
+    for _statement in _statements:
+        event.listen(Base.metadata, "after_create", DDL(_statement).execute_if(dialect=_dialect))
+
+
+class RateLimitBucket(Base):
+    """Token bucket of the shared rate limiter store (see ratelimit.DatabaseStore)"""
+    __tablename__ = "rate_limit_buckets"
+
+    key = Column(Text, primary_key=True)  # e.g. 'login:email:<address as typed>'
+    tokens = Column(Float, nullable=False)
+    taken = Column(Boolean, nullable=False)  # whether the last attempt got a token
+    updated_at = Column(Float, nullable=False)  # Unix time of the last attempt
+    full_at = Column(Float, nullable=False, index=True)  # Unix time the bucket is full again
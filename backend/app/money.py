@@ -0,0 +1,86 @@
+# money.py
+"""
+Amounts in rupees (Decimal) and in paise (int).
+
+Budgets, categories and expenses keep every amount twice, as Numeric(12, 2)
+rupees and as BigInteger paise in a `*_paise` twin column that inserts fill
+in by default and crud updates alongside. MONEY_STORAGE chooses which of the
+two aggregations read: "numeric" (the default) or "paise", with which SUMs
+and comparisons run on native integers in the database and in Python.
+Aggregates stay in storage units until the schema boundary, where the
+`Money` schema type turns them back into rupees, so the API always exposes
+decimals either way.
+"""
+
+import os
+from decimal import ROUND_HALF_UP, Decimal
+
+MONEY_STORAGE = os.getenv("MONEY_STORAGE", "numeric").lower()
+
+# Rupee columns that have a paise twin
+MONEY_COLUMNS = ("total_allocated", "allocated_amount", "amount")
+
+CENT = Decimal("0.01")
+
+
+def use_paise() -> bool:
+    """Whether aggregations read the paise columns"""
+    return MONEY_STORAGE == "paise"
+
+
+def to_paise(rupees) -> int:
+    """Rupees (Decimal, int or str) as a whole number of paise"""
+    return int((Decimal(str(rupees)) * 100).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+def to_rupees(paise: int) -> Decimal:
+    """Paise as rupees with two decimals"""
+    return (Decimal(paise) / 100).quantize(CENT)
+
+
+def column(attribute):
+    """The column aggregations should read for a rupee column, e.g. Expense.amount"""
+    if use_paise():
+        return getattr(attribute.class_, f"{attribute.key}_paise")
+    return attribute
+
+
+def stored(instance, name: str):
+    """A rupee attribute of a model instance (e.g. budget.total_allocated) in storage units"""
+    return getattr(instance, f"{name}_paise" if use_paise() else name)
+
+
+def zero():
+    """Zero in storage units"""
+    return 0 if use_paise() else Decimal("0.00")
+
+
+def to_storage(rupees):
+    """Rupees in storage units, for comparisons with column()"""
+    if use_paise():
+        return to_paise(rupees)
+    return Decimal(str(rupees))
+
+
+def from_storage(value) -> Decimal:
+    """An amount read or summed through column(), in rupees"""
+    if use_paise():
+        return to_rupees(int(value))
+    return value if isinstance(value, Decimal) else Decimal(str(value))
+
+
+def paise_default(rupee_column: str):
+    """Insert default of a paise column: the paise of the rupee value in the same row"""
+    def default(context):
+        rupees = context.get_current_parameters().get(rupee_column)
+        return None if rupees is None else to_paise(rupees)
+    return default
+
+
+def with_paise(values: dict) -> dict:
+    """UPDATE values with the paise twin of every rupee amount they set"""
+    values = dict(values)
+    for name in MONEY_COLUMNS:
+        if values.get(name) is not None:
+            values[f"{name}_paise"] = to_paise(values[name])
+    return values
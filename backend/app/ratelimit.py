@@ -0,0 +1,170 @@
+# ratelimit.py
+"""
+Token-bucket rate limiting for the bcrypt-heavy auth endpoints.
+
+Each key (an IP or an email address) holds a bucket of `capacity` tokens that
+refills at `rate` tokens per second; an attempt takes one token or is rejected
+with the time until one is available. Buckets live in a BucketStore, chosen
+by RATE_LIMIT_STORE: "memory" (the default) keeps them per process, so with
+N workers a client gets up to N times the limit; "database" keeps them in
+the rate_limit_buckets table, shared by every worker, at the cost of one
+write per attempt.
+"""
+
+import abc
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, Request, status
+from sqlalchemy import case, delete
+
+from . import crud, metrics, models
+from .database import SessionLocal
+
+# Attempts per minute allowed from one IP and against one email address
+AUTH_RATE_LIMIT_PER_IP = float(os.getenv("AUTH_RATE_LIMIT_PER_IP", "20"))
+AUTH_RATE_LIMIT_PER_EMAIL = float(os.getenv("AUTH_RATE_LIMIT_PER_EMAIL", "5"))
+# Take the client IP from X-Forwarded-For; only enable behind a trusted proxy
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "false").lower() == "true"
+# "memory" (per worker) or "database" (shared by all workers)
+RATE_LIMIT_STORE = os.getenv("RATE_LIMIT_STORE", "memory").lower()
+MAX_BUCKETS = 100_000
+
+
+class BucketStore(abc.ABC):
+    """Where bucket state is kept"""
+
+    @abc.abstractmethod
+    def take(self, key: str, rate: float, capacity: float) -> float:
+        """Take one token from key's bucket. Returns 0 if taken, else seconds until one is available"""
+
+
+class MemoryStore(BucketStore):
+    """
+    Buckets in an OrderedDict kept in least-recently-used order. Every
+    operation is O(1): a bucket idle long enough to have refilled is the same
+    as no bucket, so stale ones are dropped from the front as we go, and the
+    oldest are evicted once max_buckets is reached.
+    """
+
+    def __init__(self, max_buckets: int = MAX_BUCKETS):
+        self.max_buckets = max_buckets
+        self._buckets: "OrderedDict[str, Tuple[float, float, float]]" = OrderedDict()  # key -> (tokens, updated, full_at)
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, capacity: float) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated, _ = self._buckets.pop(key, (capacity, now, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now, now + (capacity - tokens) / rate)
+
+            # Expire a couple of refilled buckets per call, then enforce the bound
+            for _ in range(2):
+                oldest_key, oldest = next(iter(self._buckets.items()))
+                if oldest[2] > now:
+                    break
+                del self._buckets[oldest_key]
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class DatabaseStore(BucketStore):
+    """
+    Buckets in the rate_limit_buckets table, shared by every worker. Each
+    attempt is one INSERT ... ON CONFLICT DO UPDATE that refills, takes and
+    returns the bucket in a single statement, so concurrent attempts on the
+    same key queue on its row instead of both seeing the last token. Refilled
+    buckets are deleted every `purge_every` attempts.
+    """
+
+    def __init__(self, purge_every: int = 1000):
+        self.purge_every = purge_every
+        self._attempts = 0
+
+    def take(self, key: str, rate: float, capacity: float) -> float:
+        # Wall-clock time, as buckets are shared between processes; a clock
+        # running behind another worker's only delays refilling
+        now = time.time()
+        bucket = models.RateLimitBucket
+        elapsed = case((bucket.updated_at < now, now - bucket.updated_at), else_=0)
+        refilled = case(
+            (bucket.tokens + elapsed * rate > capacity, capacity),
+            else_=bucket.tokens + elapsed * rate
+        )
+        taken = refilled >= 1
+        tokens = case((taken, refilled - 1), else_=refilled)
+
+        db = SessionLocal()
+        try:
+            statement = crud._dialect_insert(db, bucket).values(
+                key=key, tokens=capacity - 1, taken=True, updated_at=now, full_at=now + 1 / rate
+            )
+            statement = statement.on_conflict_do_update(
+                index_elements=[bucket.key],
+                set_={
+                    "tokens": tokens,
+                    "taken": taken,
+                    "updated_at": now,
+                    "full_at": now + (capacity - tokens) / rate,
+                }
+            ).returning(bucket.tokens, bucket.taken)
+            left, was_taken = db.execute(statement).one()
+            db.commit()
+
+            self._attempts += 1
+            if self._attempts % self.purge_every == 0:
+                db.execute(delete(bucket).where(bucket.full_at < now))
+                db.commit()
+        finally:
+            db.close()
+        return 0.0 if was_taken else (1 - left) / rate
+
+
+store: BucketStore = DatabaseStore() if RATE_LIMIT_STORE == "database" else MemoryStore()
+
+
+def configure(new_store: BucketStore) -> None:
+    """Swap the bucket store, e.g. for one shared between workers"""
+    global store
+    store = new_store
+
+
+def client_ip(request: Request) -> str:
+    """The caller's IP address"""
+    if TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get("X-Forwarded-For")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def limit_auth_attempt(request: Request, email: Optional[str]) -> None:
+    """Reject with 429 if this IP or email address is over its attempt budget"""
+    limits = [("ip", client_ip(request), AUTH_RATE_LIMIT_PER_IP)]
+    if email:
+        limits.append(("email", email.strip().lower(), AUTH_RATE_LIMIT_PER_EMAIL))
+
+    endpoint = request.url.path.rstrip("/").rsplit("/", 1)[-1]
+    for kind, value, per_minute in limits:
+        wait = store.take(f"{endpoint}:{kind}:{value}", per_minute / 60, per_minute)
+        if wait:
+            metrics.increment(f"ratelimit.{endpoint}.{kind}.rejected")
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many attempts, please try again later",
+                headers={"Retry-After": str(math.ceil(wait))}
+            )
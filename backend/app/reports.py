@@ -0,0 +1,77 @@
+# reports.py
+"""
+Report builders, run as background jobs (see jobs.py).
+
+The annual report lists allocated and spent amounts per category for every
+village of a year, optionally limited to one state, as CSV. Rebuilding
+statements refreshes the stored annual statements of a year in bulk. Purging
+a village deletes a village too large to delete within a request.
+"""
+
+import csv
+import os
+
+from . import crud, jobs, models, money
+
+ANNUAL_REPORT = "annual_report"
+# Villages per query; progress is reported after each batch
+REPORT_BATCH_SIZE = 100
+
+ANNUAL_REPORT_COLUMNS = [
+    "state", "district", "village_id", "village_name", "budget_allocated",
+    "category_name", "allocated_amount", "spent",
+]
+# Summed in storage units by the query, written in rupees
+ANNUAL_REPORT_MONEY = {"budget_allocated", "allocated_amount", "spent"}
+
+
+@jobs.handler(ANNUAL_REPORT)
+def build_annual_report(db, job: models.Job, params: dict, report_progress) -> str:
+    """Write the annual report CSV for params["year"] (and params["state"])"""
+    query = db.query(models.Village.id)
+    if params.get("state") is not None:
+        query = query.filter(models.Village.state == params["state"])
+    village_ids = [village_id for (village_id,) in query.order_by(models.Village.id)]
+
+    path = jobs.artifact_path(job.id, "csv")
+    partial = path + ".part"
+    with open(partial, "w", newline="", encoding="utf-8") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(ANNUAL_REPORT_COLUMNS)
+        for start in range(0, len(village_ids), REPORT_BATCH_SIZE):
+            batch = village_ids[start:start + REPORT_BATCH_SIZE]
+            for row in crud.get_annual_report_rows(db, params["year"], batch):
+                writer.writerow([
+                    money.from_storage(getattr(row, column)) if column in ANNUAL_REPORT_MONEY else getattr(row, column)
+                    for column in ANNUAL_REPORT_COLUMNS
+                ])
+            report_progress((start + len(batch)) / len(village_ids))
+    # Only a complete file ever appears under the final name
+    os.replace(partial, path)
+    return path
+
+
+REBUILD_STATEMENTS = "rebuild_statements"
+
+
+@jobs.handler(REBUILD_STATEMENTS)
+def rebuild_statements(db, job: models.Job, params: dict, report_progress) -> None:
+    """Rebuild every stale or missing statement of params["year"] ahead of audit season"""
+    village_ids = crud.get_stale_statement_villages(db, params["year"])
+    for index, village_id in enumerate(village_ids, start=1):
+        crud.rebuild_statement(db, village_id, params["year"])
+        if index % REPORT_BATCH_SIZE == 0 or index == len(village_ids):
+            report_progress(index / len(village_ids))
+    return None
+
+
+PURGE_VILLAGE = "purge_village"
+
+
+@jobs.handler(PURGE_VILLAGE)
+def purge_village(db, job: models.Job, params: dict, report_progress) -> None:
+    """Delete params["village_id"] in batches (see crud.purge_village)"""
+    # Acting for the admin who asked, so the audit entry names them
+    db.info["user_id"] = job.created_by
+    crud.purge_village(db, params["village_id"], report_progress)
+    return None
@@ -0,0 +1,215 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from datetime import date
+
+from .. import cache, crud, schemas, models, stats
+from ..database import REPLICA_MAX_LAG_SECONDS
+from ..dependencies import get_read_db, get_current_user
+
+router = APIRouter(
+    prefix="/analytics",
+    tags=["Analytics"]
+)
+
+
+@router.get("/rollup", response_model=schemas.RollupOut)
+def get_rollup(
+    level: str = "state",
+    year: Optional[int] = None,
+    state: Optional[str] = None,
+    district: Optional[str] = None,
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """Allocated, spent and utilization per state, district or village (admin only)"""
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admin can view rollups"
+        )
+    if level not in crud.ROLLUP_LEVELS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"level must be one of: {', '.join(crud.ROLLUP_LEVELS)}"
+        )
+    if district is not None and state is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="state is required when filtering by district"
+        )
+
+    # Only writes inside the requested subtree invalidate the cached result
+    if district is not None:
+        scope = ("district", state, district)
+    elif state is not None:
+        scope = ("state", state)
+    else:
+        scope = cache.ALL
+
+    return cache.get_or_compute(
+        ("rollup", level, year, state, district),
+        scope,
+        lambda: schemas.RollupOut(
+            level=level,
+            year=year,
+            nodes=crud.get_spend_rollup(db=db, level=level, year=year, state=state, district=district)
+        ),
+        settle_seconds=REPLICA_MAX_LAG_SECONDS if db.info.get("replica") else 0
+    )
+
+
+@router.get("/yoy", response_model=schemas.YearOverYearOut)
+def get_year_over_year(
+    years: List[int] = Query(..., description="Years to compare; repeat the parameter"),
+    village_id: Optional[int] = None,
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Allocated and spent per category name across years, with the change
+    from year to year, for one village or all villages (admin only)
+    """
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admin can view year-over-year comparisons"
+        )
+    if len(set(years)) > crud.YOY_MAX_YEARS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {crud.YOY_MAX_YEARS} years can be compared"
+        )
+
+    years = sorted(set(years))
+    return cache.get_or_compute(
+        ("yoy", village_id, tuple(years)),
+        ("village", village_id) if village_id is not None else cache.ALL,
+        lambda: schemas.YearOverYearOut(
+            village_id=village_id,
+            **crud.get_year_over_year(db=db, years=years, village_id=village_id)
+        ),
+        settle_seconds=REPLICA_MAX_LAG_SECONDS if db.info.get("replica") else 0
+    )
+
+
+@router.get("/distribution", response_model=schemas.DistributionOut)
+def get_distribution(
+    year: Optional[int] = None,
+    state: Optional[str] = None,
+    district: Optional[str] = None,
+    village_id: Optional[int] = None,
+    bins: int = Query(20, ge=1, le=100),
+    window: int = Query(7, ge=1, le=366),
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Percentiles, histogram and per-category statistics of expense amounts,
+    and daily spend with its `window`-day moving average (admin only)
+    """
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admin can view distributions"
+        )
+    if district is not None and state is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="state is required when filtering by district"
+        )
+    if not stats.available():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Distributions need NumPy; install the analytics extra"
+        )
+
+    if village_id is not None:
+        scope = ("village", village_id)
+    elif district is not None:
+        scope = ("district", state, district)
+    elif state is not None:
+        scope = ("state", state)
+    else:
+        scope = cache.ALL
+
+    def compute() -> schemas.DistributionOut:
+        columns = stats.load_expenses(db, year=year, state=state, district=district, village_id=village_id)
+        return schemas.DistributionOut(
+            year=year,
+            state=state,
+            district=district,
+            village_id=village_id,
+            **stats.distribution(columns, stats.load_category_names(db, columns.category_id), bins, window)
+        )
+
+    return cache.get_or_compute(
+        ("distribution", year, state, district, village_id, bins, window),
+        scope,
+        compute,
+        settle_seconds=REPLICA_MAX_LAG_SECONDS if db.info.get("replica") else 0
+    )
+
+
+@router.get("/forecast", response_model=schemas.ForecastOut)
+def get_forecast(
+    budget_id: int,
+    as_of: Optional[date] = Query(None, description="Project from the spend up to this day (default: today)"),
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Year-end spend of every category of a budget projected from its burn
+    rate so far, linearly and following the seasonality of earlier years,
+    and when each category runs out (admin only)
+    """
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admin can view forecasts"
+        )
+    if not stats.available():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Forecasts need NumPy; install the analytics extra"
+        )
+    budget = crud.get_budget_by_id(db=db, budget_id=budget_id)
+    if budget is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Budget with id {budget_id} not found"
+        )
+
+    first_day, last_day = date(budget.year, 1, 1), date(budget.year, 12, 31)
+    if as_of is None:
+        as_of = min(max(date.today(), first_day), last_day)
+    elif not first_day <= as_of <= last_day:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"as_of must fall within {budget.year}"
+        )
+
+    def compute() -> schemas.ForecastOut:
+        # This budget's expenses and the village's earlier years in one query
+        columns = stats.load_expenses(db, village_id=budget.village_id, through_year=budget.year)
+        return schemas.ForecastOut(
+            budget_id=budget.id,
+            village_id=budget.village_id,
+            year=budget.year,
+            **stats.forecast(
+                columns,
+                stats.load_budget_categories(db, budget.id),
+                stats.load_category_names(db, columns.category_id),
+                budget.year,
+                as_of
+            )
+        )
+
+    # Expense writes to the budget invalidate it; changes to earlier years'
+    # expenses, which only shape the seasonal projection, do not
+    return cache.get_or_compute(
+        ("forecast", budget.id, as_of),
+        ("budget", budget.id),
+        compute,
+        settle_seconds=REPLICA_MAX_LAG_SECONDS if db.info.get("replica") else 0
+    )
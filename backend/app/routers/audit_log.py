@@ -0,0 +1,31 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.orm import Session
+from typing import List, Optional
+
+from .. import audit, crud, schemas
+from ..dependencies import get_db, get_current_user
+
+router = APIRouter(
+    prefix="/audit",
+    tags=["Audit"]
+)
+
+
+@router.get("", response_model=List[schemas.AuditLogOut])
+def get_audit_log(
+    entity: Optional[str] = None,
+    entity_id: Optional[int] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Who changed what, newest first (admin only)"""
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admin can view the audit log"
+        )
+    # Include this worker's entries that are still buffered
+    audit.flush()
+    return crud.get_audit_log(db=db, entity=entity, entity_id=entity_id, skip=skip, limit=limit)
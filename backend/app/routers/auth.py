@@ -1,8 +1,10 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, Request, status, Depends
 from sqlalchemy.orm import Session
 from datetime import timedelta
+from typing import Optional
 
 from .. import crud, schemas, models
+from ..ratelimit import limit_auth_attempt
 from ..dependencies import get_db, get_current_user
 
 router = APIRouter(
@@ -11,9 +13,31 @@ router = APIRouter(
 )
 
 
+def _issue_tokens(db: Session, user: models.User, refresh_token: Optional[str] = None) -> dict:
+    """Access token plus refresh token for a signed-in user"""
+    access_token_expires = timedelta(minutes=crud.ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = crud.create_access_token(
+        data=crud.token_claims(user), expires_delta=access_token_expires
+    )
+    if refresh_token is None:
+        refresh_token = crud.create_refresh_token(db=db, user_id=user.id)
+    
+    # Build user response from the ORM object (includes role)
+    user_out = schemas.UserOut.model_validate(user)
+    
+    return {
+        "access_token": access_token,
+        "token_type": "bearer",
+        "refresh_token": refresh_token,
+        "user": user_out
+    }
+
+
 @router.post("/register", response_model=schemas.Token, status_code=status.HTTP_201_CREATED)
-def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
+def register(user: schemas.UserCreate, request: Request, db: Session = Depends(get_db)):
     """Register a new user"""
+    limit_auth_attempt(request, user.email)
+    
     # Check if user already exists
     existing_user = crud.get_user_by_email(db=db, email=user.email)
     if existing_user:
@@ -43,26 +67,14 @@ def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
             detail="Villager must select a village."
         )
     db_user = crud.create_user(db=db, user=user)
-    
-    # Generate JWT token
-    access_token_expires = timedelta(minutes=crud.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = crud.create_access_token(
-        data={"sub": str(db_user.id)}, expires_delta=access_token_expires
-    )
-    
-    # Build user response from the ORM object (includes role)
-    user_out = schemas.UserOut.model_validate(db_user)
-    
-    return {
-        "access_token": access_token,
-        "token_type": "bearer",
-        "user": user_out
-    }
+    return _issue_tokens(db, db_user)
 
 
 @router.post("/login", response_model=schemas.Token)
-def login(credentials: schemas.UserLogin, db: Session = Depends(get_db)):
+def login(credentials: schemas.UserLogin, request: Request, db: Session = Depends(get_db)):
     """Login user"""
+    limit_auth_attempt(request, credentials.email)
+    
     # Get user by email
     user = crud.get_user_by_email(db=db, email=credentials.email)
     if not user:
@@ -115,25 +127,41 @@ def login(credentials: schemas.UserLogin, db: Session = Depends(get_db)):
                 detail="Village selection does not match your registered village"
             )
     
-    # Generate JWT token
-    access_token_expires = timedelta(minutes=crud.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = crud.create_access_token(
-        data={"sub": str(user.id)}, expires_delta=access_token_expires
-    )
-    
-    # Build user response from the ORM object
-    user_out = schemas.UserOut.model_validate(user)
-    
-    return {
-        "access_token": access_token,
-        "token_type": "bearer",
-        "user": user_out
-    }
+    return _issue_tokens(db, user)
+
+
+@router.post("/refresh", response_model=schemas.Token)
+def refresh(body: schemas.RefreshRequest, db: Session = Depends(get_db)):
+    """Exchange a refresh token for a new access token and refresh token, without a password check"""
+    rotated = crud.rotate_refresh_token(db=db, token=body.refresh_token)
+    if rotated is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired refresh token"
+        )
+    user, refresh_token = rotated
+    return _issue_tokens(db, user, refresh_token=refresh_token)
+
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+def logout(body: schemas.RefreshRequest, db: Session = Depends(get_db)):
+    """Revoke a refresh token and every token rotated from it"""
+    crud.revoke_refresh_token(db=db, token=body.refresh_token)
+    return None
 
 
 @router.get("/me", response_model=schemas.UserOut)
-def get_me(current_user: models.User = Depends(get_current_user)):
+def get_me(
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
     """Get current user info"""
-    return current_user
+    user = crud.get_user_by_id(db=db, user_id=current_user.id)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="User not found"
+        )
+    return user
 
 
@@ -1,9 +1,11 @@
-﻿from fastapi import APIRouter, Depends, HTTPException, status
+﻿from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
 from .. import crud, schemas, models
-from ..dependencies import get_db, get_current_user
+from ..fields import fields_response, parse_fields, select_fields
+from ..dependencies import get_db, get_read_db, get_current_user
 
 router = APIRouter(
     prefix="/budgets",
@@ -13,20 +15,25 @@ router = APIRouter(
 
 @router.get("/", response_model=List[schemas.BudgetOut])
 def get_my_budgets(
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    fields: Optional[str] = Query(None, description="Comma separated fields to return, e.g. id,year"),
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
 ):
     """Get all budgets for the current user's village"""
+    selected = parse_fields(fields, schemas.BudgetOut)
     if current_user.role == "admin":
-        return db.query(models.Budget).all()
+        budgets = select_fields(db.query(models.Budget), models.Budget, selected).all()
     else:
-        return crud.get_budgets_by_village(db=db, village_id=current_user.village_id)
+        budgets = crud.get_budgets_by_village(db=db, village_id=current_user.village_id, fields=selected)
+    if selected:
+        return fields_response(schemas.BudgetOut, selected, budgets)
+    return budgets
 
 
 @router.post("/", response_model=schemas.BudgetOut, status_code=status.HTTP_201_CREATED)
 def create_budget(
     budget: schemas.BudgetCreate,
-    current_user: models.User = Depends(get_current_user),
+    current_user: schemas.CurrentUser = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Create a new budget for the current user's village"""
@@ -41,8 +48,11 @@ def create_budget(
 
     try:
         return crud.create_budget(db=db, budget=budget, village_id=target_village_id)
-    except Exception as e:
-        if "unique_village_year" in str(e).lower():
+    except IntegrityError as e:
+        db.rollback()
+        # Postgres names the constraint, SQLite only says UNIQUE; (village_id,
+        # year) is the only unique constraint on budgets besides the key
+        if "unique" in str(e.orig).lower():
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=f"Budget for year {budget.year} already exists for the target village"
@@ -53,8 +63,8 @@ def create_budget(
 @router.get("/{budget_id}", response_model=schemas.BudgetOut)
 def get_budget(
     budget_id: int,
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
 ):
     """Get a specific budget by ID"""
     budget = crud.get_budget_by_id(db=db, budget_id=budget_id)
@@ -73,22 +83,38 @@ def get_budget(
     return budget
 
 
-@router.put("/{budget_id}", response_model=schemas.BudgetOut)
-def update_budget(
+@router.get("/{budget_id}/tree", response_model=schemas.BudgetTreeOut)
+def get_budget_tree(
     budget_id: int,
-    budget_update: schemas.BudgetUpdate,
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    recent: int = Query(5, ge=0, le=100, description="Most recent expenses to include per category"),
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
 ):
-    """Update a budget"""
-    # Get existing budget
-    existing_budget = crud.get_budget_by_id(db=db, budget_id=budget_id)
-    if existing_budget is None:
+    """Get a budget with its categories, their totals and recent expenses in one request"""
+    budget = crud.get_budget_by_id(db=db, budget_id=budget_id)
+    if budget is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Budget with id {budget_id} not found"
         )
     
+    # Admin can access any budget
+    if current_user.role != "admin" and budget.village_id != current_user.village_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied to this budget"
+        )
+    return crud.get_budget_tree(db=db, budget=budget, recent_limit=recent)
+
+
+@router.put("/{budget_id}", response_model=schemas.BudgetOut)
+def update_budget(
+    budget_id: int,
+    budget_update: schemas.BudgetUpdate,
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Update a budget"""
     # Admin can update any budget
     if current_user.role != "admin":
         raise HTTPException(
@@ -97,20 +123,26 @@ def update_budget(
         )
     try:
         updated_budget = crud.update_budget(db=db, budget_id=budget_id, budget_update=budget_update)
-        return updated_budget
-    except Exception as e:
-        if "unique_village_year" in str(e).lower():
+    except IntegrityError as e:
+        db.rollback()
+        if "unique" in str(e.orig).lower():
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=f"Budget for year {budget_update.year} already exists for your village"
             )
         raise
+    if updated_budget is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Budget with id {budget_id} not found"
+        )
+    return updated_budget
 
 
 @router.delete("/{budget_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_budget(
     budget_id: int,
-    current_user: models.User = Depends(get_current_user),
+    current_user: schemas.CurrentUser = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Delete a budget"""
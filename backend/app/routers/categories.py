@@ -1,9 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
 from .. import crud, schemas, models
-from ..dependencies import get_db, get_current_user
+from ..fields import fields_response, parse_fields, select_fields
+from ..dependencies import get_db, get_read_db, get_current_user
 
 router = APIRouter(
     prefix="/categories",
@@ -13,33 +15,33 @@ router = APIRouter(
 
 @router.get("/", response_model=List[schemas.CategoryOut])
 def get_all_categories(
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    fields: Optional[str] = Query(None, description="Comma separated fields to return, e.g. id,category_name"),
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
 ):
     """Get all categories (no village restriction)"""
+    selected = parse_fields(fields, schemas.CategoryOut)
     if current_user.role == "admin":
-        return db.query(models.BudgetCategory).all()
+        query = db.query(models.BudgetCategory)
     else:
         # Only categories for budgets in user's village
         budgets = db.query(models.Budget).filter(models.Budget.village_id == current_user.village_id).all()
         budget_ids = [b.id for b in budgets]
-        return db.query(models.BudgetCategory).filter(models.BudgetCategory.budget_id.in_(budget_ids)).all()
+        query = db.query(models.BudgetCategory).filter(models.BudgetCategory.budget_id.in_(budget_ids))
+
+    categories = select_fields(query, models.BudgetCategory, selected).all()
+    if selected:
+        return fields_response(schemas.CategoryOut, selected, categories)
+    return categories
 
 
 @router.post("/", response_model=schemas.CategoryOut, status_code=status.HTTP_201_CREATED)
 def create_category(
     category: schemas.CategoryCreate,
-    current_user: models.User = Depends(get_current_user),
+    current_user: schemas.CurrentUser = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Create a new budget category"""
-    # Verify budget exists
-    budget = crud.get_budget_by_id(db=db, budget_id=category.budget_id)
-    if budget is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Budget with id {category.budget_id} not found"
-        )
     # Only admin may create categories
     if current_user.role != "admin":
         raise HTTPException(
@@ -47,16 +49,29 @@ def create_category(
             detail="Only admin can create categories"
         )
 
-    return crud.create_category(db=db, category=category)
+    # The budget's existence is checked by its foreign key on insert
+    try:
+        return crud.create_category(db=db, category=category)
+    except IntegrityError as e:
+        db.rollback()
+        if "foreign key" in str(e.orig).lower():
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Budget with id {category.budget_id} not found"
+            )
+        raise
 
 
 @router.get("/budget/{budget_id}", response_model=List[schemas.CategoryOut])
 def get_categories_by_budget(
     budget_id: int,
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    fields: Optional[str] = Query(None, description="Comma separated fields to return, e.g. id,category_name"),
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
 ):
     """Get all categories for a specific budget"""
+    selected = parse_fields(fields, schemas.CategoryOut)
+
     # Verify budget exists
     budget = crud.get_budget_by_id(db=db, budget_id=budget_id)
     if budget is None:
@@ -72,14 +87,17 @@ def get_categories_by_budget(
             detail="Access denied to this budget"
         )
     
-    return crud.get_categories_by_budget(db=db, budget_id=budget_id)
+    categories = crud.get_categories_by_budget(db=db, budget_id=budget_id, fields=selected)
+    if selected:
+        return fields_response(schemas.CategoryOut, selected, categories)
+    return categories
 
 
 @router.get("/{category_id}", response_model=schemas.CategoryOut)
 def get_category(
     category_id: int,
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
 ):
     """Get a specific category by ID"""
     category = crud.get_category_by_id(db=db, category_id=category_id)
@@ -101,11 +119,11 @@ def get_category(
     return category
 
 
-@router.get("/{category_id}/remaining")
+@router.get("/{category_id}/remaining", response_model=schemas.RemainingBudgetOut)
 def get_remaining_budget(
     category_id: int,
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
 ):
     """Get remaining budget for a specific category"""
     category = crud.get_category_by_id(db=db, category_id=category_id)
@@ -1,9 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import base64
+import binascii
+import json
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
-from .. import crud, schemas, models
-from ..dependencies import get_db, get_current_user
+from .. import crud, schemas, money
+from ..fields import fields_response, parse_fields
+from ..dependencies import get_db, get_read_db, get_current_user
 
 router = APIRouter(
     prefix="/expenses",
@@ -11,39 +19,142 @@ router = APIRouter(
 )
 
 
+def _encode_cursor(sort: str, value, last_id: int) -> str:
+    token = {"sort": sort, "after": [str(value), last_id]}
+    return base64.urlsafe_b64encode(json.dumps(token).encode()).decode()
+
+
+def _decode_cursor(cursor: str, sort: str) -> tuple:
+    """The (sort value, id) a cursor continues after; it must come from the same sort"""
+    try:
+        token = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if token["sort"] != sort:
+            raise ValueError("cursor of another sort")
+        value, last_id = token["after"]
+        key = sort.lstrip("-")
+        if key == "expense_date":
+            value = date.fromisoformat(value)
+        elif key == "amount" and not money.use_paise():
+            value = Decimal(value)
+        else:
+            value = int(value)
+        return value, int(last_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError, KeyError, TypeError, InvalidOperation):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+
 @router.get("/", response_model=List[schemas.ExpenseOut])
 def get_all_expenses(
+    response: Response,
+    category_id: Optional[int] = None,
+    budget_id: Optional[int] = None,
+    village_id: Optional[int] = None,
+    year: Optional[int] = None,
+    vendor_name: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    amount_min: Optional[Decimal] = None,
+    amount_max: Optional[Decimal] = None,
+    sort: str = Query("id", description="id, expense_date or amount; prefix with - for descending"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor header of the previous page"),
     skip: int = 0,
-    limit: int = 100,
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    limit: int = Query(100, ge=1, le=1000),
+    fields: Optional[str] = Query(None, description="Comma separated fields to return, e.g. id,amount,expense_date"),
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
 ):
-    """Get all expenses (no village restriction)"""
-    if current_user.role == "admin":
-        return db.query(models.Expense).offset(skip).limit(limit).all()
-    else:
-        # Only expenses for categories in budgets in user's village
-        budgets = db.query(models.Budget).filter(models.Budget.village_id == current_user.village_id).all()
-        budget_ids = [b.id for b in budgets]
-        categories = db.query(models.BudgetCategory).filter(models.BudgetCategory.budget_id.in_(budget_ids)).all()
-        category_ids = [c.id for c in categories]
-        return db.query(models.Expense).filter(models.Expense.category_id.in_(category_ids)).offset(skip).limit(limit).all()
+    """
+    Expenses matching the given filters, sorted and paginated in one SQL
+    statement. When a page is full, the X-Next-Cursor header holds the
+    cursor of the next one. Non-admins only see their own village.
+    """
+    selected = parse_fields(fields, schemas.ExpenseOut)
+    if sort.lstrip("-") not in crud.EXPENSE_SORT_KEYS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"sort must be one of: {', '.join(crud.EXPENSE_SORT_KEYS)}, optionally prefixed with -"
+        )
+    after = _decode_cursor(cursor, sort) if cursor else None
+
+    if current_user.role != "admin":
+        if village_id is not None and village_id != current_user.village_id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Access denied to this village"
+            )
+        if current_user.village_id is None:
+            return []
+        village_id = current_user.village_id
+
+    expense_query = schemas.ExpenseQuery(
+        category_id=category_id,
+        budget_id=budget_id,
+        village_id=village_id,
+        year=year,
+        vendor_name=vendor_name,
+        date_from=date_from,
+        date_to=date_to,
+        amount_min=amount_min,
+        amount_max=amount_max
+    )
+    expenses = crud.list_expenses(
+        db=db, expense_query=expense_query, sort=sort, after=after, fields=selected
+    ).offset(skip).limit(limit).all()
+
+    next_cursor = None
+    if len(expenses) == limit:
+        last = expenses[-1]
+        value = last.sort_key if selected else getattr(last, crud.expense_sort_column(sort.lstrip("-")).key)
+        next_cursor = _encode_cursor(sort, value, last.id)
+    if selected:
+        # Returned as is, so the header goes on it instead of on `response`
+        response = fields_response(schemas.ExpenseOut, selected, expenses)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response if selected else expenses
 
 
 @router.post("/", response_model=schemas.ExpenseOut, status_code=status.HTTP_201_CREATED)
 def create_expense(
     expense: schemas.ExpenseCreate,
-    current_user: models.User = Depends(get_current_user),
+    current_user: schemas.CurrentUser = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Create a new expense (log an expense)"""
-    # Verify category exists
-    category = crud.get_category_by_id(db=db, category_id=expense.category_id)
-    if category is None:
+    # Only admin may create expenses
+    if current_user.role != "admin":
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Category with id {expense.category_id} not found"
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admin can create expenses"
         )
+
+    # The category's existence is checked by its foreign key on insert
+    try:
+        return crud.create_expense(db=db, expense=expense)
+    except IntegrityError as e:
+        db.rollback()
+        if "foreign key" in str(e.orig).lower():
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Category with id {expense.category_id} not found"
+            )
+        raise
+
+
+@router.post("/batch", response_model=List[schemas.ExpenseBatchItemResult])
+def create_expenses_batch(
+    batch: schemas.ExpenseBatch,
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Upload expenses recorded offline. Each item carries a client-generated
+    UUID; items whose UUID was already uploaded are reported as duplicates
+    instead of being inserted again, so a failed upload can simply be retried.
+    """
     # Only admin may create expenses
     if current_user.role != "admin":
         raise HTTPException(
@@ -51,7 +162,69 @@ def create_expense(
             detail="Only admin can create expenses"
         )
 
-    return crud.create_expense(db=db, expense=expense)
+    return crud.create_expenses_batch(db=db, items=batch.items)
+
+
+def _require_bulk_selection(selection: schemas.ExpenseBulkDelete) -> None:
+    """Reject bulk requests that would silently match every expense"""
+    has_filter = selection.filter is not None and bool(selection.filter.model_dump(exclude_none=True))
+    if (selection.ids is None) == (not has_filter):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Provide either a list of ids or a non-empty filter"
+        )
+
+
+@router.patch("/bulk", response_model=schemas.BulkResult)
+def bulk_update_expenses(
+    bulk_update: schemas.ExpenseBulkUpdate,
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Apply the same change to many expenses in one transaction"""
+    # Only admin may update expenses
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admin can update expenses"
+        )
+    _require_bulk_selection(bulk_update)
+
+    try:
+        affected = crud.bulk_update_expenses(
+            db=db,
+            ids=bulk_update.ids,
+            expense_filter=bulk_update.filter,
+            expense_update=bulk_update.changes
+        )
+    except IntegrityError as e:
+        db.rollback()
+        if "foreign key" in str(e.orig).lower():
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Category with id {bulk_update.changes.category_id} not found"
+            )
+        raise
+    return {"affected": affected}
+
+
+@router.post("/bulk-delete", response_model=schemas.BulkResult)
+def bulk_delete_expenses(
+    bulk_delete: schemas.ExpenseBulkDelete,
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Delete many expenses in one transaction"""
+    # Only admin may delete expenses
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admin can delete expenses"
+        )
+    _require_bulk_selection(bulk_delete)
+
+    affected = crud.bulk_delete_expenses(db=db, ids=bulk_delete.ids, expense_filter=bulk_delete.filter)
+    return {"affected": affected}
 
 
 @router.get("/category/{category_id}", response_model=List[schemas.ExpenseOut])
@@ -59,10 +232,13 @@ def get_expenses_by_category(
     category_id: int,
     skip: int = 0,
     limit: int = 100,
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    fields: Optional[str] = Query(None, description="Comma separated fields to return, e.g. id,amount,expense_date"),
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
 ):
     """Get all expenses for a specific category with pagination"""
+    selected = parse_fields(fields, schemas.ExpenseOut)
+
     # Verify category exists
     category = crud.get_category_by_id(db=db, category_id=category_id)
     if category is None:
@@ -80,19 +256,23 @@ def get_expenses_by_category(
                 detail="Access denied to this category"
             )
     
-    return crud.get_expenses_by_category(
+    expenses = crud.get_expenses_by_category(
         db=db,
         category_id=category_id,
         skip=skip,
-        limit=limit
+        limit=limit,
+        fields=selected
     )
+    if selected:
+        return fields_response(schemas.ExpenseOut, selected, expenses)
+    return expenses
 
 
 @router.get("/{expense_id}", response_model=schemas.ExpenseOut)
 def get_expense(
     expense_id: int,
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
 ):
     """Get a specific expense by ID"""
     expense = crud.get_expense_by_id(db=db, expense_id=expense_id)
@@ -119,18 +299,10 @@ def get_expense(
 def update_expense(
     expense_id: int,
     expense_update: schemas.ExpenseUpdate,
-    current_user: models.User = Depends(get_current_user),
+    current_user: schemas.CurrentUser = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Update an expense"""
-    # Get existing expense
-    existing_expense = crud.get_expense_by_id(db=db, expense_id=expense_id)
-    if existing_expense is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Expense with id {expense_id} not found"
-        )
-    
     # Only admin may update expenses
     if current_user.role != "admin":
         raise HTTPException(
@@ -139,14 +311,28 @@ def update_expense(
         )
     
     # Update expense
-    updated_expense = crud.update_expense(db=db, expense_id=expense_id, expense_update=expense_update)
+    try:
+        updated_expense = crud.update_expense(db=db, expense_id=expense_id, expense_update=expense_update)
+    except IntegrityError as e:
+        db.rollback()
+        if "foreign key" in str(e.orig).lower():
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Category with id {expense_update.category_id} not found"
+            )
+        raise
+    if updated_expense is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Expense with id {expense_id} not found"
+        )
     return updated_expense
 
 
 @router.delete("/{expense_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_expense(
     expense_id: int,
-    current_user: models.User = Depends(get_current_user),
+    current_user: schemas.CurrentUser = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Delete an expense"""
@@ -0,0 +1,20 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+
+from .. import metrics, schemas
+from ..dependencies import get_current_user
+
+router = APIRouter(
+    prefix="/metrics",
+    tags=["Metrics"]
+)
+
+
+@router.get("")
+def get_metrics(current_user: schemas.CurrentUser = Depends(get_current_user)):
+    """Counters and timings of this worker process (admin only)"""
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admin can view metrics"
+        )
+    return metrics.snapshot()
@@ -0,0 +1,149 @@
+import os
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import FileResponse
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .. import jobs, schemas, models, snapshots
+from ..dependencies import get_db, get_current_user
+from ..reports import ANNUAL_REPORT
+from ..snapshots import SNAPSHOT_EXPORT
+
+router = APIRouter(
+    prefix="/reports",
+    tags=["Reports"]
+)
+
+
+def _job_out(job: models.Job) -> schemas.JobOut:
+    job_out = schemas.JobOut.model_validate(job)
+    if job.status == "succeeded":
+        job_out.download_url = f"/reports/{job.id}/download"
+    return job_out
+
+
+def _get_report_job(db: Session, job_id: int, current_user: schemas.CurrentUser) -> models.Job:
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admin can access reports"
+        )
+    job = db.query(models.Job).filter(models.Job.id == job_id, models.Job.kind == ANNUAL_REPORT).first()
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Report with id {job_id} not found"
+        )
+    return job
+
+
+@router.post("", response_model=schemas.JobOut, status_code=status.HTTP_202_ACCEPTED)
+def create_report(
+    report: schemas.ReportCreate,
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Queue an annual report; poll GET /reports/{id} until it has succeeded (admin only)"""
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admin can create reports"
+        )
+    job = jobs.enqueue(db, ANNUAL_REPORT, report.model_dump(), user_id=current_user.id)
+    return _job_out(job)
+
+
+@router.post("/snapshots", response_model=schemas.JobOut, status_code=status.HTTP_202_ACCEPTED)
+def create_snapshot(
+    snapshot: schemas.SnapshotCreate,
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Queue an export of villages, budgets, categories and expenses into
+    columnar files under SNAPSHOT_DIR; poll GET /reports/snapshots/{id}
+    (admin only)
+    """
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admin can export snapshots"
+        )
+    if snapshot.format not in snapshots.FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"format must be one of: {', '.join(snapshots.FORMATS)}"
+        )
+    if not snapshots.available():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Snapshots need PyArrow; install the snapshots extra"
+        )
+    manifest = snapshots.load_manifest()
+    if snapshot.incremental and manifest is not None and manifest["format"] != snapshot.format:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"The snapshot is in {manifest['format']} format; export in full to switch"
+        )
+    # Exports append to the same files, so they run one at a time; the jobs
+    # table's unique index on active lock keys refuses a second one
+    try:
+        return jobs.enqueue(db, SNAPSHOT_EXPORT, snapshot.model_dump(), user_id=current_user.id, exclusive=True)
+    except IntegrityError:
+        db.rollback()
+        pending = db.query(models.Job.id).filter(
+            models.Job.lock_key == SNAPSHOT_EXPORT, models.Job.status.in_(("queued", "running"))
+        ).first()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Snapshot export {pending.id} has not finished yet" if pending
+            else "Another snapshot export has not finished yet"
+        )
+
+
+@router.get("/snapshots/{job_id}", response_model=schemas.JobOut)
+def get_snapshot(
+    job_id: int,
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Status and progress of a snapshot export (admin only)"""
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admin can view snapshot exports"
+        )
+    job = db.query(models.Job).filter(models.Job.id == job_id, models.Job.kind == SNAPSHOT_EXPORT).first()
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Snapshot export with id {job_id} not found"
+        )
+    return job
+
+
+@router.get("/{job_id}", response_model=schemas.JobOut)
+def get_report(
+    job_id: int,
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Status and progress of a report"""
+    return _job_out(_get_report_job(db, job_id, current_user))
+
+
+@router.get("/{job_id}/download")
+def download_report(
+    job_id: int,
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Download a finished report as CSV"""
+    job = _get_report_job(db, job_id, current_user)
+    if job.status != "succeeded" or not job.artifact_path or not os.path.exists(job.artifact_path):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Report with id {job_id} is not ready (status: {job.status})"
+        )
+    return FileResponse(job.artifact_path, media_type="text/csv", filename=f"report-{job_id}.csv")
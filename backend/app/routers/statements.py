@@ -0,0 +1,70 @@
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from sqlalchemy.orm import Session
+
+from .. import crud, jobs, schemas, models
+from ..dependencies import get_db, get_current_user
+from ..reports import REBUILD_STATEMENTS
+
+router = APIRouter(
+    prefix="/statements",
+    tags=["Statements"]
+)
+
+
+@router.post("/rebuild", response_model=schemas.JobOut, status_code=status.HTTP_202_ACCEPTED)
+def rebuild_statements(
+    year: int,
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Rebuild all stale statements of a year in the background; poll with GET /statements/rebuild/{id} (admin only)"""
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admin can rebuild statements"
+        )
+    return jobs.enqueue(db, REBUILD_STATEMENTS, {"year": year}, user_id=current_user.id)
+
+
+@router.get("/rebuild/{job_id}", response_model=schemas.JobOut)
+def get_rebuild(
+    job_id: int,
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Status and progress of a statement rebuild (admin only)"""
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admin can view statement rebuilds"
+        )
+    job = db.query(models.Job).filter(models.Job.id == job_id, models.Job.kind == REBUILD_STATEMENTS).first()
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Statement rebuild with id {job_id} not found"
+        )
+    return job
+
+
+@router.get("/{village_id}/{year}", response_model=schemas.StatementOut)
+def get_statement(
+    village_id: int,
+    year: int,
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Annual statement of a village: budget, categories, spent and remaining"""
+    if current_user.role != "admin" and current_user.village_id != village_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied to this village"
+        )
+    payload = crud.get_annual_statement(db=db, village_id=village_id, year=year)
+    if payload is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Budget for village {village_id} and year {year} not found"
+        )
+    # Stored already serialized, so it is sent as is
+    return Response(content=payload, media_type="application/json")
@@ -0,0 +1,71 @@
+import base64
+import binascii
+from datetime import datetime
+from typing import Optional, Union
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+
+from .. import change_versions, crud, schemas, models
+from ..dependencies import get_read_db, get_current_user
+
+router = APIRouter(
+    prefix="/sync",
+    tags=["Sync"]
+)
+
+
+def _encode_token(version: int) -> str:
+    return base64.urlsafe_b64encode(str(version).encode()).decode()
+
+
+def _decode_token(token: str) -> Union[int, datetime]:
+    """A change version, or the timestamp held by tokens issued before versions"""
+    try:
+        decoded = base64.urlsafe_b64decode(token.encode()).decode()
+        return int(decoded) if decoded.isdigit() else datetime.fromisoformat(decoded)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid sync token"
+        )
+
+
+@router.get("", response_model=schemas.SyncOut)
+def sync(
+    since: Optional[str] = None,
+    village_id: Optional[int] = None,
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Rows of the caller's village changed since the last sync token, plus
+    tombstones for deleted rows. Omit `since` for a full download; pass the
+    returned token on the next call. Admins must choose a village_id.
+    """
+    if current_user.role == "admin":
+        if village_id is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Admin must provide village_id to sync"
+            )
+    else:
+        if current_user.village_id is None:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="User is not assigned to any village"
+            )
+        if village_id is not None and village_id != current_user.village_id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Access denied to this village"
+            )
+        village_id = current_user.village_id
+
+    since_version = _decode_token(since) if since else None
+
+    # Taken before reading, so rows committed meanwhile come again next time
+    token = _encode_token(change_versions.current_token(db))
+
+    changes = crud.get_changes_since(db=db, village_id=village_id, since=since_version)
+    return {"token": token, **changes}
@@ -2,8 +2,9 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from typing import List
 
-from .. import crud, schemas, models
-from ..dependencies import get_db, get_current_user
+from .. import crud, jobs, schemas, models
+from ..dependencies import get_db, get_read_db, get_current_user
+from ..reports import PURGE_VILLAGE
 
 router = APIRouter(
     prefix="/villages",
@@ -13,7 +14,7 @@ router = APIRouter(
 
 @router.get("/public", response_model=List[schemas.VillageOut])
 def list_villages_public(
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """List all villages (public endpoint for registration)"""
     villages = crud.get_villages(db=db, skip=0, limit=100)
@@ -22,8 +23,8 @@ def list_villages_public(
 
 @router.get("/", response_model=List[schemas.VillageOut])
 def list_villages(
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
 ):
     """List villages - admin sees all, villagers see only their village"""
     if current_user.role == "admin":
@@ -40,8 +41,8 @@ def list_villages(
 
 @router.get("/me", response_model=schemas.VillageOut)
 def get_my_village(
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
 ):
     """Get the current user's village details"""
     if current_user.village_id is None:
@@ -61,7 +62,7 @@ def get_my_village(
 @router.post("/", response_model=schemas.VillageOut, status_code=status.HTTP_201_CREATED)
 def create_village(
     village: schemas.VillageCreate,
-    current_user: models.User = Depends(get_current_user),
+    current_user: schemas.CurrentUser = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Create a new village (admin only)"""
@@ -76,8 +77,8 @@ def create_village(
 @router.get("/{village_id}", response_model=schemas.VillageOut)
 def get_village(
     village_id: int,
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
 ):
     """Get a specific village by ID"""
     village = crud.get_village_by_id(db=db, village_id=village_id)
@@ -100,23 +101,66 @@ def get_village(
 @router.delete("/{village_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_village(
     village_id: int,
-    current_user: models.User = Depends(get_current_user),
+    current_user: schemas.CurrentUser = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Delete a village (admin only)"""
+    """
+    Delete a village with everything under it in one transaction (admin
+    only); POST /villages/{id}/purge deletes very large villages in batches
+    """
     if current_user.role != "admin":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Only admins can delete villages"
         )
     
-    village = crud.get_village_by_id(db=db, village_id=village_id)
-    if village is None:
+    if not crud.delete_village(db=db, village_id=village_id):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Village with id {village_id} not found"
         )
-    
-    db.delete(village)
-    db.commit()
     return None
+
+
+@router.post("/{village_id}/purge", response_model=schemas.JobOut, status_code=status.HTTP_202_ACCEPTED)
+def purge_village(
+    village_id: int,
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Delete a very large village in the background, its expenses in batches
+    committed one at a time; poll GET /villages/purge/{job_id} (admin only)
+    """
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admins can delete villages"
+        )
+    if crud.get_village_by_id(db=db, village_id=village_id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Village with id {village_id} not found"
+        )
+    return jobs.enqueue(db, PURGE_VILLAGE, {"village_id": village_id}, user_id=current_user.id)
+
+
+@router.get("/purge/{job_id}", response_model=schemas.JobOut)
+def get_purge(
+    job_id: int,
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Status and progress of a village purge (admin only)"""
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admins can view village purges"
+        )
+    job = db.query(models.Job).filter(models.Job.id == job_id, models.Job.kind == PURGE_VILLAGE).first()
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Village purge with id {job_id} not found"
+        )
+    return job
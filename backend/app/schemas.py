@@ -1,7 +1,16 @@
-from pydantic import BaseModel, ConfigDict, EmailStr
-from typing import Optional, List
+import json
+
+from pydantic import BaseModel, BeforeValidator, ConfigDict, EmailStr, Field, field_validator
+from typing import Annotated, Dict, Optional, List
 from datetime import datetime, date
 from decimal import Decimal
+from uuid import UUID
+
+from . import money
+
+# An amount computed in storage units (rupees or paise, see money.py),
+# exposed in rupees
+Money = Annotated[Decimal, BeforeValidator(money.from_storage)]
 
 
 # ============ User Schemas ============
@@ -33,12 +42,24 @@ class UserLogin(BaseModel):
     village_id: Optional[int] = None  # Required for villagers
 
 
+class CurrentUser(BaseModel):
+    """The authenticated user, as described by the signed token claims"""
+    id: int
+    role: str
+    village_id: Optional[int] = None
+
+
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
     user: UserOut
 
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+
 # ============ Village Schemas ============
 
 class VillageCreate(BaseModel):
@@ -123,4 +144,260 @@ class ExpenseOut(BaseModel):
     amount: Decimal
     vendor_name: Optional[str] = None
     expense_date: date
+    client_uuid: Optional[str] = None
+    created_at: datetime
+
+
+class ExpenseBatchItem(ExpenseCreate):
+    client_uuid: UUID
+
+
+class ExpenseBatch(BaseModel):
+    items: List[ExpenseBatchItem] = Field(max_length=5000)
+
+
+class ExpenseBatchItemResult(BaseModel):
+    client_uuid: UUID
+    status: str  # 'created', 'duplicate' or 'rejected'
+    id: Optional[int] = None
+    detail: Optional[str] = None
+
+
+class CategoryTreeOut(CategoryOut):
+    allocated_amount: Money
+    spent_amount: Money
+    remaining_amount: Money
+    expense_count: int
+    recent_expenses: List[ExpenseOut]
+
+
+class BudgetTreeOut(BudgetOut):
+    total_allocated: Money
+    spent_amount: Money
+    remaining_amount: Money
+    categories: List[CategoryTreeOut]
+
+
+class RemainingBudgetOut(BaseModel):
+    category_id: int
+    category_name: str
+    allocated_amount: Money
+    spent_amount: Money
+    remaining_amount: Money
+
+
+class ExpenseFilter(BaseModel):
+    category_id: Optional[int] = None
+    budget_id: Optional[int] = None
+    vendor_name: Optional[str] = None
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None
+
+
+class ExpenseQuery(ExpenseFilter):
+    """Filters of the expense listing; amounts in rupees"""
+    amount_min: Optional[Decimal] = None
+    amount_max: Optional[Decimal] = None
+    year: Optional[int] = None
+    village_id: Optional[int] = None
+
+
+class ExpenseBulkDelete(BaseModel):
+    ids: Optional[List[int]] = None
+    filter: Optional[ExpenseFilter] = None
+
+
+class ExpenseBulkUpdate(ExpenseBulkDelete):
+    changes: ExpenseUpdate
+
+
+class BulkResult(BaseModel):
+    affected: int
+
+
+# ============ Sync Schemas ============
+
+class DeletedRecordOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    entity: str
+    entity_id: int
+    deleted_at: datetime
+
+
+class SyncOut(BaseModel):
+    token: str
+    villages: List[VillageOut]
+    budgets: List[BudgetOut]
+    categories: List[CategoryOut]
+    expenses: List[ExpenseOut]
+    deleted: List[DeletedRecordOut]
+
+
+# ============ Analytics Schemas ============
+
+class RollupNode(BaseModel):
+    state: Optional[str] = None
+    district: Optional[str] = None
+    village_id: Optional[int] = None
+    village_name: Optional[str] = None
+    village_count: int
+    budget_count: int
+    allocated: Money
+    spent: Money
+    utilization: float
+
+
+class RollupOut(BaseModel):
+    level: str
+    year: Optional[int] = None
+    nodes: List[RollupNode]
+
+
+class YearAmounts(BaseModel):
+    year: int
+    allocated: Money
+    spent: Money
+    # Change from the previous requested year; None for the first
+    allocated_change: Optional[Money] = None
+    spent_change: Optional[Money] = None
+
+
+class CategoryYearOverYear(BaseModel):
+    category_name: str
+    years: List[YearAmounts]
+
+
+class YearOverYearOut(BaseModel):
+    village_id: Optional[int] = None
+    years: List[int]
+    categories: List[CategoryYearOverYear]
+    totals: List[YearAmounts]
+
+
+class HistogramBucket(BaseModel):
+    lower: Decimal
+    upper: Decimal
+    count: int
+
+
+class CategoryDistribution(BaseModel):
+    category_name: str
+    count: int
+    total: Decimal
+    mean: Decimal
+    median: Decimal
+    p90: Decimal
+
+
+class DailySpend(BaseModel):
+    day: date
+    spent: Decimal
+    moving_average: Decimal
+
+
+class DistributionOut(BaseModel):
+    year: Optional[int] = None
+    state: Optional[str] = None
+    district: Optional[str] = None
+    village_id: Optional[int] = None
+    count: int
+    total: Decimal
+    mean: Decimal
+    percentiles: Dict[str, Decimal]
+    histogram: List[HistogramBucket]
+    categories: List[CategoryDistribution]
+    daily: List[DailySpend]
+
+
+class CategoryForecast(BaseModel):
+    id: int
+    category_name: str
+    allocated_amount: Decimal
+    spent: Decimal
+    daily_burn_rate: Decimal
+    linear_projection: Decimal
+    seasonal_projection: Optional[Decimal] = None  # None without earlier years to go by
+    projected: Decimal  # seasonal if available, else linear
+    projected_remaining: Decimal
+    runs_out_on: Optional[date] = None  # when spent reached, or at the linear rate reaches, the allocation
+    at_risk: bool  # projected above the allocation
+
+
+class ForecastOut(BaseModel):
+    budget_id: int
+    village_id: int
+    year: int
+    as_of: date
+    days_elapsed: int
+    days_in_year: int
+    allocated: Decimal
+    spent: Decimal
+    projected: Decimal
+    categories: List[CategoryForecast]
+
+
+# ============ Statement Schemas ============
+
+class StatementCategory(BaseModel):
+    id: int
+    category_name: str
+    allocated_amount: Money
+    spent: Money
+    remaining: Money
+
+
+class StatementOut(BaseModel):
+    village_id: int
+    year: int
+    budget_id: int
+    total_allocated: Money
+    categories_allocated: Money
+    spent: Money
+    remaining: Money
+    categories: List[StatementCategory]
+    computed_at: datetime
+
+
+# ============ Audit Schemas ============
+
+class AuditLogOut(BaseModel):
+    id: int
+    ts: datetime
+    actor_id: Optional[int] = None
+    action: str
+    entity: str
+    entity_id: int
+    before: Optional[dict] = None
+    after: Optional[dict] = None
+    model_config = ConfigDict(from_attributes=True)
+
+    @field_validator("before", "after", mode="before")
+    @classmethod
+    def parse_json(cls, value):
+        return json.loads(value) if isinstance(value, str) else value
+
+
+# ============ Job Schemas ============
+
+class JobOut(BaseModel):
+    id: int
+    kind: str
+    status: str
+    progress: float
     created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
+    download_url: Optional[str] = None
+    model_config = ConfigDict(from_attributes=True)
+
+
+class ReportCreate(BaseModel):
+    year: int
+    state: Optional[str] = None
+
+
+class SnapshotCreate(BaseModel):
+    format: str = "arrow"  # or "parquet"
+    incremental: bool = True  # only rows added since the last export
@@ -0,0 +1,312 @@
+# snapshots.py
+"""
+Columnar snapshots of villages, budgets, categories and expenses, so the data
+team can analyse copies instead of querying the database.
+
+export() copies each table into compressed Arrow IPC (the default) or
+Parquet files under SNAPSHOT_DIR. Rows are read from a replica when one is
+healthy, SNAPSHOT_BATCH_ROWS at a time in id order, and each batch is written
+as one record batch (or Parquet row group), so neither side ever holds a
+whole table. A manifest lists the files of every table and its watermarks,
+the highest id and created_at exported. An incremental export copies rows
+above the id watermark into new files, plus late commits: rows that took
+their id before the previous export began but committed after it, so that
+export could not see them. They are found among rows written (updated_at)
+within SNAPSHOT_LATE_COMMIT_SECONDS before the previous export whose ids are
+missing from its files; a transaction open longer than that, or app clocks
+further apart, can still slip past. Rows updated or deleted after they were
+exported change only with a full export, which replaces the lot.
+
+read_table() memory-maps the files of a table back into one Arrow table. With
+SNAPSHOT_COMPRESSION=none, Arrow files are read without copying at all.
+PyArrow comes with the `snapshots` extra and is imported on first use.
+"""
+
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+from importlib.util import find_spec
+from typing import Callable, List, Optional
+
+from sqlalchemy import BigInteger, Boolean, Date, DateTime, Integer, Numeric, func, select
+
+from . import jobs, models
+from .database import SessionLocal, replicas
+
+SNAPSHOT_DIR = os.path.abspath(os.getenv("SNAPSHOT_DIR", "snapshots"))
+SNAPSHOT_BATCH_ROWS = int(os.getenv("SNAPSHOT_BATCH_ROWS", "50000"))
+# zstd or lz4 for both formats, snappy for Parquet only, or none
+SNAPSHOT_COMPRESSION = os.getenv("SNAPSHOT_COMPRESSION", "zstd").lower()
+# How long an insert may stay uncommitted and still reach the next incremental export
+SNAPSHOT_LATE_COMMIT_SECONDS = float(os.getenv("SNAPSHOT_LATE_COMMIT_SECONDS", "600"))
+
+FORMATS = {"arrow": "arrow", "parquet": "parquet"}  # format -> file extension
+MANIFEST = "manifest.json"
+
+TABLES = {
+    table.name: table for table in (
+        models.Village.__table__,
+        models.Budget.__table__,
+        models.BudgetCategory.__table__,
+        models.Expense.__table__,
+    )
+}
+
+# One export at a time per process; the endpoint also refuses to queue a
+# second export while one is pending
+_export_lock = threading.Lock()
+
+
+def available() -> bool:
+    """Whether PyArrow is installed"""
+    return find_spec("pyarrow") is not None
+
+
+def arrow_schema(table) -> "pyarrow.Schema":
+    """The Arrow schema of a table, column by column"""
+    import pyarrow as pa
+
+    fields = []
+    for column in table.columns:
+        if isinstance(column.type, (Integer, BigInteger)):
+            arrow_type = pa.int64()
+        elif isinstance(column.type, Numeric):
+            arrow_type = pa.decimal128(column.type.precision, column.type.scale)
+        elif isinstance(column.type, DateTime):
+            arrow_type = pa.timestamp("us")
+        elif isinstance(column.type, Date):
+            arrow_type = pa.date32()
+        elif isinstance(column.type, Boolean):
+            arrow_type = pa.bool_()
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(column.name, arrow_type, nullable=column.nullable))
+    return pa.schema(fields)
+
+
+def load_manifest(directory: str = SNAPSHOT_DIR) -> Optional[dict]:
+    """The manifest of the snapshot in directory, or None before the first export"""
+    try:
+        with open(os.path.join(directory, MANIFEST), encoding="utf-8") as handle:
+            return json.load(handle)
+    except FileNotFoundError:
+        return None
+
+
+def _write_json(path: str, value: dict) -> None:
+    partial = path + ".part"
+    with open(partial, "w", encoding="utf-8") as handle:
+        json.dump(value, handle, indent=2)
+    os.replace(partial, path)
+
+
+class _PartWriter:
+    """Writes record batches into one new file, which appears under its name only once closed"""
+
+    def __init__(self, path: str, file_format: str, schema: "pyarrow.Schema"):
+        import pyarrow as pa
+
+        self.path = path
+        self.partial = path + ".part"
+        self.parquet = file_format == "parquet"
+        compression = None if SNAPSHOT_COMPRESSION == "none" else SNAPSHOT_COMPRESSION
+        if self.parquet:
+            import pyarrow.parquet as pq
+
+            self.writer = pq.ParquetWriter(self.partial, schema, compression=compression or "none")
+        else:
+            self.writer = pa.ipc.new_file(
+                self.partial, schema, options=pa.ipc.IpcWriteOptions(compression=compression)
+            )
+
+    def write(self, batch: "pyarrow.RecordBatch") -> None:
+        if self.parquet:
+            # One row group per batch
+            self.writer.write_batch(batch, row_group_size=batch.num_rows)
+        else:
+            self.writer.write_batch(batch)
+
+    def close(self) -> None:
+        self.writer.close()
+        os.replace(self.partial, self.path)
+
+
+def _late_ids(db, name: str, previous: dict, directory: str) -> List[int]:
+    """Ids the previous export could not see yet: written shortly before it, not in its files"""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    table = TABLES[name]
+    since = datetime.fromisoformat(previous["exported_at"]) - timedelta(seconds=SNAPSHOT_LATE_COMMIT_SECONDS)
+    candidates = db.execute(
+        select(table.c.id).where(
+            table.c.id <= previous["tables"][name]["watermark"]["id"],
+            table.c.updated_at >= since
+        )
+    ).scalars().all()
+    if not candidates:
+        return []
+    # Mostly rows updated since, which are in the files already
+    candidates = pa.array(candidates, type=pa.int64())
+    exported = read_table(name, directory, columns=["id"]).column("id")
+    return pc.filter(candidates, pc.invert(pc.is_in(candidates, value_set=exported))).to_pylist()
+
+
+def _read_session():
+    replica = replicas.choose()
+    return replica.SessionLocal() if replica is not None else SessionLocal()
+
+
+def export(
+    file_format: str = "arrow",
+    incremental: bool = True,
+    directory: str = SNAPSHOT_DIR,
+    report_progress: Optional[Callable[[float], None]] = None
+) -> str:
+    """
+    Export every table into directory and return the manifest path. An
+    incremental export needs a previous export in the same format; without
+    one it exports everything.
+    """
+    import pyarrow as pa
+
+    if file_format not in FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(FORMATS)}")
+
+    with _export_lock:
+        existing = load_manifest(directory)
+        if incremental and existing is not None and existing["format"] != file_format:
+            raise ValueError(
+                f"The snapshot in {directory} is in {existing['format']} format; export in full to switch"
+            )
+        previous = existing if incremental else None
+        # Part numbers continue across exports, so a full export never
+        # overwrites files the previous manifest still lists
+        sequence = max(
+            (part["sequence"] for table in existing["tables"].values() for part in table["parts"]),
+            default=0
+        ) if existing else 0
+        started_at = datetime.utcnow()
+        manifest = {"format": file_format, "compression": SNAPSHOT_COMPRESSION, "tables": {}}
+
+        db = _read_session()
+        try:
+            watermarks = {
+                name: (previous["tables"][name]["watermark"] if previous else {"id": 0, "created_at": None})
+                for name in TABLES
+            }
+            late = {
+                name: _late_ids(db, name, previous, directory) if previous else []
+                for name in TABLES
+            }
+            pending = {
+                name: len(late[name]) + db.execute(
+                    select(func.count()).select_from(table).where(table.c.id > watermarks[name]["id"])
+                ).scalar()
+                for name, table in TABLES.items()
+            }
+            total, done = sum(pending.values()), 0
+
+            for name, table in TABLES.items():
+                schema = arrow_schema(table)
+                watermark = dict(watermarks[name])
+                parts = list(previous["tables"][name]["parts"]) if previous else []
+                writer, rows_written = None, 0
+                # Late commits first, then everything above the watermark
+                late_batches = (
+                    table.c.id.in_(late[name][start:start + SNAPSHOT_BATCH_ROWS])
+                    for start in range(0, len(late[name]), SNAPSHOT_BATCH_ROWS)
+                )
+                while True:
+                    condition = next(late_batches, None)
+                    rows = db.execute(
+                        select(*table.columns)
+                        .where(condition if condition is not None else table.c.id > watermark["id"])
+                        .order_by(table.c.id)
+                        .limit(SNAPSHOT_BATCH_ROWS)
+                    ).all()
+                    if not rows:
+                        if condition is not None:
+                            continue
+                        break
+                    if writer is None:
+                        sequence += 1
+                        file_name = f"{name}/part-{sequence:05d}.{FORMATS[file_format]}"
+                        os.makedirs(os.path.join(directory, name), exist_ok=True)
+                        writer = _PartWriter(os.path.join(directory, file_name), file_format, schema)
+                    values = list(zip(*rows))
+                    writer.write(pa.record_batch(
+                        [pa.array(column, type=field.type) for column, field in zip(values, schema)],
+                        schema=schema
+                    ))
+                    rows_written += len(rows)
+                    watermark["id"] = max(watermark["id"], rows[-1].id)
+                    if "created_at" in table.c:
+                        created = [value for value in values[schema.get_field_index("created_at")] if value]
+                        if created and (
+                            watermark["created_at"] is None
+                            or max(created) > datetime.fromisoformat(watermark["created_at"])
+                        ):
+                            watermark["created_at"] = max(created).isoformat()
+                    done += len(rows)
+                    if report_progress is not None and total:
+                        report_progress(done / total)
+                if writer is not None:
+                    writer.close()
+                    parts.append({"sequence": sequence, "file": file_name, "rows": rows_written})
+                manifest["tables"][name] = {
+                    "watermark": watermark,
+                    "rows": sum(part["rows"] for part in parts),
+                    "parts": parts,
+                }
+        finally:
+            db.close()
+
+        manifest["exported_at"] = started_at.isoformat()
+        path = os.path.join(directory, MANIFEST)
+        os.makedirs(directory, exist_ok=True)
+        _write_json(path, manifest)
+
+        # Files a full export replaced
+        listed = {part["file"] for table in manifest["tables"].values() for part in table["parts"]}
+        for name in TABLES:
+            table_directory = os.path.join(directory, name)
+            if os.path.isdir(table_directory):
+                for file_name in os.listdir(table_directory):
+                    if f"{name}/{file_name}" not in listed:
+                        os.remove(os.path.join(table_directory, file_name))
+        return path
+
+
+def read_table(name: str, directory: str = SNAPSHOT_DIR, columns: Optional[List[str]] = None) -> "pyarrow.Table":
+    """All exported rows of a table (or only some columns), memory-mapped from its files"""
+    import pyarrow as pa
+
+    manifest = load_manifest(directory)
+    if manifest is None or name not in manifest["tables"]:
+        raise FileNotFoundError(f"No snapshot of {name} in {directory}")
+    schema = arrow_schema(TABLES[name])
+    if columns is not None:
+        schema = pa.schema([schema.field(column) for column in columns])
+    tables = []
+    for part in manifest["tables"][name]["parts"]:
+        path = os.path.join(directory, part["file"])
+        if manifest["format"] == "parquet":
+            import pyarrow.parquet as pq
+
+            tables.append(pq.read_table(path, columns=columns, memory_map=True))
+        else:
+            with pa.memory_map(path) as source:
+                table = pa.ipc.open_file(source).read_all()
+                tables.append(table.select(columns) if columns is not None else table)
+    return pa.concat_tables(tables) if tables else schema.empty_table()
+
+
+SNAPSHOT_EXPORT = "snapshot_export"
+
+
+@jobs.handler(SNAPSHOT_EXPORT)
+def export_snapshot(db, job: models.Job, params: dict, report_progress) -> str:
+    """Export a snapshot as params["format"], incrementally if params["incremental"]"""
+    return export(params["format"], params["incremental"], report_progress=report_progress)
@@ -0,0 +1,81 @@
+# sqlite_compat.py
+"""
+What it takes to run the app on SQLite instead of Postgres, for tests,
+benchmarks and local development without a database server.
+
+Imported by database.make_engine only for sqlite URLs, so a Postgres
+deployment never loads the sqlite3 module.
+"""
+
+import sqlite3
+import threading
+import warnings
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import StaticPool
+
+
+class SerializedConnection(sqlite3.Connection):
+    """
+    The single connection behind an in-memory database, shared by request,
+    job and audit threads. Statements, commits and rollbacks run one at a
+    time, so two threads cannot both begin a transaction on it; their
+    transactions are still not isolated from each other, so test concurrency
+    against a file database instead.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lock = threading.RLock()
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or SerializedCursor)
+
+    def commit(self):
+        with self.lock:
+            super().commit()
+
+    def rollback(self):
+        with self.lock:
+            super().rollback()
+
+
+class SerializedCursor(sqlite3.Cursor):
+    def execute(self, *args, **kwargs):
+        with self.connection.lock:
+            return super().execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        with self.connection.lock:
+            return super().executemany(*args, **kwargs)
+
+
+def _enable_foreign_keys(dbapi_connection, connection_record) -> None:
+    # Off by default in SQLite; needed for ON DELETE CASCADE / SET NULL
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+def engine_options(in_memory: bool, kw: dict) -> dict:
+    """create_engine() arguments for a SQLite database"""
+    connect_args = kw.setdefault("connect_args", {})
+    # Sessions are used from the job and audit threads too
+    connect_args["check_same_thread"] = False
+    if in_memory:
+        # Every new connection would open an empty database of its own
+        kw["poolclass"] = StaticPool
+        connect_args["factory"] = SerializedConnection
+    return kw
+
+
+def configure(engine: Engine) -> Engine:
+    """Make a SQLite engine behave like the Postgres one where the app relies on it"""
+    event.listen(engine, "connect", _enable_foreign_keys)
+    # SQLite stores NUMERIC as a double; Numeric(12, 2) amounts fit well within
+    # its 15 significant digits and are quantized back to Decimal when read
+    warnings.filterwarnings(
+        "ignore", message=r".*does \*not\* support Decimal objects natively", category=exc.SAWarning
+    )
+    return engine
@@ -0,0 +1,74 @@
+# stale_statements.py
+"""
+Triggers that mark annual statements stale.
+
+Any write to an expense or a category changes the statement of its budget,
+so the database marks that statement stale and bumps its version in the
+same transaction as the write. Doing it in a trigger rather than from crud
+costs writes no extra round trip, and also covers bulk updates and deletes,
+purges and cascades. The version bump is what stops a rebuild that started
+before the write from storing its older figures as fresh.
+
+On SQLite the triggers run per row. On Postgres they run once per statement
+over its transition tables, so a bulk write updates each statement row once.
+The migration that added them creates them, and models.py does so for
+databases built from the models. Batch migrations rebuild tables on SQLite,
+dropping their triggers, so one that batch-alters expenses or
+budget_categories has to recreate them.
+"""
+
+STALE = "UPDATE annual_statements SET stale = {true}, version = version + 1 WHERE budget_id IN ({budgets})"
+
+# Budgets of the categories that a set of expense rows belong to
+_EXPENSE_BUDGETS = "SELECT budget_id FROM budget_categories WHERE id IN ({rows})"
+
+SQLITE_TRIGGERS = [
+    f"CREATE TRIGGER {table}_statements_stale_{event.lower()} AFTER {event} ON {table} "
+    f"BEGIN {STALE.format(true=1, budgets=budgets)}; END"
+    for table, event, budgets in (
+        ("expenses", "INSERT", _EXPENSE_BUDGETS.format(rows="NEW.category_id")),
+        ("expenses", "UPDATE", _EXPENSE_BUDGETS.format(rows="OLD.category_id, NEW.category_id")),
+        ("expenses", "DELETE", _EXPENSE_BUDGETS.format(rows="OLD.category_id")),
+        ("budget_categories", "INSERT", "NEW.budget_id"),
+        ("budget_categories", "UPDATE", "OLD.budget_id, NEW.budget_id"),
+        ("budget_categories", "DELETE", "OLD.budget_id"),
+    )
+]
+
+
+def _postgresql_function(table: str, column: str, budgets: str) -> str:
+    # Transition tables only exist for the events that define them, and
+    # PL/pgSQL plans each branch when it first runs, so one function serves
+    # all three triggers
+    return f"""
+CREATE FUNCTION {table}_mark_statements_stale() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        {STALE.format(true="true", budgets=budgets.format(rows=f"SELECT {column} FROM new_rows"))};
+    ELSIF TG_OP = 'DELETE' THEN
+        {STALE.format(true="true", budgets=budgets.format(rows=f"SELECT {column} FROM old_rows"))};
+    ELSE
+        {STALE.format(true="true", budgets=budgets.format(
+            rows=f"SELECT {column} FROM new_rows UNION SELECT {column} FROM old_rows"
+        ))};
+    END IF;
+    RETURN NULL;
+END
+$$"""
+
+
+_TRANSITIONS = {
+    "INSERT": "NEW TABLE AS new_rows",
+    "UPDATE": "OLD TABLE AS old_rows NEW TABLE AS new_rows",
+    "DELETE": "OLD TABLE AS old_rows",
+}
+
+POSTGRESQL_TRIGGERS = [
+    _postgresql_function("expenses", "category_id", _EXPENSE_BUDGETS),
+    _postgresql_function("budget_categories", "budget_id", "{rows}"),
+] + [
+    f"CREATE TRIGGER {table}_statements_stale_{event.lower()} AFTER {event} ON {table} "
+    f"REFERENCING {transitions} FOR EACH STATEMENT EXECUTE FUNCTION {table}_mark_statements_stale()"
+    for table in ("expenses", "budget_categories")
+    for event, transitions in _TRANSITIONS.items()
+]
@@ -0,0 +1,369 @@
+# stats.py
+"""
+Vectorized statistics over expenses, behind the analytics endpoints.
+
+load_expenses() fetches the amount (as integer paise), date and category of
+every expense in a village scope in one query, straight into NumPy arrays.
+The functions below then group, sum and rank whole arrays at once instead of
+Decimals row by row, and forecast() projects the year-end spend of every
+category of a budget at once. NumPy comes with the `analytics` extra and is
+imported on first use, so it adds nothing to startup.
+"""
+
+from datetime import date, timedelta
+from decimal import Decimal
+from importlib.util import find_spec
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import BigInteger, cast, func, select
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.functions import FunctionElement
+
+from . import models, money
+
+PERCENTILES = (10, 25, 50, 75, 90, 99)
+
+CENT = Decimal("0.01")
+
+
+def available() -> bool:
+    """Whether NumPy is installed"""
+    return find_spec("numpy") is not None
+
+
+class epoch_days(FunctionElement):
+    """Days since 1970-01-01 of a date, as an integer"""
+    type = BigInteger()
+    inherit_cache = True
+
+
+@compiles(epoch_days)
+def _epoch_days(element, compiler, **kw):
+    # Subtracting two dates gives a number of days on Postgres
+    return "(%s - DATE '1970-01-01')" % compiler.process(element.clauses, **kw)
+
+
+@compiles(epoch_days, "sqlite")
+def _epoch_days_sqlite(element, compiler, **kw):
+    return "CAST(julianday(%s) - 2440587.5 AS INTEGER)" % compiler.process(element.clauses, **kw)
+
+
+def paise_of(attribute):
+    """A rupee column (e.g. Expense.amount) as integer paise, computed by the database"""
+    if money.use_paise():
+        return money.column(attribute)
+    # Rounded to paise by the database, so no Decimal is ever built
+    return cast(func.round(attribute * 100), BigInteger)
+
+
+class ExpenseColumns(NamedTuple):
+    """The expenses of a scope, one int64 array per column"""
+    amount: "numpy.ndarray"       # paise
+    day: "numpy.ndarray"          # days since 1970-01-01
+    category_id: "numpy.ndarray"
+
+
+def load_expenses(
+    db: Session,
+    year: Optional[int] = None,
+    state: Optional[str] = None,
+    district: Optional[str] = None,
+    village_id: Optional[int] = None,
+    through_year: Optional[int] = None
+) -> ExpenseColumns:
+    """
+    Fetch the columns of every expense in scope with one query; through_year
+    keeps the budgets of that year and earlier
+    """
+    import numpy as np
+
+    query = select(
+        paise_of(models.Expense.amount),
+        epoch_days(models.Expense.expense_date),
+        models.Expense.category_id
+    ).join(
+        models.BudgetCategory, models.BudgetCategory.id == models.Expense.category_id
+    ).join(
+        models.Budget, models.Budget.id == models.BudgetCategory.budget_id
+    )
+    if year is not None:
+        query = query.where(models.Budget.year == year)
+    if through_year is not None:
+        query = query.where(models.Budget.year <= through_year)
+    if village_id is not None:
+        query = query.where(models.Budget.village_id == village_id)
+    if state is not None or district is not None:
+        query = query.join(models.Village, models.Village.id == models.Budget.village_id)
+        if state is not None:
+            query = query.where(models.Village.state == state)
+        if district is not None:
+            query = query.where(models.Village.district == district)
+
+    # Every column is an integer computed by the database, so the rows are
+    # taken straight from the DBAPI cursor without per-row result processing
+    result = db.connection().execute(query)
+    try:
+        rows = result.cursor.fetchall()
+    finally:
+        result.close()
+    table = np.array(rows, dtype=np.int64).reshape(-1, 3)
+    return ExpenseColumns(*table.T.copy())
+
+
+def load_category_names(db: Session, category_ids) -> Dict[int, str]:
+    """Names of the given categories"""
+    import numpy as np
+
+    ids = np.unique(category_ids).tolist()
+    if not ids:
+        return {}
+    return dict(db.execute(
+        select(models.BudgetCategory.id, models.BudgetCategory.category_name)
+        .where(models.BudgetCategory.id.in_(ids))
+    ).all())
+
+
+class BudgetCategory(NamedTuple):
+    id: int
+    category_name: str
+    allocated: int  # paise
+
+
+def load_budget_categories(db: Session, budget_id: int) -> List[BudgetCategory]:
+    """The categories of a budget with their allocations in paise, by id"""
+    return [
+        BudgetCategory(*row) for row in db.execute(
+            select(
+                models.BudgetCategory.id,
+                models.BudgetCategory.category_name,
+                paise_of(models.BudgetCategory.allocated_amount)
+            ).where(models.BudgetCategory.budget_id == budget_id).order_by(models.BudgetCategory.id)
+        )
+    ]
+
+
+def rupees(paise) -> Decimal:
+    """A paise amount (possibly fractional, from a mean or percentile) in rupees"""
+    return (Decimal(int(round(paise))) / 100).quantize(CENT)
+
+
+def group_codes(keys, labels: Dict[int, str]) -> Tuple["numpy.ndarray", List[str]]:
+    """
+    Relabel keys (e.g. category ids) by a coarser label (e.g. category name):
+    returns the label index of every key and the sorted distinct labels
+    """
+    import numpy as np
+
+    names = sorted(set(labels.values()))
+    index = {name: position for position, name in enumerate(names)}
+    ids = np.array(sorted(labels), dtype=np.int64)
+    codes = np.array([index[labels[key]] for key in ids.tolist()], dtype=np.int64)
+    return codes[np.searchsorted(ids, keys)], names
+
+
+def grouped_values(keys, values) -> Tuple["numpy.ndarray", List["numpy.ndarray"]]:
+    """The values of each distinct key, as one sorted array per key"""
+    import numpy as np
+
+    if keys.size == 0:
+        return keys[:0], []
+    order = np.lexsort((values, keys))
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(np.concatenate(([True], sorted_keys[1:] != sorted_keys[:-1])))
+    return sorted_keys[starts], np.split(values[order], starts[1:])
+
+
+def percentiles(values, points: Sequence[float] = PERCENTILES) -> "numpy.ndarray":
+    """Linearly interpolated percentiles, like Postgres percentile_cont"""
+    import numpy as np
+
+    return np.percentile(values, points)
+
+
+def histogram(values, bins: int) -> Tuple["numpy.ndarray", "numpy.ndarray"]:
+    """Counts of values in `bins` equal-width buckets and the bucket edges"""
+    import numpy as np
+
+    return np.histogram(values, bins=bins)
+
+
+def daily_totals(day, values) -> Tuple["numpy.ndarray", "numpy.ndarray"]:
+    """Total per calendar day, from the first to the last day with values"""
+    import numpy as np
+
+    first = day.min()
+    # Float weights are exact for sums of paise up to 2**53
+    totals = np.bincount(day - first, weights=values).astype(np.int64)
+    return (first + np.arange(totals.size)).astype("datetime64[D]"), totals
+
+
+def moving_average(values, window: int) -> "numpy.ndarray":
+    """Trailing mean over the last `window` values (fewer at the start)"""
+    import numpy as np
+
+    cumulative = np.concatenate(([0], np.cumsum(values, dtype=np.int64)))
+    ends = np.arange(1, values.size + 1)
+    starts = np.maximum(ends - window, 0)
+    return (cumulative[ends] - cumulative[starts]) / (ends - starts)
+
+
+def distribution(columns: ExpenseColumns, category_names: Dict[int, str], bins: int, window: int) -> dict:
+    """Percentiles, histogram, per-category statistics and daily trend of amounts"""
+    amount = columns.amount
+    summary = {
+        "count": int(amount.size),
+        "total": rupees(amount.sum()),
+        "mean": rupees(amount.mean()) if amount.size else Decimal("0.00"),
+        "percentiles": {},
+        "histogram": [],
+        "categories": [],
+        "daily": [],
+    }
+    if not amount.size:
+        return summary
+
+    summary["percentiles"] = {
+        f"p{point}": rupees(value) for point, value in zip(PERCENTILES, percentiles(amount))
+    }
+
+    counts, edges = histogram(amount, bins)
+    summary["histogram"] = [
+        {"lower": rupees(edges[i]), "upper": rupees(edges[i + 1]), "count": int(counts[i])}
+        for i in range(len(counts))
+    ]
+
+    codes, names = group_codes(columns.category_id, category_names)
+    group_keys, groups = grouped_values(codes, amount)
+    for key, values in zip(group_keys.tolist(), groups):
+        median, p90 = percentiles(values, (50, 90))
+        summary["categories"].append({
+            "category_name": names[key],
+            "count": int(values.size),
+            "total": rupees(values.sum()),
+            "mean": rupees(values.mean()),
+            "median": rupees(median),
+            "p90": rupees(p90),
+        })
+
+    days, totals = daily_totals(columns.day, amount)
+    averages = moving_average(totals, window)
+    summary["daily"] = [
+        {"day": day, "spent": rupees(total), "moving_average": rupees(average)}
+        for day, total, average in zip(days.tolist(), totals.tolist(), averages.tolist())
+    ]
+    return summary
+
+
+def positions(keys, ids) -> "numpy.ndarray":
+    """Index in ids of every key, or -1 for keys not in ids"""
+    import numpy as np
+
+    if not len(ids):
+        return np.full(len(keys), -1, dtype=np.int64)
+    sorter = np.argsort(ids)
+    found = np.searchsorted(ids, keys, sorter=sorter).clip(max=len(ids) - 1)
+    index = sorter[found]
+    return np.where(ids[index] == keys, index, -1)
+
+
+def forecast(
+    columns: ExpenseColumns,
+    categories: List[BudgetCategory],
+    category_names: Dict[int, str],
+    year: int,
+    as_of: date
+) -> dict:
+    """
+    Year-end spend of every category of a budget of `year`, projected from
+    the spend of its year up to and including as_of.
+
+    The linear projection extends the average daily burn rate so far to the
+    whole year. The seasonal one divides the spend so far by the share of a
+    year's spend that categories of the same name had reached by the same day
+    in earlier years (the rest of `columns`); categories without such
+    history fall back to the linear projection. Every category is projected
+    in the same array operations: expenses are binned into a categories x
+    days matrix whose cumulative sums give the spend to any day.
+    """
+    import numpy as np
+
+    first_day = date(year, 1, 1)
+    days_in_year = (date(year + 1, 1, 1) - first_day).days
+    elapsed = (as_of - first_day).days + 1
+    ids = np.array([category.id for category in categories], dtype=np.int64)
+    allocated = np.array([category.allocated for category in categories], dtype=np.int64)
+    count = ids.size
+
+    # Spend of this budget per category and day of its year
+    row = positions(columns.category_id, ids)
+    current = row >= 0
+    day = (columns.day[current] - (first_day - date(1970, 1, 1)).days).clip(0, days_in_year - 1)
+    daily = np.bincount(
+        row[current] * days_in_year + day, weights=columns.amount[current], minlength=count * days_in_year
+    ).reshape(count, days_in_year)
+    cumulative = daily.cumsum(axis=1)
+    spent = cumulative[:, elapsed - 1]
+    rate = spent / elapsed
+    linear = rate * days_in_year
+
+    # Share of the yearly spend reached by the same day of earlier years, for
+    # the categories of those years with the name of one of this budget's
+    by_name = {}
+    for index, category in enumerate(categories):
+        by_name.setdefault(category.category_name, index)
+    past_ids = np.array(sorted(category_names.keys() - set(ids.tolist())), dtype=np.int64)
+    # Row of this budget for each earlier category, then -1 for every other key
+    past_rows = np.array(
+        [by_name.get(category_names[key], -1) for key in past_ids.tolist()] + [-1], dtype=np.int64
+    )
+    past_row = past_rows[positions(columns.category_id, past_ids)]
+    matched = past_row >= 0
+    dates = columns.day[matched].astype("datetime64[D]")
+    past_day = (dates - dates.astype("datetime64[Y]").astype("datetime64[D]")).astype(np.int64)
+    history = np.bincount(
+        past_row[matched] * 366 + past_day, weights=columns.amount[matched], minlength=count * 366
+    ).reshape(count, 366).cumsum(axis=1)
+    reached, yearly = history[:, min(elapsed, 366) - 1], history[:, -1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        share = np.where(yearly > 0, reached / yearly, 0)
+        seasonal = np.where(share > 0, spent / share, np.nan)
+    projected = np.where(np.isnan(seasonal), linear, seasonal)
+
+    # The day the allocation ran out, or will at the linear rate if that is
+    # within the year
+    exhausted = (spent >= allocated) & (spent > 0)
+    first_over = (cumulative >= allocated[:, None]).argmax(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        days_left = np.where(rate > 0, np.ceil((allocated - spent) / rate), np.inf)
+
+    result = []
+    for i, category in enumerate(categories):
+        if exhausted[i]:
+            runs_out_on = first_day + timedelta(days=int(first_over[i]))
+        elif elapsed + days_left[i] <= days_in_year:
+            runs_out_on = as_of + timedelta(days=int(days_left[i]))
+        else:
+            runs_out_on = None
+        result.append({
+            "id": category.id,
+            "category_name": category.category_name,
+            "allocated_amount": rupees(allocated[i]),
+            "spent": rupees(spent[i]),
+            "daily_burn_rate": rupees(rate[i]),
+            "linear_projection": rupees(linear[i]),
+            "seasonal_projection": None if np.isnan(seasonal[i]) else rupees(seasonal[i]),
+            "projected": rupees(projected[i]),
+            "projected_remaining": rupees(allocated[i] - projected[i]),
+            "runs_out_on": runs_out_on,
+            "at_risk": bool(projected[i] > allocated[i]),
+        })
+    return {
+        "as_of": as_of,
+        "days_elapsed": elapsed,
+        "days_in_year": days_in_year,
+        "allocated": rupees(allocated.sum()),
+        "spent": rupees(spent.sum()),
+        "projected": rupees(projected.sum()),
+        "categories": result,
+    }
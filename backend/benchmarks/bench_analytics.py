@@ -0,0 +1,190 @@
+"""
+Distribution analytics over one village's expenses, three ways: NumPy over
+columns fetched in one query (app.stats), SQL aggregates and window
+functions, and pure Python over Decimals.
+
+Runs against DATABASE_URL and cleans up after itself; needs the analytics
+extra:
+
+    python -m benchmarks.bench_analytics [expenses]
+"""
+import random
+import sys
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+
+from sqlalchemy import Integer, cast, func, insert, literal, or_, select
+
+from app import crud, models, schemas, stats
+from app.database import SessionLocal, engine
+
+from .bench_writes import prepare_database
+
+CATEGORIES = ["Roads", "Schools", "Health", "Water", "Power", "Farming", "Housing", "Sanitation"]
+FIRST_DAY = date(2024, 1, 1)
+BINS = 20
+WINDOW = 7
+
+
+def seed(db, village_id: int, expenses: int) -> None:
+    """One budget with a few categories and `expenses` random expenses over a year"""
+    budget = crud.create_budget(db, schemas.BudgetCreate(year=1901, total_allocated=Decimal("1e9")), village_id)
+    category_ids = [
+        crud.create_category(db, schemas.CategoryCreate(
+            budget_id=budget.id, category_name=name, allocated_amount=Decimal("1e8")
+        )).id
+        for name in CATEGORIES
+    ]
+    rng = random.Random(42)
+    rows = [
+        {
+            "category_id": rng.choice(category_ids),
+            "description": "benchmark",
+            # Long-tailed like real spending: mostly small, a few large
+            "amount": Decimal(int(rng.lognormvariate(9, 1.2))) / 100,
+            "vendor_name": "Benchmark Vendor",
+            "expense_date": FIRST_DAY + timedelta(days=rng.randrange(366)),
+        }
+        for _ in range(expenses)
+    ]
+    for start in range(0, len(rows), 5000):
+        db.execute(insert(models.Expense), rows[start:start + 5000])
+    db.commit()
+
+
+def interpolate(sorted_values, point: float):
+    """Linearly interpolated percentile of a sorted list, as percentile_cont does"""
+    rank = (len(sorted_values) - 1) * point / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * Decimal(rank - lower)
+
+
+def moving_average(totals, window: int) -> list:
+    averages, running = [], Decimal(0)
+    for i, total in enumerate(totals):
+        running += total
+        if i >= window:
+            running -= totals[i - window]
+        averages.append(running / min(i + 1, window))
+    return averages
+
+
+def numpy_path(db, village_id: int) -> dict:
+    """app.stats: one column fetch, then vectorized statistics"""
+    columns = stats.load_expenses(db, village_id=village_id)
+    result = stats.distribution(columns, stats.load_category_names(db, columns.category_id), BINS, WINDOW)
+    return {"total": result["total"], "p50": result["percentiles"]["p50"], "p90": result["percentiles"]["p90"]}
+
+
+def _scope(query, village_id: int):
+    return query.join(
+        models.BudgetCategory, models.BudgetCategory.id == models.Expense.category_id
+    ).join(
+        models.Budget, models.Budget.id == models.BudgetCategory.budget_id
+    ).where(models.Budget.village_id == village_id)
+
+
+def sql_path(db, village_id: int) -> dict:
+    """Aggregates, histogram, daily totals and percentile ranks computed by the database"""
+    amount = models.Expense.amount
+    total, low, high = db.execute(_scope(
+        select(func.sum(amount), func.min(amount), func.max(amount)), village_id
+    )).one()
+    width = (high - low) / BINS or 1
+    bucket = func.min(cast((amount - low) / width, Integer), BINS - 1)
+    db.execute(_scope(select(bucket, func.count()), village_id).group_by(bucket)).all()
+    db.execute(_scope(
+        select(models.BudgetCategory.category_name, func.count(), func.sum(amount), func.avg(amount)), village_id
+    ).group_by(models.BudgetCategory.category_name)).all()
+    daily = dict(db.execute(_scope(
+        select(models.Expense.expense_date, func.sum(amount)), village_id
+    ).group_by(models.Expense.expense_date)).all())
+    first, last = min(daily), max(daily)
+    moving_average([daily.get(first + timedelta(days=d), Decimal(0)) for d in range((last - first).days + 1)], WINDOW)
+
+    # Only the rows at the ranks each percentile interpolates between, overall
+    # and per category (the per-category median and p90)
+    results = {}
+    for partition, points in ((None, (10, 25, 50, 75, 90, 99)), (models.BudgetCategory.category_name, (50, 90))):
+        over = {} if partition is None else {"partition_by": partition}
+        ranks = _scope(select(
+            (partition if partition is not None else literal("all")).label("key"),
+            amount.label("amount"),
+            (func.row_number().over(order_by=amount, **over) - 1).label("rank"),
+            func.count().over(**over).label("n")
+        ), village_id).subquery()
+        wanted = []
+        for point in points:
+            position = cast((ranks.c.n - 1) * point / 100.0, Integer)
+            wanted += [ranks.c.rank == position, ranks.c.rank == position + 1]
+        groups = defaultdict(dict)
+        for row in db.execute(select(ranks).where(or_(*wanted))).all():
+            groups[row.key][row.rank] = (row.amount, row.n)
+        for key, by_rank in groups.items():
+            n = next(iter(by_rank.values()))[1]
+            for point in points:
+                rank = (n - 1) * point / 100
+                lower = by_rank[int(rank)][0]
+                upper = by_rank.get(int(rank) + 1, (lower,))[0]
+                results[key, point] = lower + (upper - lower) * Decimal(rank - int(rank))
+    return {"total": total, "p50": results["all", 50], "p90": results["all", 90]}
+
+
+def python_path(db, village_id: int) -> dict:
+    """Every row as Decimals, statistics in plain Python"""
+    rows = db.execute(_scope(
+        select(models.Expense.amount, models.Expense.expense_date, models.BudgetCategory.category_name), village_id
+    )).all()
+    amounts = sorted(row.amount for row in rows)
+    total = sum(amounts, Decimal(0))
+    overall = {f"p{point}": interpolate(amounts, point) for point in (10, 25, 50, 75, 90, 99)}
+
+    width = (amounts[-1] - amounts[0]) / BINS or 1
+    histogram = [0] * BINS
+    for value in amounts:
+        histogram[min(int((value - amounts[0]) / width), BINS - 1)] += 1
+
+    by_category = defaultdict(list)
+    daily = defaultdict(Decimal)
+    for row in rows:
+        by_category[row.category_name].append(row.amount)
+        daily[row.expense_date] += row.amount
+    for values in by_category.values():
+        values.sort()
+        interpolate(values, 50), interpolate(values, 90), sum(values) / len(values)
+    first, last = min(daily), max(daily)
+    moving_average([daily.get(first + timedelta(days=d), Decimal(0)) for d in range((last - first).days + 1)], WINDOW)
+    return {"total": total, "p50": overall["p50"], "p90": overall["p90"]}
+
+
+def main(expenses: int = 50000) -> None:
+    engine.echo = False
+    prepare_database()
+    db = SessionLocal()
+    village = crud.create_village(db, schemas.VillageCreate(name="Benchmark Village"))
+    try:
+        seed(db, village.id, expenses)
+        results = {}
+        for name, path in (("NumPy columns", numpy_path), ("SQL aggregates", sql_path), ("pure Python", python_path)):
+            path(db, village.id)  # warm up
+            runs = 5
+            started = time.perf_counter()
+            for _ in range(runs):
+                results[name] = path(db, village.id)
+            elapsed = (time.perf_counter() - started) / runs
+            print(f"{name:<16} {elapsed * 1000:9.1f} ms per distribution of {expenses} expenses")
+
+        # All three must agree to the paisa
+        for name, result in results.items():
+            rounded = {key: Decimal(value).quantize(stats.CENT) for key, value in result.items()}
+            print(f"  {name:<16} total={rounded['total']} p50={rounded['p50']} p90={rounded['p90']}")
+    finally:
+        crud.delete_village(db, village.id)
+        db.close()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
@@ -0,0 +1,69 @@
+"""
+Auth overhead per request: decoding the token and loading the user row (the
+previous get_current_user) versus verifying the signed claims with the
+cached token-version check.
+
+Runs against DATABASE_URL and cleans up after itself:
+
+    python -m benchmarks.bench_auth [iterations]
+"""
+import sys
+import time
+from datetime import timedelta
+
+from fastapi.security import HTTPAuthorizationCredentials
+
+from app import crud, models, schemas
+from app.database import SessionLocal, engine
+from app.dependencies import get_current_user
+
+from .bench_writes import count_statements, prepare_database
+
+
+def user_lookup_path(db, token: str) -> None:
+    """The previous dependency: decode the token, then SELECT the user"""
+    payload = crud.verify_access_token(token)
+    user = crud.get_user_by_id(db, user_id=int(payload["sub"]))
+    assert user.is_active
+    # Each request used a fresh session, so nothing came from the identity map
+    db.expunge_all()
+
+
+def claims_path(db, token: str) -> None:
+    """The current dependency: verify the claims, check the cached version"""
+    get_current_user(HTTPAuthorizationCredentials(scheme="Bearer", credentials=token), db)
+
+
+def main(iterations: int = 5000) -> None:
+    engine.echo = False
+    prepare_database()
+    counter = count_statements()
+    db = SessionLocal()
+
+    user = crud.create_user(db, schemas.UserCreate(
+        name="Benchmark Admin", email="bench-auth@example.com", password="benchmark", role="admin"
+    ))
+    token = crud.create_access_token(crud.token_claims(user), expires_delta=timedelta(minutes=5))
+
+    try:
+        for name, path in (
+            ("decode + user SELECT", user_lookup_path),
+            ("signed claims + cache", claims_path),
+        ):
+            counter["statements"] = 0
+            started = time.perf_counter()
+            for _ in range(iterations):
+                path(db, token)
+            elapsed = time.perf_counter() - started
+            print(
+                f"{name:<22} {elapsed / iterations * 1e6:8.1f} us/request  "
+                f"{counter['statements'] / iterations:6.3f} statements/request"
+            )
+    finally:
+        db.query(models.User).filter(models.User.id == user.id).delete()
+        db.commit()
+        db.close()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
@@ -0,0 +1,102 @@
+"""
+Aggregating money stored as Numeric(12, 2) rupees against the same amounts
+stored as BigInteger paise: grouped SUMs and threshold comparisons in the
+database, then fetching every amount and summing it in Python.
+
+Runs against DATABASE_URL and cleans up after itself:
+
+    python -m benchmarks.bench_money [expenses]
+"""
+import random
+import sys
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from sqlalchemy import func, insert, select
+
+from app import crud, models, money, schemas
+from app.database import SessionLocal, engine
+
+from .bench_writes import prepare_database
+
+CATEGORIES = ["Roads", "Schools", "Health", "Water", "Power", "Farming", "Housing", "Sanitation"]
+FIRST_DAY = date(2024, 1, 1)
+THRESHOLD = Decimal("500.00")
+RUNS = 5
+
+
+def seed(db, village_id: int, expenses: int) -> list:
+    """One budget with a few categories and `expenses` random expenses; returns the category ids"""
+    budget = crud.create_budget(db, schemas.BudgetCreate(year=1901, total_allocated=Decimal("1e9")), village_id)
+    category_ids = [
+        crud.create_category(db, schemas.CategoryCreate(
+            budget_id=budget.id, category_name=name, allocated_amount=Decimal("1e8")
+        )).id
+        for name in CATEGORIES
+    ]
+    rng = random.Random(42)
+    rows = [
+        {
+            "category_id": rng.choice(category_ids),
+            "description": "benchmark",
+            "amount": Decimal(int(rng.lognormvariate(9, 1.2))) / 100,
+            "vendor_name": "Benchmark Vendor",
+            "expense_date": FIRST_DAY + timedelta(days=rng.randrange(366)),
+        }
+        for _ in range(expenses)
+    ]
+    for start in range(0, len(rows), 5000):
+        db.execute(insert(models.Expense), rows[start:start + 5000])
+    db.commit()
+    return category_ids
+
+
+def in_database(db, category_ids: list, amount, threshold) -> dict:
+    """Per-category totals and the number of expenses above a threshold"""
+    scope = models.Expense.category_id.in_(category_ids)
+    totals = dict(db.execute(
+        select(models.Expense.category_id, func.sum(amount)).where(scope).group_by(models.Expense.category_id)
+    ).all())
+    above = db.execute(select(func.count()).where(scope, amount > threshold)).scalar()
+    return {"total": sum(totals.values()), "above": above}
+
+
+def in_python(db, category_ids: list, amount, threshold) -> dict:
+    """Every amount fetched, then summed and compared in Python"""
+    values = db.execute(select(amount).where(models.Expense.category_id.in_(category_ids))).scalars().all()
+    zero = 0 if isinstance(threshold, int) else Decimal(0)
+    return {"total": sum(values, zero), "above": sum(1 for value in values if value > threshold)}
+
+
+def main(expenses: int = 50000) -> None:
+    engine.echo = False
+    prepare_database()
+    db = SessionLocal()
+    village = crud.create_village(db, schemas.VillageCreate(name="Benchmark Village"))
+    try:
+        category_ids = seed(db, village.id, expenses)
+        storages = (
+            ("numeric rupees", models.Expense.amount, THRESHOLD),
+            ("bigint paise", models.Expense.amount_paise, money.to_paise(THRESHOLD)),
+        )
+        for where, path in (("in database", in_database), ("in Python", in_python)):
+            for storage, amount, threshold in storages:
+                path(db, category_ids, amount, threshold)  # warm up
+                started = time.perf_counter()
+                for _ in range(RUNS):
+                    result = path(db, category_ids, amount, threshold)
+                elapsed = (time.perf_counter() - started) / RUNS
+                # Both storages must agree to the paisa
+                total = result["total"] if storage == "numeric rupees" else money.to_rupees(result["total"])
+                print(
+                    f"{where:<12} {storage:<15} {elapsed * 1000:8.1f} ms per pass over {expenses} expenses"
+                    f"  total={Decimal(total).quantize(money.CENT)} above={result['above']}"
+                )
+    finally:
+        crud.delete_village(db, village.id)
+        db.close()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
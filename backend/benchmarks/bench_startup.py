@@ -0,0 +1,61 @@
+"""
+Cold start benchmark: how long `import app.main` takes in a fresh
+interpreter (from `python -X importtime`), its most expensive imports, and
+whether the modules startup is meant to defer stayed unloaded. Exits with
+status 1 when the median import time is over the budget.
+
+    python -m benchmarks.bench_startup [budget_ms] [runs]
+"""
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+# Imported only when first needed: password hashing, JWT and DB drivers
+DEFERRED_MODULES = ("passlib", "jose", "psycopg2", "sqlalchemy.dialects.postgresql", "sqlite3", "numpy", "pyarrow")
+
+CHECK_DEFERRED = (
+    "import sys, app.main; "
+    f"print(','.join(m for m in {DEFERRED_MODULES!r} if m in sys.modules))"
+)
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def import_times() -> dict:
+    """Cumulative microseconds per module for one cold import of app.main"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        capture_output=True, text=True, check=True, env={**os.environ, "SQL_ECHO": "false"}
+    )
+    times = {}
+    for match in IMPORTTIME_LINE.finditer(result.stderr):
+        times[match.group(4)] = int(match.group(2))
+    return times
+
+
+def main(budget_ms: float = 1000, runs: int = 5) -> None:
+    samples = [import_times() for _ in range(runs)]
+    total_ms = statistics.median(sample["app.main"] for sample in samples) / 1000
+
+    last = samples[-1]
+    own = {name: us for name, us in last.items() if name.startswith("app.") and name != "app.main"}
+    print(f"import app.main: {total_ms:.0f} ms median of {runs} runs (budget {budget_ms:.0f} ms)")
+    print("slowest app modules (cumulative, includes first import of their dependencies):")
+    for name, us in sorted(own.items(), key=lambda item: -item[1])[:8]:
+        print(f"  {name:<28} {us / 1000:7.1f} ms")
+
+    loaded = subprocess.run(
+        [sys.executable, "-c", CHECK_DEFERRED], capture_output=True, text=True, check=True
+    ).stdout.strip()
+    print(f"deferred modules loaded at import: {loaded or 'none'}")
+
+    if total_ms > budget_ms or loaded:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(
+        float(sys.argv[1]) if len(sys.argv) > 1 else 1000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    )
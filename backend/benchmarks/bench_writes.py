@@ -0,0 +1,115 @@
+"""
+Write throughput benchmark: ORM add/commit/refresh versus the
+INSERT/UPDATE ... RETURNING path used by crud.
+
+Runs against DATABASE_URL, migrating it to head first, and cleans up after
+itself; with DATABASE_URL=sqlite:// it needs no database server:
+
+    python -m benchmarks.bench_writes [iterations]
+"""
+import sys
+import threading
+import time
+from datetime import date
+from decimal import Decimal
+
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+
+from app import crud, models, schemas
+from app.database import SessionLocal, engine, migrate
+
+
+def prepare_database() -> None:
+    """Bring the schema of DATABASE_URL to head, creating it on an empty database"""
+    migrate()
+
+
+def count_statements():
+    """
+    Attach a counter of the statements the calling thread runs. Audit entries
+    are written in batches by the flusher thread, off the write path, and
+    are not counted.
+    """
+    counter = {"statements": 0}
+    thread = threading.get_ident()
+
+    def before_cursor_execute(*args):
+        if threading.get_ident() == thread:
+            counter["statements"] += 1
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    return counter
+
+
+def refresh_path(db, category_id: int, iterations: int) -> None:
+    """The previous write path: add, commit, refresh, then load-modify-commit-refresh"""
+    for i in range(iterations):
+        expense = models.Expense(
+            category_id=category_id,
+            description=f"benchmark {i}",
+            amount=Decimal("10.00"),
+            vendor_name="Benchmark Vendor",
+            expense_date=date(2024, 1, 1)
+        )
+        db.add(expense)
+        db.commit()
+        db.refresh(expense)
+
+        existing = db.query(models.Expense).filter(models.Expense.id == expense.id).first()
+        existing.amount = Decimal("12.50")
+        db.commit()
+        db.refresh(existing)
+
+
+def returning_path(db, category_id: int, iterations: int) -> None:
+    """The crud write path: one INSERT ... RETURNING and one UPDATE ... RETURNING"""
+    for i in range(iterations):
+        expense = crud.create_expense(db, schemas.ExpenseCreate(
+            category_id=category_id,
+            description=f"benchmark {i}",
+            amount=Decimal("10.00"),
+            vendor_name="Benchmark Vendor",
+            expense_date=date(2024, 1, 1)
+        ))
+        crud.update_expense(db, expense.id, schemas.ExpenseUpdate(amount=Decimal("12.50")))
+
+
+def main(iterations: int = 500) -> None:
+    engine.echo = False
+    prepare_database()
+    counter = count_statements()
+    db = SessionLocal()
+    # The old path ran with the default expire_on_commit=True
+    legacy_db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+    village = crud.create_village(db, schemas.VillageCreate(name="Benchmark Village"))
+    budget = crud.create_budget(db, schemas.BudgetCreate(year=1900, total_allocated=Decimal("1000000")), village.id)
+    category = crud.create_category(db, schemas.CategoryCreate(
+        budget_id=budget.id, category_name="Benchmark", allocated_amount=Decimal("1000000")
+    ))
+    # Warm up the lineage lookups crud memoizes for cache invalidation
+    returning_path(db, category.id, 1)
+
+    try:
+        for name, path, session in (
+            ("add/commit/refresh", refresh_path, legacy_db),
+            ("INSERT/UPDATE RETURNING", returning_path, db),
+        ):
+            counter["statements"] = 0
+            started = time.perf_counter()
+            path(session, category.id, iterations)
+            elapsed = time.perf_counter() - started
+            writes = iterations * 2
+            print(
+                f"{name:<26} {writes / elapsed:10.1f} writes/s  "
+                f"{counter['statements'] / writes:4.1f} statements/write"
+            )
+    finally:
+        crud.delete_village(db, village.id)
+        legacy_db.close()
+        db.close()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
@@ -0,0 +1,136 @@
+"""
+Checks that the hot filter combinations of GET /expenses/ reach the expenses
+table through an index rather than a full scan, by EXPLAINing the statement
+crud.list_expenses builds for each. Prints every plan and exits with status 1
+if any of them scans expenses.
+
+Runs against DATABASE_URL (SQLite or PostgreSQL) and cleans up after itself.
+PostgreSQL only prefers indexes once tables have rows and statistics, so it
+seeds `expenses` rows first and ANALYZEs them:
+
+    python -m benchmarks.check_expense_plans [expenses]
+"""
+import random
+import re
+import sys
+from datetime import date, timedelta
+from decimal import Decimal
+
+from sqlalchemy import insert, text
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from app import crud, models, schemas
+from app.database import SessionLocal, engine
+
+from .bench_writes import prepare_database
+
+VILLAGES = 4
+YEARS = (2022, 2023, 2024)
+CATEGORIES = ["Roads", "Schools", "Health", "Water", "Power", "Farming"]
+VENDORS = 200
+
+# A full pass over expenses, in SQLite's and PostgreSQL's words
+FULL_SCANS = {
+    "sqlite": re.compile(r"\bSCAN expenses\b"),
+    "postgresql": re.compile(r"\bSeq Scan on expenses\b"),
+}
+
+
+class explain(Executable, ClauseElement):
+    """EXPLAIN of a statement, in the dialect's own syntax"""
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(explain)
+def _compile_explain(element, compiler, **kw):
+    prefix = "EXPLAIN QUERY PLAN" if compiler.dialect.name == "sqlite" else "EXPLAIN"
+    return f"{prefix} {compiler.process(element.statement, **kw)}"
+
+
+def seed(db, expenses: int) -> dict:
+    """Villages with budgets for a few years and `expenses` random expenses"""
+    rng = random.Random(7)
+    village_ids, category_ids = [], []
+    for number in range(VILLAGES):
+        village = crud.create_village(db, schemas.VillageCreate(name=f"Plan Check Village {number}"))
+        village_ids.append(village.id)
+        for year in YEARS:
+            budget = crud.create_budget(db, schemas.BudgetCreate(year=year, total_allocated=Decimal("1e9")), village.id)
+            for name in CATEGORIES:
+                category_ids.append(crud.create_category(db, schemas.CategoryCreate(
+                    budget_id=budget.id, category_name=name, allocated_amount=Decimal("1e8")
+                )).id)
+    rows = [
+        {
+            "category_id": rng.choice(category_ids),
+            "description": "plan check",
+            "amount": Decimal(int(rng.lognormvariate(9, 1.2))) / 100,
+            "vendor_name": f"Vendor {rng.randrange(VENDORS)}",
+            "expense_date": date(rng.choice(YEARS), 1, 1) + timedelta(days=rng.randrange(365)),
+        }
+        for _ in range(expenses)
+    ]
+    for start in range(0, len(rows), 5000):
+        db.execute(insert(models.Expense), rows[start:start + 5000])
+    db.commit()
+    if engine.dialect.name == "postgresql":
+        for table in ("villages", "budgets", "budget_categories", "expenses"):
+            db.execute(text(f"ANALYZE {table}"))
+        db.commit()
+    return {"village_id": village_ids[0], "category_id": category_ids[0]}
+
+
+def hot_queries(ids: dict) -> list:
+    """(name, filters, sort, after) of the listings the dashboard runs most"""
+    spring = {"date_from": date(2024, 3, 1), "date_to": date(2024, 3, 31)}
+    return [
+        ("village, date range, newest first", {"village_id": ids["village_id"], **spring}, "-expense_date", None),
+        ("village and budget year", {"village_id": ids["village_id"], "year": 2024}, "-expense_date", None),
+        ("category, date range", {"category_id": ids["category_id"], **spring}, "expense_date", None),
+        ("category by amount, next page", {"category_id": ids["category_id"]}, "-amount", (Decimal("500.00"), 10**9)),
+        ("vendor, newest first", {"vendor_name": "Vendor 7"}, "-expense_date", None),
+        ("date range", spring, "expense_date", None),
+        ("amount range within a date range", {**spring, "amount_min": Decimal("100"), "amount_max": Decimal("900")}, "amount", None),
+        ("next page by id", {}, "id", (1000, 1000)),
+    ]
+
+
+def main(expenses: int = 20000) -> int:
+    engine.echo = False
+    prepare_database()
+    full_scan = FULL_SCANS.get(engine.dialect.name)
+    if full_scan is None:
+        print(f"No plan check for {engine.dialect.name}")
+        return 1
+    db = SessionLocal()
+    failures = []
+    try:
+        ids = seed(db, expenses)
+        for name, filters, sort, after in hot_queries(ids):
+            query = crud.list_expenses(db, schemas.ExpenseQuery(**filters), sort=sort, after=after).limit(100)
+            # The last column holds the plan text in both dialects
+            plan = "\n".join(f"  {row[-1]}" for row in db.connection().execute(explain(query.statement)))
+            scans = bool(full_scan.search(plan))
+            if scans:
+                failures.append(name)
+            print(f"{'FULL SCAN' if scans else 'index':<9}  {name}\n{plan}")
+    finally:
+        for village_id in db.scalars(
+            text("SELECT id FROM villages WHERE name LIKE 'Plan Check Village %'")
+        ).all():
+            crud.delete_village(db, village_id)
+        db.close()
+
+    if failures:
+        print(f"{len(failures)} of the hot queries scan expenses: {', '.join(failures)}")
+        return 1
+    print("Every hot query reaches expenses through an index")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000))
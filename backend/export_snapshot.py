@@ -0,0 +1,33 @@
+"""
+Export villages, budgets, categories and expenses as a columnar snapshot for
+offline analysis (see app/snapshots.py). Needs the snapshots extra.
+
+    python export_snapshot.py                   # rows added since the last export
+    python export_snapshot.py --full --format parquet
+"""
+import argparse
+import sys
+
+from app import snapshots
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a columnar snapshot of the database")
+    parser.add_argument("--full", action="store_true", help="export every row again instead of only new ones")
+    parser.add_argument("--format", choices=list(snapshots.FORMATS), default="arrow")
+    parser.add_argument("--dir", default=snapshots.SNAPSHOT_DIR, help="snapshot directory (default: SNAPSHOT_DIR)")
+    args = parser.parse_args()
+
+    if not snapshots.available():
+        sys.exit("Snapshots need PyArrow; install the snapshots extra")
+    try:
+        path = snapshots.export(args.format, incremental=not args.full, directory=args.dir)
+    except ValueError as e:
+        sys.exit(str(e))
+    for name, table in snapshots.load_manifest(args.dir)["tables"].items():
+        print(f"{name:<18} {table['rows']:>10} rows in {len(table['parts'])} files, up to id {table['watermark']['id']}")
+    print(f"Manifest: {path}")
+
+
+if __name__ == "__main__":
+    main()
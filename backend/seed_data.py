@@ -3,12 +3,15 @@ import sys
 from datetime import date, datetime
 from decimal import Decimal
 
-from app.database import SessionLocal
+from app.database import SessionLocal, is_in_memory, migrate
 from app import models, crud, schemas
 
 
 def seed_data():
     """Add sample data to the database."""
+    if is_in_memory():
+        # Nothing else can have migrated a database that lives in this process
+        migrate()
     db = SessionLocal()
     
     try:
@@ -52,6 +55,7 @@ def seed_data():
                 name="Admin User",
                 email=admin_email,
                 password="admin123",
+                role="admin",
                 village_id=villages[0].id  # Assign to first village
             )
             admin = crud.create_user(db=db, user=admin_user)
@@ -1,5 +1,5 @@
 from app.database import SessionLocal
-from app import models
+from app import crud, models
 
 EMAIL = "admin@example.com"
 
@@ -12,8 +12,9 @@ def set_admin(email: str):
             return
         prev = getattr(user, 'role', None)
         user.role = 'admin'
-        db.add(user)
-        db.commit()
+        # Revoke tokens still carrying the old role claim, in the same
+        # transaction; running workers re-check the user's tokens once it commits
+        crud.revoke_user_tokens(db, user.id)
         print(f"Updated user {email}: role {prev} -> {user.role}")
     except Exception as e:
         print('Error:', e)
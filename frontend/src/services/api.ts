@@ -7,13 +7,23 @@ const api = axios.create({
     'Content-Type': 'application/json',
   },
 });
-// Request interceptor to add auth token
+
+// Read-your-writes: the backend marks responses to writes with this header,
+// and reads carrying it are served by the primary database rather than a
+// replica that may not have the write yet.
+const PRIMARY_PIN_HEADER = 'X-Read-Primary-Until';
+let readPrimaryUntil: string | null = null;
+
+// Request interceptor to add auth token and the read-your-writes pin
 api.interceptors.request.use(
   (config) => {
     const token = localStorage.getItem('auth_token');
     if (token) {
       config.headers.Authorization = `Bearer ${token}`;
     }
+    if (readPrimaryUntil && Number(readPrimaryUntil) * 1000 > Date.now()) {
+      config.headers[PRIMARY_PIN_HEADER] = readPrimaryUntil;
+    }
     return config;
   },
   (error) => {
@@ -23,7 +33,13 @@ api.interceptors.request.use(
 
 // Response interceptor for error handling
 api.interceptors.response.use(
-  (response) => response,
+  (response) => {
+    const pinnedUntil = response.headers[PRIMARY_PIN_HEADER.toLowerCase()];
+    if (pinnedUntil) {
+      readPrimaryUntil = pinnedUntil;
+    }
+    return response;
+  },
   (error) => {
     if (error.response?.status === 401) {
       localStorage.removeItem('auth_token');